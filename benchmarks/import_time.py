@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""Checks the start-up cost of the scripts.
+
+`--help` must answer within the time budget without loading any of the
+analysis libraries, and importing the analysis functions (as a fetch-only
+run does) must not load the plotting or Excel libraries.
+
+Run from the repository folder:
+
+    python benchmarks/import_time.py --budget 0.5
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPTS = ['string_api_MULTI.py', 'string_api_net_enrich.py']
+
+# not needed to parse the options
+HEAVY_MODULES = ['pandas', 'numpy', 'matplotlib', 'seaborn', 'requests', 'openpyxl', 'scipy']
+# only needed to draw the charts and write the Excel files
+PLOT_MODULES = ['matplotlib', 'seaborn', 'openpyxl']
+
+
+def imported_modules(command):
+    """
+    Runs a python command with -X importtime, and returns the wall time and
+    the names of the top level modules it imported
+    """
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, '-X', 'importtime'] + command, cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    elapsed = time.perf_counter() - start
+    modules = set()
+    for line in proc.stderr.splitlines():
+        if line.startswith('import time:') and '|' in line:
+            name = line.rsplit('|', 1)[1].strip()
+            modules.add(name.split('.')[0])
+    return elapsed, modules
+
+
+def main():
+    """
+    Main function of the script
+    """
+    parser = argparse.ArgumentParser(description='Check the start-up time of the scripts')
+    parser.add_argument('--budget',
+                        type=float,
+                        default=0.5,
+                        help='maximum seconds for a --help run (default: 0.5)')
+    args = parser.parse_args()
+
+    failed = False
+    for script in SCRIPTS:
+        elapsed, modules = imported_modules([script, '--help'])
+        heavy = sorted(modules.intersection(HEAVY_MODULES))
+        status = 'ok' if elapsed <= args.budget and not heavy else 'FAILED'
+        failed |= status != 'ok'
+        print(f'{script} --help: {elapsed:.3f} s, heavy imports: {heavy or "none"} [{status}]')
+
+    elapsed, modules = imported_modules(['-c', 'import stringdb_analyser.analysis'])
+    plots = sorted(modules.intersection(PLOT_MODULES))
+    status = 'ok' if not plots else 'FAILED'
+    failed |= status != 'ok'
+    print(f'stringdb_analyser.analysis: {elapsed:.3f} s, plotting imports: {plots or "none"} [{status}]')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+
+"""Local stand-in for the STRING API, to benchmark the scripts offline.
+
+It answers the endpoints used by the scripts (svg/network, json/enrichment,
+tsv/network and json/get_string_ids) under http://127.0.0.1:PORT/api, with
+a configurable latency, error rate and rate limit. The responses are read
+from a folder of recorded responses, one file per endpoint named after it
+(svg_network.svg, json_enrichment.json, tsv_network.tsv,
+json_get_string_ids.json), or made up from the genes of every request.
+
+Start it from the command line with:
+
+    python benchmarks/mock_string.py --port 8765 --latency 0.2 --error-rate 0.05 --rate 5
+
+and point the scripts to it with --api-url http://127.0.0.1:8765/api
+"""
+
+import argparse
+import glob
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import numpy as np
+
+CATEGORIES = ['Process', 'Function', 'Component', 'KEGG']
+WORDS = ['transport', 'regulation', 'biosynthetic', 'process', 'metabolic', 'response', 'stress',
+         'membrane', 'protein', 'binding', 'activity', 'complex', 'signaling', 'cell', 'division',
+         'ribosome', 'translation', 'transcription', 'dna', 'repair', 'oxidative', 'phosphorylation',
+         'amino', 'acid', 'catabolic', 'lipid', 'carbohydrate', 'iron', 'sulfur', 'cluster']
+
+
+def _seed(genes):
+    return int(hashlib.sha256('\r'.join(genes).encode('utf-8')).hexdigest()[:8], 16)
+
+
+def fake_enrichment(genes, species):
+    """
+    Enrichment-like records for a gene list, always the same for the same list
+    """
+    rng = random.Random(_seed(genes))
+    records = []
+    n_terms = min(30, 3 + len(genes) // 20)
+    for category in CATEGORIES:
+        for number in range(rng.randint(0, n_terms)):
+            hits = rng.sample(genes, min(len(genes), rng.randint(2, 20)))
+            p_value = 10 ** -rng.uniform(2, 12)
+            records.append({
+                'category': category,
+                'term': f'{category}:{number:05d}',
+                'number_of_genes': len(hits),
+                'number_of_genes_in_background': len(hits) + rng.randint(0, 200),
+                'ncbiTaxonId': int(species),
+                'inputGenes': hits,
+                'preferredNames': [gene.split('.', 1)[-1] for gene in hits],
+                'p_value': p_value,
+                'fdr': min(1.0, p_value * 10),
+                'description': ' '.join(rng.sample(WORDS, rng.randint(2, 5))),
+            })
+    return json.dumps(records).encode('utf-8')
+
+
+def fake_network(genes, species, density=0.02):
+    """
+    Interactions between the genes of a list in the tsv/network format. An
+    interaction only depends on its two genes, so splitting a list in
+    chunks gives the same network
+    """
+    genes = list(dict.fromkeys(genes))
+    codes = np.array([zlib.crc32(gene.encode('utf-8')) for gene in genes], dtype=np.uint64)
+    pair_hash = (codes[:, None] * np.uint64(2654435761) + codes[None, :] * np.uint64(2654435761)) % np.uint64(10007)
+    first, second = np.nonzero(np.triu(pair_hash < density * 10007, k=1))
+    lines = ['stringId_A\tstringId_B\tpreferredName_A\tpreferredName_B\tncbiTaxonId\tscore']
+    for node_a, node_b in zip(first, second):
+        score = 0.4 + int(pair_hash[node_a, node_b]) % 600 / 1000
+        lines.append(f'{genes[node_a]}\t{genes[node_b]}\t{genes[node_a].split(".", 1)[-1]}\t'
+                     f'{genes[node_b].split(".", 1)[-1]}\t{species}\t{score:.3f}')
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+def fake_string_ids(genes, species):
+    """
+    get_string_ids records mapping every name to {species}.{name}
+    """
+    return json.dumps([{'queryIndex': index, 'queryItem': gene, 'stringId': f'{species}.{gene}',
+                        'preferredName': gene} for index, gene in enumerate(genes)]).encode('utf-8')
+
+
+def fake_svg(genes, species):
+    """
+    A small svg image listing the genes
+    """
+    text = ''.join(f'<text x="10" y="{20 + 14 * index}">{gene}</text>' for index, gene in enumerate(genes))
+    return f'<svg xmlns="http://www.w3.org/2000/svg">{text}</svg>'.encode('utf-8')
+
+
+FAKE_RESPONSES = {
+    'svg/network': fake_svg,
+    'json/enrichment': fake_enrichment,
+    'tsv/network': fake_network,
+    'json/get_string_ids': fake_string_ids,
+}
+
+
+class MockString:
+    """
+    Threaded HTTP server imitating the STRING API. Every request waits
+    `latency` seconds, fails with HTTP 500 with probability `error_rate`
+    and gets HTTP 429 (with a Retry-After header) above `rate` requests
+    per second (0 for no limit). Request counts are kept in `stats`.
+    """
+
+    def __init__(self, port=0, latency=0.0, error_rate=0.0, rate=0.0, responses=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate = rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'throttled': 0}
+        self.recorded = {}
+        if responses is not None:
+            for path in glob.glob(os.path.join(responses, '*')):
+                name = os.path.splitext(os.path.basename(path))[0]
+                with open(path, 'rb') as fh_response:
+                    self.recorded[name.replace('_', '/', 1)] = fh_response.read()
+        self.window = []
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        Base url of the API, to give to the scripts with --api-url
+        """
+        return f'http://127.0.0.1:{self.server.server_port}/api'
+
+    def _throttled(self):
+        if not self.rate:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            self.window = [stamp for stamp in self.window if now - stamp < 1.0]
+            if len(self.window) >= self.rate:
+                return True
+            self.window.append(now)
+            return False
+
+    def respond(self, endpoint, params):
+        """
+        Returns (status, headers, content) for a request
+        """
+        with self.lock:
+            self.stats['requests'] += 1
+            failing = self.random.random() < self.error_rate
+        if self._throttled():
+            with self.lock:
+                self.stats['throttled'] += 1
+            return 429, {'Retry-After': '1'}, b'Too many requests'
+        time.sleep(self.latency)
+        if failing:
+            with self.lock:
+                self.stats['errors'] += 1
+            return 500, {}, b'Internal error'
+        if endpoint in self.recorded:
+            return 200, {}, self.recorded[endpoint]
+        if endpoint not in FAKE_RESPONSES:
+            return 404, {}, b'Unknown endpoint'
+        genes = [gene for gene in params.get('identifiers', [''])[0].replace('%0d', '\r').split('\r') if gene]
+        species = params.get('species', ['511145'])[0]
+        return 200, {}, FAKE_RESPONSES[endpoint](genes, species)
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length', 0))).decode('utf-8')
+                endpoint = self.path.split('/api/', 1)[-1].strip('/')
+                status, headers, content = mock.respond(endpoint, parse_qs(body))
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+    def start(self):
+        """
+        Serves the requests from a background thread
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops the server
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    """
+    Runs the mock server until interrupted
+    """
+    parser = argparse.ArgumentParser(description='Local stand-in for the STRING API')
+    parser.add_argument('--port', type=int, default=8765, help='port of the server (default: 8765)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds per request (default: 0)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests failing with HTTP 500 (default: 0)')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='requests per second above which HTTP 429 is returned, 0 for no limit (default: 0)')
+    parser.add_argument('--responses', type=str, default=None,
+                        help='folder with recorded responses, one file per endpoint (e.g. json_enrichment.json)')
+    args = parser.parse_args()
+
+    mock = MockString(args.port, latency=args.latency, error_rate=args.error_rate,
+                      rate=args.rate, responses=args.responses)
+    print(f'Mock STRING API listening on {mock.url}')
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        print(f'\n{mock.stats}')
+
+
+if __name__ == '__main__':
+    main()
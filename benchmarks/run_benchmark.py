@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+"""Benchmark of both scripts against the local mock STRING server.
+
+Generates a synthetic workbook with N samples of M genes per direction
+(and a gene list of M genes), starts the mock server (see mock_string.py)
+and runs string_api_MULTI.py, with sequential and parallel settings, and
+string_api_net_enrich.py on them. For every run it reports the wall time,
+the throughput, the time spent in every stage (the totals of the --profile
+trace of the script, summed over the threads, so the overlapping stages of
+the MULTI pipeline can add up to more than the wall time) and the peak
+memory of the script process.
+
+Run from the repository folder:
+
+    python benchmarks/run_benchmark.py --samples 20 --genes 300 --latency 0.2 --error-rate 0.02
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from mock_string import MockString
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stringdb_analyser.profiling import STAGES  # noqa: E402
+
+
+def make_inputs(folder, n_samples, n_genes, seed=0):
+    """
+    Writes a workbook with n_samples samples (UP and DOWN sheets) of
+    n_genes genes, and a gene list of n_genes genes
+    """
+    pool = [f'gene{number:05d}' for number in range(max(5000, 4 * n_genes))]
+    random.Random(seed).shuffle(pool)
+    workbook = os.path.join(folder, f'bench_{n_samples}x{n_genes}.xlsx')
+    with pd.ExcelWriter(workbook) as writer:
+        for sample in range(n_samples):
+            for direction in ('UP', 'DOWN'):
+                start = (sample * 2 + (direction == 'DOWN')) * 37 % (len(pool) - n_genes)
+                genes = pd.DataFrame({'genes': pool[start:start + n_genes]})
+                genes.to_excel(writer, sheet_name=f'sample{sample}_{direction}', index=False)
+    gene_list = os.path.join(folder, f'bench_{n_genes}.txt')
+    with open(gene_list, 'w') as fh_list:
+        fh_list.write('\n'.join(pool[:n_genes]) + '\n')
+    return workbook, gene_list
+
+
+def run_script(command, log_path):
+    """
+    Runs a script with a --profile trace next to its log. Returns the wall
+    time, the seconds per stage (from the totals of the trace) and the
+    peak memory (MB) of the process
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED='1', MPLBACKEND='Agg')
+    trace_path = os.path.splitext(log_path)[0] + '_trace.json'
+    start = time.perf_counter()
+    with open(log_path, 'w') as fh_log:
+        proc = subprocess.Popen([sys.executable] + command + ['--profile', trace_path], cwd=ROOT, env=env,
+                                stdout=fh_log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        proc.returncode = os.waitstatus_to_exitcode(status)
+    end = time.perf_counter()
+    if proc.returncode:
+        raise RuntimeError(f'{" ".join(command)} failed, see {log_path}')
+    with open(trace_path) as fh_trace:
+        totals = json.load(fh_trace)['otherData']['stages']
+    stage_times = {stage: totals.get(stage, {}).get('seconds', 0.0) for stage in STAGES}
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    peak = usage.ru_maxrss / (2**20 if sys.platform == 'darwin' else 2**10)
+    return end - start, stage_times, peak
+
+
+def main():
+    """
+    Main function of the script
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the scripts against a mock STRING server')
+    parser.add_argument('--samples', type=int, default=10, help='samples of the workbook (default: 10)')
+    parser.add_argument('--genes', type=int, default=200, help='genes per sample and direction (default: 200)')
+    parser.add_argument('--latency', type=float, default=0.1,
+                        help='seconds per request of the mock server (default: 0.1)')
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help='fraction of requests failing with HTTP 500 (default: 0)')
+    parser.add_argument('--rate', type=float, default=0.0,
+                        help='requests per second accepted by the mock server, 0 for no limit (default: 0)')
+    parser.add_argument('--workers', type=int, default=8,
+                        help='parallel requests of the parallel run (default: 8)')
+    parser.add_argument('--responses', type=str, default=None,
+                        help='folder with recorded responses for the mock server')
+    parser.add_argument('--output', type=str, default=None,
+                        help='save the results as json in this file')
+    parser.add_argument('--keep', action='store_true', help='keep the inputs and outputs of the runs')
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp(prefix='stringdb_bench_')
+    workbook, gene_list = make_inputs(folder, args.samples, args.genes)
+    mock = MockString(latency=args.latency, error_rate=args.error_rate, rate=args.rate,
+                      responses=args.responses).start()
+    common = ['ecoli', '--api-url', mock.url, '--no-cache']
+    runs = {
+        'MULTI sequential': (['string_api_MULTI.py', workbook, os.path.join(folder, 'seq')] + common
+                             + ['--rate', '0', '--workers', '1', '--plot-workers', '1'], args.samples, 2 * args.samples),
+        'MULTI parallel': (['string_api_MULTI.py', workbook, os.path.join(folder, 'par')] + common
+                           + ['--rate', '0', '--workers', str(args.workers)], args.samples, 2 * args.samples),
+        'net_enrich': (['string_api_net_enrich.py', gene_list, os.path.join(folder, 'single')] + common, 1, 1),
+    }
+
+    print(f'{args.samples} samples x {args.genes} genes, latency {args.latency} s, '
+          f'error rate {args.error_rate}, rate limit {args.rate or "none"}\n')
+    results = {}
+    for name, (command, n_samples, n_lists) in runs.items():
+        log_path = os.path.join(folder, name.replace(' ', '_') + '.log')
+        requests_before = mock.stats['requests']
+        wall, stage_times, peak = run_script(command, log_path)
+        results[name] = {
+            'seconds': round(wall, 3),
+            'samples_per_second': round(n_samples / wall, 3),
+            'genes_per_second': round(n_lists * args.genes / wall, 1),
+            'peak_rss_mb': round(peak, 1),
+            'requests': mock.stats['requests'] - requests_before,
+            'stages': {stage: round(seconds, 3) for stage, seconds in stage_times.items()},
+        }
+    mock.stop()
+
+    header = f'{"run":<18}{"seconds":>9}{"samples/s":>11}{"peak MB":>9}{"requests":>10}  ' + \
+             ''.join(f'{stage:>9}' for stage in STAGES)
+    print(header)
+    for name, result in results.items():
+        print(f'{name:<18}{result["seconds"]:>9.2f}{result["samples_per_second"]:>11.2f}'
+              f'{result["peak_rss_mb"]:>9.0f}{result["requests"]:>10}  '
+              + ''.join(f'{result["stages"][stage]:>9.2f}' for stage in STAGES))
+    print(f'\nMock server: {mock.stats}')
+    print('Peak memory is the one of the script process (not of its plotting processes)')
+
+    if args.output:
+        with open(args.output, 'w') as fh_json:
+            json.dump({'settings': vars(args), 'results': results}, fh_json, indent=1)
+    if args.keep:
+        print(f'Inputs, outputs and logs kept in {folder}')
+    else:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
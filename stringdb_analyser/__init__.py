@@ -0,0 +1 @@
+"""Shared helpers for the STRING DB analyser scripts."""
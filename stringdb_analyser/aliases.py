@@ -0,0 +1,185 @@
+"""Local index of the gene names and synonyms of STRING proteins.
+
+The protein.aliases file of a species (e.g.
+511145.protein.aliases.v11.5.txt.gz: every name, synonym and database
+identifier of every protein) and its protein.info file (preferred names)
+are loaded into a SQLite database:
+
+    proteins   species, STRING identifier and preferred name of every protein
+    aliases    species, name, case-folded name, STRING identifier and rank
+               (0 preferred name, 1 STRING identifier or locus, 2 alias)
+
+with an index on (species, case-folded name). One database can hold many
+species (adding a species again replaces it), so the same file serves all
+the runs. Names are resolved in bulk, without any request to STRING: a
+name matches with its exact case first, then case-folded, and preferred
+names win over synonyms.
+
+Build or extend an index from the command line with:
+
+    python -m stringdb_analyser.aliases 511145.protein.aliases.v11.5.txt.gz string_aliases.sqlite --info 511145.protein.info.v11.5.txt.gz
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+
+import pandas as pd
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS proteins (species INTEGER, string_id TEXT PRIMARY KEY, preferred_name TEXT);
+CREATE TABLE IF NOT EXISTS aliases (species INTEGER, alias TEXT, folded TEXT, string_id TEXT, rank INTEGER);
+CREATE INDEX IF NOT EXISTS aliases_lookup ON aliases (species, folded);
+'''
+
+# candidates kept per name, as in the get_string_ids calls of IdentifierMap
+MAX_CANDIDATES = 2
+
+
+def _read_table(path, names, chunk_size):
+    # STRING flat files: a header line starting with #, tab separated
+    return pd.read_csv(path, sep='\t', header=0, names=names, usecols=range(len(names)),
+                       dtype=str, chunksize=chunk_size, keep_default_na=False)
+
+
+def _fold(values):
+    return pd.Series(values, dtype=object).str.strip().str.casefold()
+
+
+def build_alias_index(aliases_path, db_path, info_path=None, chunk_size=1_000_000):
+    """
+    Adds the proteins of a species (from its protein.aliases file and,
+    optionally, its protein.info file) to the SQLite alias index db_path,
+    replacing the ones of a previous build. Returns the species
+    """
+    connection = sqlite3.connect(db_path)
+    connection.executescript(SCHEMA)
+    species = None
+    n_aliases = 0
+    with connection:
+        # the index is rebuilt after the bulk insert, which is much faster
+        connection.execute('DROP INDEX IF EXISTS aliases_lookup')
+        preferred = {}
+        if info_path is not None:
+            for info in _read_table(info_path, ['string_id', 'preferred_name'], chunk_size):
+                preferred.update(zip(info['string_id'], info['preferred_name']))
+        for chunk in _read_table(aliases_path, ['string_id', 'alias', 'source'], chunk_size):
+            if species is None and len(chunk):
+                species = int(chunk['string_id'].iloc[0].split('.', 1)[0])
+                connection.execute('DELETE FROM aliases WHERE species = ?', (species,))
+                connection.execute('DELETE FROM proteins WHERE species = ?', (species,))
+            chunk = chunk[chunk['alias'].str.strip() != '']
+            connection.executemany('INSERT INTO aliases VALUES (?, ?, ?, ?, 2)',
+                                   zip([species] * len(chunk), chunk['alias'].str.strip(),
+                                       _fold(chunk['alias']), chunk['string_id']))
+            n_aliases += len(chunk)
+            for string_id in pd.unique(chunk['string_id']):
+                preferred.setdefault(string_id, None)
+        if species is None and preferred:
+            species = int(next(iter(preferred)).split('.', 1)[0])
+            connection.execute('DELETE FROM aliases WHERE species = ?', (species,))
+            connection.execute('DELETE FROM proteins WHERE species = ?', (species,))
+        if species is None:
+            raise ValueError(f'No proteins found in {aliases_path}')
+
+        # every protein is also found by its preferred name, identifier and locus
+        proteins = pd.DataFrame({'string_id': list(preferred), 'preferred_name': list(preferred.values())})
+        proteins['preferred_name'] = proteins['preferred_name'].fillna(
+            proteins['string_id'].str.split('.', n=1).str[-1])
+        connection.executemany('INSERT OR REPLACE INTO proteins VALUES (?, ?, ?)',
+                               zip([species] * len(proteins), proteins['string_id'], proteins['preferred_name']))
+        locus = proteins['string_id'].str.split('.', n=1).str[-1]
+        for rank, names in ((0, proteins['preferred_name']), (1, proteins['string_id']), (1, locus)):
+            connection.executemany('INSERT INTO aliases VALUES (?, ?, ?, ?, ?)',
+                                   zip([species] * len(proteins), names, _fold(names),
+                                       proteins['string_id'], [rank] * len(proteins)))
+        connection.execute('CREATE INDEX aliases_lookup ON aliases (species, folded)')
+    connection.execute('VACUUM')
+    connection.close()
+    print(f'Alias index of species {species} with {len(proteins)} proteins and '
+          f'{n_aliases} aliases saved in {db_path}')
+    return species
+
+
+class AliasIndex:
+    """
+    Read access to an alias index built with build_alias_index (one
+    connection shared by all the threads, behind a lock)
+    """
+
+    def __init__(self, db_path):
+        if not os.path.exists(db_path):
+            raise FileNotFoundError(f'No alias index found in {db_path}')
+        self.db_path = db_path
+        self.connection = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, check_same_thread=False)
+        self.lock = threading.Lock()
+
+    def species(self):
+        """
+        Returns the species in the index
+        """
+        with self.lock:
+            return [row[0] for row in self.connection.execute('SELECT DISTINCT species FROM proteins')]
+
+    def lookup(self, names, species):
+        """
+        Resolves a list of names of a species at once. Returns {name:
+        candidates} with up to MAX_CANDIDATES {'string_id', 'preferred_name'}
+        per name, best first, or None for the unknown names (the same
+        entries as IdentifierMap)
+        """
+        names = list(dict.fromkeys(str(name).strip() for name in names if str(name).strip()))
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute('CREATE TEMP TABLE IF NOT EXISTS query (name TEXT, folded TEXT)')
+            cursor.execute('DELETE FROM query')
+            cursor.executemany('INSERT INTO query VALUES (?, ?)', zip(names, _fold(names)))
+            # exact case first, then preferred names, identifiers and synonyms
+            rows = cursor.execute(
+                'SELECT query.name, aliases.string_id, proteins.preferred_name '
+                'FROM query CROSS JOIN aliases ON aliases.species = ? AND aliases.folded = query.folded '
+                'JOIN proteins ON proteins.string_id = aliases.string_id '
+                'ORDER BY query.rowid, aliases.alias = query.name DESC, aliases.rank, aliases.string_id',
+                (species,)).fetchall()
+            cursor.execute('DELETE FROM query')
+        found = {name: None for name in names}
+        for name, string_id, preferred_name in rows:
+            candidates = found[name] or []
+            if len(candidates) < MAX_CANDIDATES and all(hit['string_id'] != string_id for hit in candidates):
+                found[name] = candidates + [{'string_id': string_id, 'preferred_name': preferred_name}]
+        return found
+
+
+_LOADED = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def load_alias_index(db_path):
+    """
+    Returns the AliasIndex of a database, opening it only once
+    """
+    key = os.path.abspath(db_path)
+    with _LOADED_LOCK:
+        if key not in _LOADED:
+            _LOADED[key] = AliasIndex(db_path)
+        return _LOADED[key]
+
+
+def main():
+    """
+    Command line entry point to build an alias index
+    """
+    parser = argparse.ArgumentParser(
+        prog='stringdb_analyser.aliases',
+        description='Add the gene names of a species to a local alias index (SQLite)')
+    parser.add_argument('aliases', type=str, help='protein.aliases file of a species (gzipped or not)')
+    parser.add_argument('db_path', type=str, help='SQLite file of the index, created if missing')
+    parser.add_argument('--info', type=str, default=None,
+                        help='protein.info file of the species, to use the preferred names')
+    args = parser.parse_args()
+    build_alias_index(args.aliases, args.db_path, info_path=args.info)
+
+
+if __name__ == '__main__':
+    main()
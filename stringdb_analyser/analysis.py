@@ -0,0 +1,837 @@
+"""Complete analyses of a gene list or of a multi-sample input.
+
+These functions hold the work of string_api_net_enrich.py and
+string_api_MULTI.py with explicit parameters, so they can also be called
+from other programs (e.g. worker processes) without the command line.
+Plotting libraries are only imported when charts are drawn.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+from stringdb_analyser.api import (STRING_API_URL, STRING_LATEST_API_URL,
+                                   get_enrichment_data, get_net_image)
+from stringdb_analyser.client import StringAPIError, StringClient, fetch_concurrently
+from stringdb_analyser.enrichment import CompactEnrichment, Vocabulary
+from stringdb_analyser.ids import IdentifierMap
+from stringdb_analyser.loaders import iter_samples, read_gene_list
+from stringdb_analyser.manifest import RunManifest, input_digest
+from stringdb_analyser.network import fetch_network_edges, load_network_index
+from stringdb_analyser.output import write_enrichment
+from stringdb_analyser.pipeline import Pipeline
+from stringdb_analyser.profiling import Profiler
+from stringdb_analyser.render import render_network
+from stringdb_analyser.svgcharts import chart_svg, save_svg_charts
+from stringdb_analyser.words import get_multi_table, select_words, word_table
+
+# columns of the enrichment needed by the word (and concept) tables and the heatmaps
+SUMMARY_COLUMNS = ['category', 'term', 'description', 'fdr']
+
+
+def make_folder(path, name=None):
+    """
+    Creates an output folder, telling whether it already existed
+    """
+    name = name or path
+    try:
+        os.mkdir(path)
+    except OSError:
+        print(f"Creation of the directory {name} failed, probably it already exists?")
+    else:
+        print(f"Successfully created the directory {name}")
+
+
+def draw_locally(genes, renderer='string', chunk_size=None):
+    """
+    True if the network image of a gene list is drawn locally: always with
+    the local renderer, and for lists too long for a single STRING request
+    """
+    return renderer == 'local' or bool(chunk_size) and len(genes) > chunk_size
+
+
+def network_image(path):
+    """
+    Path of the saved image of a network (without extension): the svg
+    from STRING (named .svg.svg by the workbook analysis) or drawn
+    locally, or else its png. None if there is none
+    """
+    for extension in ('.svg', '.svg.svg', '.png'):
+        if os.path.exists(path + extension):
+            return path + extension
+    return None
+
+
+def count_terms(enrich, concepts=None, nwords=10):
+    """
+    Table of the most frequent words of the enriched terms (see word_table),
+    or of their GO concepts if `concepts` is the folder of an ontology index
+    (see stringdb_analyser.ontology)
+    """
+    if concepts is None:
+        return word_table(enrich, nwords=nwords)
+    from stringdb_analyser.ontology import concept_table, load_ontology_index
+
+    return concept_table(enrich, load_ontology_index(concepts), nconcepts=nwords)
+
+
+def resolve_identifiers(genes, species, client, string_api_url=STRING_API_URL,
+                        workers=1, refresh=False, aliases=None):
+    """
+    Resolves all the names of a gene list to STRING identifiers at once and
+    reports the names that cannot be used. With `aliases` (SQLite file of
+    an alias index) the names are resolved locally, without STRING.
+    Returns the IdentifierMap, or None if they could not be resolved.
+    """
+    if aliases is not None:
+        from stringdb_analyser.aliases import load_alias_index
+
+        alias_index = load_alias_index(aliases)
+        if species not in alias_index.species():
+            print(f'The alias index {aliases} has no species {species}, the names will be used as they are\n')
+            return None
+        id_map = IdentifierMap(species)
+        id_map.resolve_locally(genes, alias_index)
+        id_map.report(genes)
+        return id_map
+    # the saved names expire and are refreshed like the cached responses
+    cache = client.cache
+    id_map = IdentifierMap(species, directory=cache.directory if cache else None,
+                           string_api_url=string_api_url, ttl=cache.ttl if cache else None)
+    try:
+        id_map.resolve(genes, client, workers=workers, refresh=refresh or bool(cache and cache.refresh))
+    except StringAPIError as err:
+        print(f'Could not resolve the identifiers ({err}), the names will be sent as they are\n')
+        return None
+    id_map.report(genes)
+    return id_map
+
+
+def analyse_gene_list(input_file, output, species, client=None, string_api_url=STRING_LATEST_API_URL,
+                      resolve=True, refresh=False, offline_dir=None, network_index=None,
+                      min_score=400, renderer='string', png=False, fetch_only=False,
+                      formats=('excel',), compression=None, excel_engine=None, chunk_size=None,
+                      concepts=None, topology=False, chart_format='pdf', report=False, aliases=None,
+                      ppi=False, permutations=1000, profiler=None):
+    """
+    Analyses a single gene list (txt file): network image, enrichment,
+    category summary, radar charts and enrichment tables (in the chosen
+    formats), saved in the `output` folder with `output` as prefix. With
+    fetch_only, only the network and the enrichment are retrieved (no
+    charts nor tables). The network of a list longer than `chunk_size`
+    genes is fetched in chunks and drawn locally. With `concepts` (folder
+    of an ontology index) the radar charts show GO concepts instead of
+    words. With topology, the degree, clustering and components of the
+    network are saved in {output}_network_topology.tsv. The radar charts
+    are saved as pdf or svg files, or only in the report with
+    chart_format='html'; with report, the network, charts and most
+    enriched terms are also gathered in output/report.html. With
+    `aliases` (SQLite file, see aliases) the names are resolved to STRING
+    identifiers locally, also offline. With ppi (and a network_index), the
+    interactions within the list are tested against `permutations` random
+    lists of the same degrees (see ppi), saved in
+    {output}_ppi_enrichment.tsv. The stages are timed by the profiler, if
+    given.
+    """
+    client = client or StringClient()
+    profiler = profiler or Profiler(enabled=False)
+    make_folder(output)
+    name = os.path.basename(os.path.normpath(output))
+
+    with profiler.stage('read'):
+        genes = read_gene_list(input_file)
+    print(f'Processing file {input_file} with ' + str(len(genes)) + ' elements')
+    # resolve the names to STRING identifiers, reporting the ones that cannot be used
+    labels = None
+    if resolve and (offline_dir is None or aliases is not None):
+        with profiler.stage('resolve'):
+            id_map = resolve_identifiers(genes, species, client, string_api_url=string_api_url,
+                                         refresh=refresh, aliases=aliases)
+        if id_map is not None:
+            labels = id_map.preferred_names()
+            genes = id_map.translate(genes)
+        if not genes:
+            print(f'None of the names of {input_file} could be mapped to STRING identifiers, '
+                  'there is nothing to analyse')
+            return output
+    local = draw_locally(genes, renderer, chunk_size)
+    if offline_dir is None and not local:
+        with profiler.stage('fetch', request='network'):
+            get_net_image(genes, out_net=name, species=species, out_folder=output,
+                          client=client, string_api_url=string_api_url)
+    # interaction table from the local network index, without any request
+    edges = None
+    if network_index is not None:
+        with profiler.stage('edges'):
+            edges = load_network_index(network_index).subnetwork(genes, min_score=min_score)
+        print(f'Saving {len(edges)} interactions to {name}_network_edges.tsv')
+        edges.to_csv(os.path.join(output, f'{name}_network_edges.tsv'), sep='\t', index=False)
+    # draw the network locally
+    if local:
+        if edges is None and offline_dir is None:
+            with profiler.stage('fetch', request='edges'):
+                edges = fetch_network_edges(genes, species, client, min_score=min_score,
+                                            string_api_url=string_api_url, chunk_size=chunk_size)
+            print(f'Saving {len(edges)} interactions to {name}_network_edges.tsv')
+            edges.to_csv(os.path.join(output, f'{name}_network_edges.tsv'), sep='\t', index=False)
+        if edges is not None:
+            print(f'Drawing the interaction network to {name}.svg file')
+            with profiler.stage('networks'):
+                render_network(genes, edges, os.path.join(output, name), labels=labels,
+                               formats=('svg', 'png') if png else ('svg',))
+    summary = None
+    if topology and not fetch_only:
+        if edges is None and offline_dir is None:
+            with profiler.stage('fetch', request='edges'):
+                edges = fetch_network_edges(genes, species, client, min_score=min_score,
+                                            string_api_url=string_api_url, chunk_size=chunk_size)
+        if edges is None:
+            print('The network topology needs the interactions, give a --network-index to compute it offline')
+        else:
+            from stringdb_analyser.topology import network_topology
+
+            with profiler.stage('topology'):
+                nodes, summary = network_topology({name: genes}, {name: edges}, labels=labels)
+            print(f'Saving the network topology to {name}_network_topology.tsv')
+            nodes.drop(columns='gene_set').to_csv(os.path.join(output, f'{name}_network_topology.tsv'),
+                                                  sep='\t', index=False)
+            print(summary.drop(columns='gene_set').to_string(index=False))
+    ppi_table = None
+    if ppi and not fetch_only:
+        if network_index is None:
+            print('The PPI enrichment needs the whole network, give a --network-index to compute it')
+        else:
+            from stringdb_analyser.ppi import load_ppi_background, ppi_enrichment
+
+            with profiler.stage('ppi'):
+                net_index = load_network_index(network_index)
+                ppi_table = ppi_enrichment({name: genes}, load_ppi_background(net_index, min_score),
+                                           net_index, permutations=permutations)
+            print(f'Saving the PPI enrichment to {name}_ppi_enrichment.tsv')
+            ppi_table.drop(columns='gene_set').to_csv(os.path.join(output, f'{name}_ppi_enrichment.tsv'),
+                                                      sep='\t', index=False)
+            print(ppi_table.drop(columns='gene_set').to_string(index=False))
+    with profiler.stage('fetch', request='enrichment'):
+        enrich = get_enrichment_data(genes, species=species, client=client, offline_dir=offline_dir,
+                                     string_api_url=string_api_url)
+    if fetch_only:
+        print(f'All analyses have been finished for the file {input_file}')
+        return output
+
+    report = report or chart_format == 'html'
+    charts = []
+    # check that the enrich is not emtpy
+    if not enrich.empty:
+        if len(enrich.category.unique()) > 0:
+            # print summary of categories
+            if chart_format != 'html':
+                from stringdb_analyser.plots import category_summary
+
+                with profiler.stage('charts', chart='categories'):
+                    category_summary(enrich, os.path.join(output, f'{name}_categories_enrich.pdf'))
+
+            print(f'Printing radar plots for {enrich.category.unique()}')
+            # count the words of all the categories at once
+            with profiler.stage('words'):
+                words = count_terms(enrich, concepts=concepts, nwords=10)
+            charts = [dict(kind='single', table=select_words(words, cat), category=cat,
+                           path=os.path.join(output, f'{cat}_radar_chart.pdf'))
+                      for cat in enrich.category.unique()]
+            with profiler.stage('charts', chart='radar'):
+                if chart_format == 'svg':
+                    save_svg_charts(charts)
+                elif chart_format == 'pdf':
+                    from stringdb_analyser.plots import render_chart_batch
+
+                    render_chart_batch(charts)
+        else:
+            print('There are not categories to plot')
+
+        with profiler.stage('tables'):
+            write_enrichment(enrich, output, name, formats=formats, sample=name,
+                             compression=compression, excel_engine=excel_engine)
+
+    elif enrich.empty:
+        print('There were no enriched categories!')
+
+    if report:
+        from stringdb_analyser.report import RunReport, top_enriched_terms
+
+        run_report = RunReport(f'STRING analysis of {os.path.basename(input_file)}')
+        with profiler.stage('charts', chart='report'):
+            categories = (enrich['category'].value_counts().rename_axis('category').reset_index(name='terms')
+                          if not enrich.empty else None)
+            run_report.add_sample(name, charts=[chart_svg(chart) for chart in charts],
+                                  images=[network_image(os.path.join(output, name))],
+                                  tables=[('Enriched terms per category', categories),
+                                          ('Most enriched terms', top_enriched_terms(enrich)),
+                                          ('Network topology', summary.drop(columns='gene_set')
+                                           if summary is not None else None),
+                                          ('PPI enrichment', ppi_table.drop(columns='gene_set')
+                                           if ppi_table is not None else None)])
+            run_report.save(os.path.join(output, 'report.html'))
+
+    print(f'All analyses have been finished for the file {input_file}')
+    return output
+
+
+class WorkbookRun:
+    """
+    Options and state of an analyse_workbook run shared by the stages of
+    its pipeline: the gene lists of the samples, the stages left to do
+    (see RunManifest), the requests of every sample and the interactions
+    already read from a network index
+    """
+
+    def __init__(self, output, gene_sets, manifest, digests, todo, profiler, labels=None,
+                 fetch_only=False, renderer='string', chunk_size=None, png=False, concepts=None,
+                 chart_format='pdf', single_pdf=False, formats=('excel',), compression=None,
+                 excel_engine=None, heatmap=False, topology=False, ppi=False, report=False,
+                 permutations=1000):
+        self.output = output
+        self.gene_sets = gene_sets
+        self.manifest = manifest
+        self.digests = digests
+        self.todo = todo
+        self.profiler = profiler
+        self.labels = labels
+        self.fetch_only = fetch_only
+        self.renderer = renderer
+        self.chunk_size = chunk_size
+        self.png = png
+        self.concepts = concepts
+        self.chart_format = chart_format
+        self.single_pdf = single_pdf
+        self.formats = formats
+        self.compression = compression
+        self.excel_engine = excel_engine
+        self.heatmap = heatmap and not fetch_only
+        self.topology = topology
+        self.ppi = ppi
+        self.report = report
+        self.permutations = permutations
+        self.tasks = {sample: {} for sample in gene_sets}
+        self.edge_tables = {}
+        self.net_index = None
+        self.background = None
+        self.run_report = None
+        self.plot_pool = None
+        # the enrichments wait between the stages in compact form, sharing their genes
+        self.vocabulary = Vocabulary()
+        self.local_samples = {sample for sample, gene_lists in gene_sets.items()
+                              if any(draw_locally(genes, renderer, chunk_size) for genes in gene_lists)}
+
+    def sample_folder(self, sample, *names):
+        """
+        Path of the output subfolder of a sample, or of a file in it
+        """
+        return os.path.join(self.output, sample, *names)
+
+    def draw(self, func, *args, **kwargs):
+        """
+        Calls a drawing function in the pool of processes, if there is one
+        """
+        if self.plot_pool is None:
+            return func(*args, **kwargs)
+        return self.plot_pool.submit(func, *args, **kwargs).result()
+
+
+def fetch_sample(run, sample):
+    """
+    Sends the requests of a sample, saving the interactions fetched to
+    draw its networks. A failing request does not stop the other samples
+    """
+    with run.profiler.stage('fetch', sample=sample):
+        results = fetch_concurrently(run.tasks[sample], max_workers=1, return_exceptions=True)
+        results = {key: (CompactEnrichment.from_frame(result, run.vocabulary)
+                         if key[2] == 'enrichment' and isinstance(result, pd.DataFrame) else result)
+                   for key, result in results.items()}
+    failed = set()
+    for (_, direction, stage), result in results.items():
+        if isinstance(result, Exception):
+            print(f'Could not get the {stage} for sample {sample} ({direction}): {result}')
+            failed.add(stage)
+        elif stage == 'network' and (sample, direction) not in run.edge_tables and result is not None:
+            # interactions fetched from STRING to draw the network locally
+            print(f'Saving {len(result)} interactions to {sample}_{direction}_network_edges.tsv')
+            result.to_csv(run.sample_folder(sample, f'{sample}_{direction}_network_edges.tsv'),
+                          sep='\t', index=False)
+    todo = run.todo[sample]
+    if 'enrichment' in todo and 'enrichment' not in failed:
+        run.manifest.mark_done(sample, 'enrichment', run.digests[sample]['enrichment'])
+    if 'network' in todo and sample not in run.local_samples and 'network' not in failed:
+        run.manifest.mark_done(sample, 'network', run.digests[sample]['network'])
+    return dict(sample=sample, results=results, failed=failed, enriched=False, charts=[],
+                report_charts=[], top_terms=None, topology=None, ppi=None)
+
+
+def sample_topology(run, item):
+    """
+    Saves the topology of the UP and DOWN networks of a sample whose
+    interactions are known
+    """
+    sample = item['sample']
+    if not run.topology:
+        return item
+    # networks whose interactions could not be fetched are left out
+    directions = {}
+    for direction in ('up', 'down'):
+        edges = run.edge_tables.get((sample, direction))
+        for kind in ('network', 'edges'):
+            result = item['results'].get((sample, direction, kind))
+            if edges is None and isinstance(result, pd.DataFrame):
+                edges = result
+        if edges is not None:
+            directions[direction] = edges
+    item['results'] = {key: result for key, result in item['results'].items() if key[2] != 'edges'}
+    if not directions:
+        return item
+    from stringdb_analyser.topology import network_topology
+
+    genes = dict(zip(('up', 'down'), run.gene_sets[sample]))
+    with run.profiler.stage('topology', sample=sample):
+        nodes, summary = network_topology(
+            {(sample, direction.upper()): genes[direction] for direction in directions},
+            {(sample, direction.upper()): edges for direction, edges in directions.items()},
+            labels=run.labels)
+        print(f'Saving the network topology of sample {sample} to {sample}_network_topology.tsv')
+        nodes.to_csv(run.sample_folder(sample, f'{sample}_network_topology.tsv'), sep='\t', index=False)
+    item['topology'] = summary
+    return item
+
+
+def sample_ppi(run, item):
+    """
+    Saves the PPI enrichment of the UP and DOWN gene lists of a sample
+    """
+    sample = item['sample']
+    if not run.ppi:
+        return item
+    from stringdb_analyser.ppi import ppi_enrichment
+
+    with run.profiler.stage('ppi', sample=sample):
+        table = ppi_enrichment({(sample, direction): genes
+                                for direction, genes in zip(('UP', 'DOWN'), run.gene_sets[sample])},
+                               run.background, run.net_index, permutations=run.permutations)
+        print(f'Saving the PPI enrichment of sample {sample} to {sample}_ppi_enrichment.tsv')
+        table.to_csv(run.sample_folder(sample, f'{sample}_ppi_enrichment.tsv'), sep='\t', index=False)
+    item['ppi'] = table
+    return item
+
+
+def count_sample_words(run, item):
+    """
+    Counts the words of the enrichment of a sample for its radar charts,
+    and keeps its most enriched terms for the report
+    """
+    sample = item['sample']
+    todo = run.todo[sample]
+    if run.fetch_only or not (todo.intersection(['charts', 'tables']) or run.report):
+        return item
+    if 'enrichment' in item['failed']:
+        print(f'Skipping the enrichment analysis of sample {sample}\n')
+        return item
+    # the gene lists are not needed to count the words
+    up_enrich = item['results'][(sample, 'up', 'enrichment')].to_frame(SUMMARY_COLUMNS)
+    down_enrich = item['results'][(sample, 'down', 'enrichment')].to_frame(SUMMARY_COLUMNS)
+    enrich = join_directions(sample, up_enrich, down_enrich)
+    item['enriched'] = enrich is not None
+    if enrich is not None and ('charts' in todo or run.report):
+        with run.profiler.stage('words', sample=sample):
+            item['charts'] = radar_charts(sample, up_enrich, down_enrich, enrich,
+                                          run.sample_folder(sample), concepts=run.concepts)
+    if run.report:
+        from stringdb_analyser.report import top_enriched_terms
+
+        item['top_terms'] = top_enriched_terms(enrich)
+    return item
+
+
+def draw_sample(run, item):
+    """
+    Draws the networks of a sample that are rendered locally and its
+    radar charts
+    """
+    sample = item['sample']
+    todo = run.todo[sample]
+    if 'network' in todo and sample in run.local_samples and 'network' not in item['failed']:
+        jobs = []
+        for direction, genes in zip(('up', 'down'), run.gene_sets[sample]):
+            edges = run.edge_tables.get((sample, direction),
+                                        item['results'].get((sample, direction, 'network')))
+            if not draw_locally(genes, run.renderer, run.chunk_size) or edges is None:
+                continue
+            labels = run.labels
+            names = {gene: labels[gene] for gene in genes if gene in labels} if labels else None
+            jobs.append(dict(genes=genes, edges=edges, labels=names,
+                             formats=('svg', 'png') if run.png else ('svg',),
+                             out_path=run.sample_folder(sample, f'{sample}_{direction}_network')))
+        print(f'Drawing {len(jobs)} networks of sample {sample}\n')
+        with run.profiler.stage('networks', sample=sample):
+            for job in jobs:
+                run.draw(render_network, **job)
+        run.manifest.mark_done(sample, 'network', run.digests[sample]['network'])
+    if item['charts'] and 'charts' in todo and run.chart_format != 'html':
+        print(f'Drawing the radar charts of sample {sample}\n')
+        with run.profiler.stage('charts', sample=sample):
+            if run.chart_format == 'svg':
+                save_svg_charts(item['charts'])
+            else:
+                from stringdb_analyser.plots import render_chart_batch
+
+                pdf_path = run.sample_folder(sample, f'{sample}_radar_charts.pdf') if run.single_pdf else None
+                run.draw(render_chart_batch, item['charts'], pdf_path=pdf_path)
+    if item['charts'] and run.report:
+        with run.profiler.stage('charts', sample=sample):
+            item['report_charts'] = [chart_svg(chart) for chart in item['charts']]
+    if not run.fetch_only and 'charts' in todo and 'enrichment' not in item['failed']:
+        run.manifest.mark_done(sample, 'charts', run.digests[sample]['charts'])
+    item['charts'] = []
+    return item
+
+
+def save_sample(run, item):
+    """
+    Saves the enrichment tables of a sample and adds it to the report.
+    Returns what is kept until the end of the run (the columns of the
+    heatmap matrix, the topology and PPI summaries), or None
+    """
+    sample = item['sample']
+    todo = run.todo[sample]
+    if item['enriched'] and 'tables' in todo:
+        print('')
+        with run.profiler.stage('tables', sample=sample):
+            enrich = join_directions(sample, item['results'][(sample, 'up', 'enrichment')].to_frame(),
+                                     item['results'][(sample, 'down', 'enrichment')].to_frame())
+            write_enrichment(enrich, run.sample_folder(sample), sample, formats=run.formats,
+                             root=os.path.join(run.output, 'enrichment'), sample=sample,
+                             compression=run.compression, excel_engine=run.excel_engine)
+    if not run.fetch_only and 'tables' in todo and 'enrichment' not in item['failed']:
+        run.manifest.mark_done(sample, 'tables', run.digests[sample]['tables'])
+    if run.report:
+        images = [network_image(run.sample_folder(sample, f'{sample}_{direction}_network'))
+                  for direction in ('up', 'down')]
+        run.run_report.add_sample(sample, charts=item['report_charts'], images=images,
+                                  tables=[('Most enriched terms', item['top_terms']),
+                                          ('Network topology', item['topology']),
+                                          ('PPI enrichment', item['ppi'])])
+    if not run.heatmap and item['topology'] is None and item['ppi'] is None:
+        return None
+    # only the columns of the matrix are kept until the end of the run
+    matrix_part = {}
+    if run.heatmap:
+        for direction in ('up', 'down'):
+            enrich = item['results'].get((sample, direction, 'enrichment'))
+            matrix_part[(sample, direction.upper())] = (
+                enrich.to_frame(SUMMARY_COLUMNS)
+                if isinstance(enrich, CompactEnrichment) and not enrich.empty else None)
+    return dict(matrix=matrix_part, topology=item['topology'], ppi=item['ppi'])
+
+
+def save_run_summaries(run, finished, samples, plot_workers=1):
+    """
+    Saves what gathers all the samples of a run: the enrichment matrix and
+    its heatmaps, and the topology and PPI enrichment summaries
+    """
+    output = run.output
+    if run.heatmap:
+        from stringdb_analyser.matrix import build_enrichment_matrix, draw_heatmaps
+
+        # all the samples side by side, instead of one table per sample
+        enrichments = {key: enrich for part in finished for key, enrich in part['matrix'].items()}
+        enrichments = {(sample, direction): enrichments.get((sample, direction))
+                       for sample in samples for direction in ('UP', 'DOWN')}
+        with run.profiler.stage('heatmaps'):
+            matrix = build_enrichment_matrix(enrichments)
+            matrix.save(os.path.join(output, 'matrix'))
+            heatmaps = draw_heatmaps(matrix, os.path.join(output, 'matrix'), workers=plot_workers,
+                                     svg=run.report)
+        if run.report:
+            run.run_report.add_section('Enrichment heatmaps',
+                                       images=[os.path.splitext(path)[0] + '.svg' for path in heatmaps],
+                                       links=[os.path.relpath(path, output) for path in heatmaps])
+
+    if run.topology:
+        summaries = [part['topology'] for part in finished if part['topology'] is not None]
+        if summaries:
+            # the most cohesive networks first
+            summary = pd.concat(summaries, ignore_index=True).sort_values(
+                ['largest_fraction', 'density'], ascending=False, kind='stable')
+            print(f'\nSaving the network topology of {len(summary)} gene lists to network_topology.tsv')
+            summary.to_csv(os.path.join(output, 'network_topology.tsv'), sep='\t', index=False)
+            if run.report:
+                run.run_report.add_section('Network topology',
+                                           tables=[('Most cohesive networks first', summary)])
+
+    if run.ppi:
+        tables = [part['ppi'] for part in finished if part['ppi'] is not None]
+        if tables:
+            # the most significant gene lists first
+            table = pd.concat(tables, ignore_index=True).sort_values(
+                ['p_value', 'enrichment'], ascending=[True, False], kind='stable')
+            print(f'\nSaving the PPI enrichment of {len(table)} gene lists to ppi_enrichment.tsv')
+            table.to_csv(os.path.join(output, 'ppi_enrichment.tsv'), sep='\t', index=False)
+            if run.report:
+                run.run_report.add_section('PPI enrichment', tables=[('Lowest p-values first', table)])
+
+
+def analyse_workbook(filename, output, species, client=None, workers=4,
+                     string_api_url=STRING_API_URL, resolve=True, refresh=False,
+                     offline_dir=None, network_index=None, min_score=400,
+                     renderer='string', png=False, plot_workers=None,
+                     single_pdf=False, fetch_only=False, formats=('excel',),
+                     compression=None, excel_engine=None, force=(), chunk_size=None,
+                     concepts=None, heatmap=False, topology=False, queue_size=4,
+                     chart_format='pdf', report=False, aliases=None, ppi=False, permutations=1000,
+                     profiler=None):
+    """
+    Analyses every sample (UP and DOWN gene lists) of a workbook or
+    folder like analyse_gene_list does for one list, each sample in its
+    own subfolder of `output`. The stages finished by a previous run with
+    the same inputs are skipped, unless listed in `force` (see
+    RunManifest). With heatmap, the enrichments of all the samples are
+    gathered in output/matrix (see matrix), and the topology and PPI
+    summaries of all the samples are saved in `output`. The samples go
+    through a Pipeline: fetched by `workers` threads, drawn by
+    `plot_workers` processes, with up to `queue_size` samples between two
+    stages (see WorkbookRun and the *_sample functions).
+    """
+    client = client or StringClient(max_concurrency=workers)
+    profiler = profiler or Profiler(enabled=False)
+    make_folder(output)
+    print(f'\nAnalysing the file {filename}\n')
+
+    # read the genes of every sample first (the file is only read once),
+    # so all the requests can be sent at once
+    with profiler.stage('read'):
+        gene_sets = {}
+        for sample, up_genes, down_genes in iter_samples(filename):
+            make_folder(os.path.join(output, sample), sample)
+            gene_sets[sample] = (up_genes, down_genes)
+
+    samples = list(gene_sets)
+    print(f'The file has these samples{samples}\n')
+
+    # resolve the names of all the samples to STRING identifiers at once,
+    # and report the names that cannot be used up front
+    labels = None
+    if resolve and (offline_dir is None or aliases is not None):
+        all_genes = [gene for up_genes, down_genes in gene_sets.values()
+                     for gene in up_genes + down_genes]
+        with profiler.stage('resolve'):
+            id_map = resolve_identifiers(all_genes, species, client, string_api_url=string_api_url,
+                                         workers=workers, refresh=refresh, aliases=aliases)
+        if id_map is not None:
+            labels = id_map.preferred_names()
+            gene_sets = {sample: (id_map.translate(up_genes), id_map.translate(down_genes))
+                         for sample, (up_genes, down_genes) in gene_sets.items()}
+            # no empty gene list is sent to STRING or to the offline enrichment
+            for sample, gene_lists in list(gene_sets.items()):
+                empty = [direction for direction, genes in zip(('UP', 'DOWN'), gene_lists) if not genes]
+                if empty:
+                    print(f'No {" nor ".join(empty)} gene of sample {sample} could be mapped to '
+                          f'STRING identifiers, skipping it')
+                    del gene_sets[sample]
+            samples = list(gene_sets)
+
+    # stages already finished by a previous run with the same inputs are skipped
+    manifest = RunManifest(output, force=force)
+    digests = {}
+    for sample, (up_genes, down_genes) in gene_sets.items():
+        genes_digest = input_digest(species, up_genes, down_genes)
+        enrich_digest = input_digest(genes_digest, offline_dir, string_api_url)
+        digests[sample] = {
+            'network': input_digest(genes_digest, renderer, min_score, png, network_index,
+                                    offline_dir is None, string_api_url, chunk_size),
+            'enrichment': enrich_digest,
+            'charts': input_digest(enrich_digest, single_pdf, concepts, chart_format),
+            'tables': input_digest(enrich_digest, formats, compression, excel_engine),
+        }
+    todo = {sample: {stage for stage, digest in digests[sample].items()
+                     if not manifest.is_done(sample, stage, digest)}
+            for sample in samples}
+    if fetch_only:
+        todo = {sample: stages.difference(['charts', 'tables']) for sample, stages in todo.items()}
+    for sample in samples:
+        if not todo[sample]:
+            print(f'Sample {sample} was already analysed, skipping it')
+
+    topology = topology and not fetch_only
+    report = (report or chart_format == 'html') and not fetch_only
+    if topology and offline_dir is not None and network_index is None:
+        print('The network topology needs the interactions, give a --network-index to compute it offline\n')
+        topology = False
+    ppi = ppi and not fetch_only
+    if ppi and network_index is None:
+        print('The PPI enrichment needs the whole network, give a --network-index to compute it\n')
+        ppi = False
+    run = WorkbookRun(output, gene_sets, manifest, digests, todo, profiler, labels=labels,
+                      fetch_only=fetch_only, renderer=renderer, chunk_size=chunk_size, png=png,
+                      concepts=concepts, chart_format=chart_format, single_pdf=single_pdf,
+                      formats=formats, compression=compression, excel_engine=excel_engine,
+                      heatmap=heatmap, topology=topology, ppi=ppi, report=report,
+                      permutations=permutations)
+
+    # interaction tables from the local network index, without any request
+    if network_index is not None:
+        with profiler.stage('edges'):
+            run.net_index = load_network_index(network_index)
+            if ppi:
+                from stringdb_analyser.ppi import load_ppi_background
+
+                run.background = load_ppi_background(run.net_index, min_score)
+            for sample, (up_genes, down_genes) in gene_sets.items():
+                if 'network' not in todo[sample] and not topology:
+                    continue
+                for direction, genes in (('up', up_genes), ('down', down_genes)):
+                    edges = run.net_index.subnetwork(genes, min_score=min_score)
+                    run.edge_tables[(sample, direction)] = edges
+                    if 'network' in todo[sample]:
+                        print(f'Saving {len(edges)} interactions to {sample}_{direction}_network_edges.tsv')
+                        edges.to_csv(run.sample_folder(sample, f'{sample}_{direction}_network_edges.tsv'),
+                                     sep='\t', index=False)
+
+    # one network and one enrichment request per sample and direction
+    # (the enrichment is needed again if the charts or tables are not finished,
+    # and for every sample for the heatmaps)
+    edges_kwargs = dict(min_score=min_score, string_api_url=string_api_url,
+                        chunk_size=chunk_size, workers=workers)
+    for sample, (up_genes, down_genes) in gene_sets.items():
+        tasks = run.tasks[sample]
+        for direction, genes in (('up', up_genes), ('down', down_genes)):
+            needs_network = 'network' in todo[sample]
+            if needs_network and draw_locally(genes, renderer, chunk_size):
+                if renderer != 'local':
+                    print(f'The network of sample {sample} ({direction}) has {len(genes)} genes, '
+                          f'it will be fetched in chunks of {chunk_size} and drawn locally')
+                # only the interactions are needed, the image is drawn later
+                if (sample, direction) not in run.edge_tables and offline_dir is None:
+                    tasks[(sample, direction, 'network')] = (
+                        fetch_network_edges, (genes, species, client), edges_kwargs)
+            elif needs_network and offline_dir is None:
+                tasks[(sample, direction, 'network')] = (
+                    get_net_image, (genes,),
+                    dict(species=species, out_net=f'{sample}_{direction}_network.svg',
+                         out_folder=run.sample_folder(sample), client=client,
+                         string_api_url=string_api_url))
+            # the interactions for the topology, unless they are already there
+            if (topology and (sample, direction) not in run.edge_tables
+                    and tasks.get((sample, direction, 'network'), (None,))[0] is not fetch_network_edges):
+                tasks[(sample, direction, 'edges')] = (
+                    fetch_network_edges, (genes, species, client), edges_kwargs)
+            if todo[sample].intersection(['enrichment', 'charts', 'tables']) or run.heatmap or report:
+                tasks[(sample, direction, 'enrichment')] = (
+                    get_enrichment_data, (genes,),
+                    dict(species=species, client=client, offline_dir=offline_dir,
+                         string_api_url=string_api_url))
+        run.tasks[sample] = {
+            key: (profiler.wrap('request', func, sample=key[0], direction=key[1], kind=key[2]), args, kwargs)
+            for key, (func, args, kwargs) in tasks.items()}
+
+    n_requests = sum(len(tasks) for tasks in run.tasks.values())
+    if offline_dir is None:
+        print(f'Sending {n_requests} requests to STRING using {workers} workers\n')
+    else:
+        print(f'Computing the enrichment of {n_requests} gene lists from {offline_dir}\n')
+
+    if report:
+        from stringdb_analyser.report import RunReport
+
+        run.run_report = RunReport(f'STRING analysis of {os.path.basename(filename)}')
+    plot_workers = plot_workers or os.cpu_count() or 1
+    # networks and charts are drawn in other processes, using all the cores
+    run.plot_pool = ProcessPoolExecutor(max_workers=plot_workers) if plot_workers > 1 else None
+
+    # every sample goes through the stages on its own, so the next samples
+    # are downloaded while the previous ones are drawn and saved
+    pipeline = Pipeline([('fetch', partial(fetch_sample, run), workers),
+                         ('topology', partial(sample_topology, run), 1),
+                         ('ppi', partial(sample_ppi, run), 1),
+                         ('words', partial(count_sample_words, run), 1),
+                         ('charts', partial(draw_sample, run), plot_workers),
+                         ('tables', partial(save_sample, run), 1)], queue_size=queue_size)
+    try:
+        finished = pipeline.run(samples)
+    finally:
+        if run.plot_pool is not None:
+            run.plot_pool.shutdown()
+
+    save_run_summaries(run, finished, samples, plot_workers=plot_workers)
+    if report:
+        run.run_report.save(os.path.join(output, 'report.html'), order=samples)
+
+    if client.stats:
+        print('\nSTRING requests:')
+        print(client.summary())
+    print('\nAll analyses have finished!\n')
+    return output
+
+
+def join_directions(sample, up_enrich, down_enrich):
+    """
+    Joins the UP and DOWN enrichments of a sample into one table, with
+    their direction. Returns None if there is no enrichment at all
+    """
+    # test that we have enrichment data, if not, pass
+    if up_enrich.shape[0] == 0 and down_enrich.shape[0] == 0:
+        print(f'There was not enrichment for Sample {sample}!!')
+        return None
+
+    # join both datasets into one
+    up_enrich = up_enrich.assign(direction='UP')
+    down_enrich = down_enrich.assign(direction='DOWN')
+    return pd.concat([up_enrich, down_enrich], axis=0)
+
+
+def radar_charts(sample, up_enrich, down_enrich, enrich, sub_folder, concepts=None):
+    """
+    Radar charts of the words (or GO concepts, see count_terms) of the UP
+    and DOWN enrichments of a sample (`enrich` has both, with their direction)
+    """
+    # test whether the categories are shared or not
+    if up_enrich.shape[0]:
+        cat_up = set(up_enrich['category'].unique().tolist())
+    else:
+        cat_up = set()
+
+    if down_enrich.shape[0]:
+        cat_dw = set(down_enrich['category'].unique().tolist())
+    else:
+        cat_dw = set()
+
+    # count the words of every category and direction at once
+    words = count_terms(enrich, concepts=concepts, nwords=10)
+    charts = []
+
+    # all the shared categories
+    shared_cats = cat_up.intersection(cat_dw)
+
+    if len(shared_cats) > 0:
+        print('\nPlotting shared categories as radar plots!\n')
+        print(shared_cats)
+        print('\n')
+
+        for category in list(shared_cats):
+            multi_table = get_multi_table(words, cat=category)
+            charts.append(dict(kind='multi', table=multi_table, category=category,
+                               path=os.path.join(sub_folder, f'{sample}_{category}_radar_chart.pdf')))
+
+    # if there are categories not present in both, plot separate plots for each of them
+    if cat_up.difference(cat_dw) != set():
+        print(f'Single categories {cat_up.difference(cat_dw)} were found for the UP case!\n')
+        print('Plotting them!\n')
+        for cat in cat_up.difference(cat_dw):
+            word_df = select_words(words, cat, direction='UP')
+            charts.append(dict(kind='single', table=word_df, category=cat,
+                               path=os.path.join(sub_folder, f'{sample}_{cat}_UP_radar_chart.pdf')))
+
+    if cat_dw.difference(cat_up) != set():
+        print(f'Single categories {cat_dw.difference(cat_up)} were found for the DOWN case!\n')
+        print('Plotting them!\n')
+        for cat in cat_dw.difference(cat_up):
+            word_df = select_words(words, cat, direction='DOWN')
+            charts.append(dict(kind='single', table=word_df, category=cat,
+                               path=os.path.join(sub_folder, f'{sample}_{cat}_DOWN_radar_chart.pdf')))
+    return charts
@@ -0,0 +1,76 @@
+"""Networks and functional enrichments of gene lists from STRING."""
+
+import json
+import os
+
+import pandas as pd
+
+from stringdb_analyser.client import StringClient
+
+# STRING version used by string_api_MULTI.py, and latest version used by string_api_net_enrich.py
+STRING_API_URL = "https://version-11-5.string-db.org/api"
+STRING_LATEST_API_URL = "https://string-db.org/api"
+
+
+def get_net_image(genes, species=511145, out_net='full_network.svg', out_folder='.',
+                  client=None, string_api_url=STRING_API_URL):
+    """
+    This function gets a gene list as an input and
+    outputs a svg image of the network from those genes
+    from string- db
+    A different species, output name and output folder can be chosen
+    The request goes through a shared StringClient if given
+    """
+    output_format = "svg"
+    method = "network"
+
+    # Parameters
+    params = {
+        "identifiers": "\r".join(genes),  # your protein
+        "species": species,  # species NCBI identifier
+        "network_flavor": "confidence",  # show confidence links
+    }
+
+    if client is None:
+        client = StringClient()
+    content = client.post(string_api_url, output_format, method, params, genes)
+
+    print(f"Saving interaction network to {out_net}.svg file")
+
+    with open(os.path.join(out_folder, f'{out_net}.svg'), 'wb') as fh_net:
+        fh_net.write(content)
+
+
+def get_enrichment_data(genes, species=511145, client=None, offline_dir=None,
+                        string_api_url=STRING_API_URL):
+    """
+    Function gets gene list and extracts functional enrichment (if any)
+    The request goes through a shared StringClient if given
+    If a folder with the STRING annotation files of the species is given,
+    the enrichment is computed locally instead, with the same columns
+    """
+    if offline_dir is not None:
+        from stringdb_analyser.offline import load_offline_enrichment
+        return load_offline_enrichment(offline_dir, species).enrich(genes)
+
+    output_format = "json"
+    method = "enrichment"
+
+    # Set parameters
+    params = {
+
+        "identifiers": "%0d".join(genes),  # your protein
+        "species": species,  # species NCBI identifier
+        "caller_identity": "www.awesome_app.org"  # your app name
+
+    }
+
+    # Call STRING (or read the cached response)
+    if client is None:
+        client = StringClient()
+    content = client.post(string_api_url, output_format, method, params, genes)
+    # Read the data
+    data = json.loads(content)
+    # transform data to a dataframe
+    data_long = pd.DataFrame(data)
+    return data_long
@@ -0,0 +1,230 @@
+"""Caches of STRING API responses, on disk and in memory."""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def default_cache_dir():
+    """
+    Returns the default cache folder (~/.cache/stringdb_analyser,
+    or the same folder within $XDG_CACHE_HOME if defined)
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'stringdb_analyser')
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of raw STRING responses.
+    Every response is stored in its own file named after the hash of the
+    request, entries older than `ttl` seconds are ignored and the least
+    recently used entries are removed once the cache is above `max_size` bytes.
+    With refresh=True the stored responses are never read, only rewritten.
+    """
+
+    def __init__(self, directory=None, max_size=500 * 2**20, ttl=30 * 86400, refresh=False):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self.ttl = ttl
+        self.refresh = refresh
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self.size = sum(os.path.getsize(path) for path in self._entries())
+
+    @staticmethod
+    def make_key(request_url, identifiers, options=None):
+        """
+        Builds the cache key from the full endpoint url (API version included),
+        the normalised and sorted identifier list and any other request option
+        (e.g. the species)
+        """
+        genes = sorted({str(gene).strip() for gene in identifiers if str(gene).strip()})
+        payload = json.dumps({'url': request_url, 'identifiers': genes,
+                              'options': options or {}},
+                             sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + '.bin')
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.bin'):
+                    yield os.path.join(root, name)
+
+    def get(self, key):
+        """
+        Returns the stored content for a key, or None if missing or expired
+        """
+        if self.refresh:
+            return None
+        path = self._path(key)
+        try:
+            stats = os.stat(path)
+            now = time.time()
+            if self.ttl and now - stats.st_mtime > self.ttl:
+                self._remove(path)
+                return None
+            with open(path, 'rb') as fh_cache:
+                content = fh_cache.read()
+            # the access time is used to evict the least recently used entries
+            os.utime(path, (now, stats.st_mtime))
+        except OSError:
+            return None
+        return content
+
+    def put(self, key, content):
+        """
+        Stores the content of a response and evicts old entries if needed
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as fh_cache:
+            fh_cache.write(content)
+        with self.lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.size += len(content)
+            if self.max_size and self.size > self.max_size:
+                self._evict()
+
+    def _remove(self, path):
+        with self.lock:
+            try:
+                size = os.path.getsize(path)
+                os.remove(path)
+            except OSError:
+                return
+            self.size -= size
+
+    def _evict(self):
+        # remove the least recently used entries until the cache is below 90% of its size
+        entries = []
+        for path in self._entries():
+            try:
+                stats = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stats.st_atime, stats.st_size, path))
+        entries.sort()
+        self.size = sum(size for _, size, _ in entries)
+        target = self.max_size * 0.9
+        for _, size, path in entries:
+            if self.size <= target:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.size -= size
+
+
+class MemoryCache:
+    """
+    In-memory cache of raw STRING responses, used in front of a
+    ResponseCache (`backend`, optional) by long-running processes: the
+    responses read or fetched by a job are kept in memory for the next
+    ones, and the least recently used are dropped once the cache holds
+    more than `max_size` bytes. Has the same interface as ResponseCache.
+    """
+
+    def __init__(self, backend=None, max_size=200 * 2**20):
+        self.backend = backend
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return self.backend.directory if self.backend is not None else None
+
+    @property
+    def ttl(self):
+        return self.backend.ttl if self.backend is not None else None
+
+    @property
+    def refresh(self):
+        return self.backend.refresh if self.backend is not None else False
+
+    make_key = staticmethod(ResponseCache.make_key)
+
+    def get(self, key):
+        """
+        Returns the content for a key from memory, or else from the backend
+        """
+        if self.refresh:
+            return None
+        with self.lock:
+            content = self.entries.get(key)
+            if content is not None:
+                self.entries.move_to_end(key)
+                return content
+        if self.backend is None:
+            return None
+        content = self.backend.get(key)
+        if content is not None:
+            self._keep(key, content)
+        return content
+
+    def put(self, key, content):
+        """
+        Stores the content of a response in memory and in the backend
+        """
+        self._keep(key, content)
+        if self.backend is not None:
+            self.backend.put(key, content)
+
+    def _keep(self, key, content):
+        with self.lock:
+            if key in self.entries:
+                self.size -= len(self.entries.pop(key))
+            self.entries[key] = content
+            self.size += len(content)
+            while self.size > self.max_size and self.entries:
+                _, old = self.entries.popitem(last=False)
+                self.size -= len(old)
+
+
+def add_cache_arguments(parser):
+    """
+    Adds the cache options shared by the scripts to an argparse parser
+    """
+    parser.add_argument('--no-cache',
+                        action='store_true',
+                        help='do not read or write the STRING response cache')
+    parser.add_argument('--refresh',
+                        action='store_true',
+                        help='ignore cached responses and fetch them again from STRING')
+    parser.add_argument('--cache-dir',
+                        type=str,
+                        default=None,
+                        help=f'folder of the response cache (default: {default_cache_dir()})')
+    parser.add_argument('--cache-size',
+                        type=float,
+                        default=500,
+                        help='maximum size of the response cache in MB (default: 500)')
+    parser.add_argument('--cache-ttl',
+                        type=float,
+                        default=30,
+                        help='days before a cached response expires (default: 30)')
+
+
+def cache_from_args(args):
+    """
+    Creates the ResponseCache defined by the parsed arguments, or None
+    if the cache has been disabled
+    """
+    if args.no_cache:
+        return None
+    return ResponseCache(args.cache_dir,
+                         max_size=int(args.cache_size * 2**20),
+                         ttl=args.cache_ttl * 86400,
+                         refresh=args.refresh)
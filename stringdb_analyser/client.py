@@ -0,0 +1,275 @@
+"""Helpers to talk to the STRING API: a shared HTTP client with rate limiting,
+retries, caching and request statistics, and concurrent fetching."""
+
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# status codes worth trying again, anything else is an error straight away
+RETRY_STATUS = (429, 500, 502, 503, 504)
+# status codes meaning that STRING asks us to slow down
+THROTTLE_STATUS = (429, 503)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    The bucket is refilled with `rate` tokens per second up to `capacity`,
+    each request takes one token and waits until one is available.
+    A rate of 0 (or None) disables the limit.
+    """
+
+    def __init__(self, rate=1.0, capacity=1):
+        self.rate = float(rate or 0)
+        self.capacity = max(1, int(capacity))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a token is available and takes it
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AdaptiveLimit:
+    """
+    Limits how many requests are on the wire at the same time.
+    The limit is halved every time the server pushes back and grows again
+    by one after as many successful requests as the current limit
+    (additive increase, multiplicative decrease), never above `maximum`.
+    The server can also pause every request for some seconds (Retry-After).
+    """
+
+    def __init__(self, maximum=4):
+        self.maximum = max(1, int(maximum))
+        self.limit = self.maximum
+        self.active = 0
+        self.successes = 0
+        self.paused_until = 0.0
+        self.condition = threading.Condition()
+
+    def __enter__(self):
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                elif self.active >= self.limit:
+                    self.condition.wait()
+                else:
+                    break
+            self.active += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        with self.condition:
+            self.active -= 1
+            self.condition.notify_all()
+
+    def success(self):
+        """
+        Records a successful request, slowly raising the limit
+        """
+        with self.condition:
+            self.successes += 1
+            if self.limit < self.maximum and self.successes >= self.limit:
+                self.limit += 1
+                self.successes = 0
+                self.condition.notify_all()
+
+    def throttle(self, pause=0.0):
+        """
+        Records a request rejected by the server: halves the limit and
+        optionally stops every new request for `pause` seconds
+        """
+        with self.condition:
+            self.limit = max(1, self.limit // 2)
+            self.successes = 0
+            if pause > 0:
+                self.paused_until = max(self.paused_until, time.monotonic() + pause)
+
+
+class StringAPIError(Exception):
+    """
+    Raised when STRING answers with an error, or keeps failing after all the retries
+    """
+
+
+def retry_after(response):
+    """
+    Returns the seconds to wait requested by the Retry-After header
+    of a response (in seconds or as a date), or None if missing
+    """
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - time.time())
+
+
+class StringClient:
+    """
+    Shared client for every call to the STRING API.
+    It keeps a pool of keep-alive connections, spaces out the requests with
+    a TokenBucket, limits (and adapts) the number of concurrent requests,
+    retries failed requests with exponential backoff honouring Retry-After,
+    reads/writes the ResponseCache, and keeps counters per endpoint.
+    """
+
+    def __init__(self, limiter=None, cache=None, max_concurrency=4, max_retries=5,
+                 backoff=1.0, max_backoff=60.0, timeout=120.0):
+        self.limiter = limiter
+        self.cache = cache
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.concurrency = AdaptiveLimit(max_concurrency)
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(10, max_concurrency))
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self.stats_lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'requests': 0, 'cached': 0, 'retries': 0,
+                                          'errors': 0, 'bytes': 0, 'seconds': 0.0})
+
+    def _record(self, endpoint, **counts):
+        with self.stats_lock:
+            stats = self.stats[endpoint]
+            for name, value in counts.items():
+                stats[name] += value
+
+    def post(self, string_api_url, output_format, method, params, identifiers):
+        """
+        Sends a POST request to a STRING API endpoint and returns the raw content.
+        The response is read from the cache when possible and saved to it otherwise.
+        Raises StringAPIError if STRING does not give a valid answer.
+        """
+        endpoint = f'{output_format}/{method}'
+        request_url = "/".join([string_api_url, output_format, method])
+
+        key = None
+        if self.cache is not None:
+            options = {name: value for name, value in params.items()
+                       if name not in ('identifiers', 'caller_identity')}
+            key = self.cache.make_key(request_url, identifiers, options)
+            content = self.cache.get(key)
+            if content is not None:
+                self._record(endpoint, cached=1)
+                return content
+
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._record(endpoint, retries=1)
+            response = None
+            error = None
+            with self.concurrency:
+                # the limiter is only used when we really go to the network
+                if self.limiter is not None:
+                    self.limiter.acquire()
+                start = time.perf_counter()
+                try:
+                    response = self.session.post(request_url, data=params, timeout=self.timeout)
+                except requests.RequestException as err:
+                    error = err
+                elapsed = time.perf_counter() - start
+
+            size = len(response.content) if response is not None else 0
+            self._record(endpoint, requests=1, bytes=size, seconds=elapsed)
+
+            if response is not None and response.ok:
+                self.concurrency.success()
+                if self.cache is not None:
+                    self.cache.put(key, response.content)
+                return response.content
+
+            if response is not None:
+                error = f'HTTP {response.status_code}'
+                if response.status_code not in RETRY_STATUS:
+                    self._record(endpoint, errors=1)
+                    raise StringAPIError(f'STRING returned {error} for {request_url}')
+
+            # wait before trying again: what the server asks, or an exponential backoff
+            wait = retry_after(response)
+            if response is not None and response.status_code in THROTTLE_STATUS:
+                self.concurrency.throttle(pause=wait or 0.0)
+            if wait is None:
+                wait = min(self.max_backoff, self.backoff * 2 ** attempt)
+                wait *= random.uniform(0.5, 1.0)
+            if attempt < self.max_retries:
+                sleep_time = min(wait, self.max_backoff)
+                print(f'STRING request to {endpoint} failed ({error}), retrying in {sleep_time:.1f} s')
+                time.sleep(sleep_time)
+
+        self._record(endpoint, errors=1)
+        raise StringAPIError(f'STRING request to {request_url} failed after '
+                             f'{self.max_retries + 1} attempts ({error})')
+
+    def summary(self):
+        """
+        Returns a small text table with the counters of every endpoint
+        """
+        lines = [f"{'endpoint':<20}{'requests':>10}{'cached':>8}{'retries':>9}"
+                 f"{'errors':>8}{'MB':>9}{'avg s':>8}"]
+        with self.stats_lock:
+            for endpoint, stats in sorted(self.stats.items()):
+                average = stats['seconds'] / stats['requests'] if stats['requests'] else 0.0
+                lines.append(f"{endpoint:<20}{stats['requests']:>10}{stats['cached']:>8}"
+                             f"{stats['retries']:>9}{stats['errors']:>8}"
+                             f"{stats['bytes'] / 2**20:>9.2f}{average:>8.2f}")
+        return '\n'.join(lines)
+
+
+def fetch_concurrently(tasks, max_workers=4, return_exceptions=False):
+    """
+    Runs a dictionary of tasks {key: (function, args, kwargs)} in a
+    bounded thread pool and returns a dictionary {key: result}.
+    With max_workers=1 the tasks run one after the other, in order.
+    If return_exceptions is True, a failing task gives its exception as
+    result instead of stopping the whole batch.
+    """
+    def run(func, args, kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as err:
+            if return_exceptions:
+                return err
+            raise
+
+    if max_workers <= 1:
+        return {key: run(func, args, kwargs)
+                for key, (func, args, kwargs) in tasks.items()}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {key: pool.submit(run, func, args, kwargs)
+                   for key, (func, args, kwargs) in tasks.items()}
+        return {key: future.result() for key, future in futures.items()}
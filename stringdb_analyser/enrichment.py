@@ -0,0 +1,164 @@
+"""Compact in-memory form of the enrichment tables.
+
+get_enrichment_data returns the table of STRING as it comes: columns of
+repeated strings (category, term, description) and a Python list of genes
+per row (inputGenes, preferredNames). A CompactEnrichment holds the same
+table with:
+
+    - the string columns as pandas categoricals
+    - the gene lists as int32 codes into a vocabulary of genes (shared by
+      all the tables of a run) in a flat CSR array: the genes of row i are
+      codes[indptr[i]:indptr[i + 1]]
+    - the integer columns as int32
+
+and gives the original table back with to_frame(), or only some of its
+columns (e.g. without the gene lists, which are the slowest to rebuild).
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+# columns holding lists of genes
+LIST_COLUMNS = ('inputGenes', 'preferredNames')
+
+
+class Vocabulary:
+    """
+    Assigns an integer code to every distinct string, so many tables can
+    share the same strings (thread safe)
+    """
+
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+        self.array = None
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.strings)
+
+    def encode(self, values):
+        """
+        Returns the int32 codes of a sequence of strings, adding the new ones
+        """
+        codes = self.codes
+        with self.lock:
+            for value in values:
+                if value not in codes:
+                    codes[value] = len(self.strings)
+                    self.strings.append(value)
+            return np.fromiter((codes[value] for value in values), dtype=np.int32, count=len(values))
+
+    def decode(self, codes):
+        """
+        Returns the strings of an array of codes (as an object array)
+        """
+        with self.lock:
+            if self.array is None or len(self.array) != len(self.strings):
+                self.array = np.array(self.strings, dtype=object)
+            strings = self.array
+        return strings[codes]
+
+
+class CompactEnrichment:
+    """
+    Enrichment table with categorical columns and its gene lists as CSR
+    arrays of codes of `vocabulary` (see the module description). Build it
+    with CompactEnrichment.from_frame
+    """
+
+    def __init__(self, table, lists, columns, dtypes, vocabulary):
+        # table without the gene lists; lists: {column: (indptr, codes)}
+        self.table = table
+        self.lists = lists
+        self.columns = columns
+        self.dtypes = dtypes
+        self.vocabulary = vocabulary
+
+    @classmethod
+    def from_frame(cls, enrich, vocabulary=None):
+        """
+        Converts an enrichment table (from get_enrichment_data). Give the
+        same vocabulary to all the tables of a run to share their genes
+        """
+        vocabulary = vocabulary if vocabulary is not None else Vocabulary()
+        columns = enrich.columns.copy()
+        dtypes = enrich.dtypes.to_dict()
+        table = {}
+        lists = {}
+        for column in columns:
+            values = enrich[column]
+            if column in LIST_COLUMNS:
+                genes = [list(genes) if isinstance(genes, (list, tuple, np.ndarray)) else [] for genes in values]
+                lengths = np.fromiter(map(len, genes), dtype=np.int64, count=len(genes))
+                indptr = np.zeros(len(genes) + 1, dtype=np.int64)
+                np.cumsum(lengths, out=indptr[1:])
+                flat = [gene for row in genes for gene in row]
+                lists[column] = (indptr, vocabulary.encode(flat))
+            elif pd.api.types.is_integer_dtype(values) and values.size and \
+                    np.iinfo(np.int32).min <= values.min() and values.max() <= np.iinfo(np.int32).max:
+                table[column] = values.to_numpy(dtype=np.int32)
+            elif pd.api.types.is_string_dtype(values) or pd.api.types.is_object_dtype(values):
+                table[column] = pd.Categorical(values)
+            else:
+                table[column] = values.to_numpy()
+        return cls(pd.DataFrame(table, index=pd.RangeIndex(len(enrich))), lists, columns, dtypes, vocabulary)
+
+    def __len__(self):
+        return len(self.table)
+
+    @property
+    def empty(self):
+        return len(self.table) == 0
+
+    def nbytes(self):
+        """
+        Memory used by the table and its gene codes (not by the vocabulary,
+        which is shared)
+        """
+        return int(self.table.memory_usage(deep=True).sum()
+                   + sum(indptr.nbytes + codes.nbytes for indptr, codes in self.lists.values()))
+
+    def genes(self, column='inputGenes'):
+        """
+        Returns the gene lists of a column as a list of lists
+        """
+        indptr, codes = self.lists[column]
+        strings = self.vocabulary.decode(codes)
+        return [strings[start:end].tolist() for start, end in zip(indptr[:-1], indptr[1:])]
+
+    def to_frame(self, columns=None):
+        """
+        Returns the enrichment table as get_enrichment_data gives it, with
+        all the columns or only the given ones
+        """
+        if columns is None:
+            columns = self.columns
+        else:
+            columns = [column for column in columns if column in self.columns]
+        data = {}
+        for column in columns:
+            if column in self.lists:
+                data[column] = self.genes(column)
+            else:
+                values = self.table[column]
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    values = values.astype(values.cat.categories.dtype)
+                data[column] = values.astype(self.dtypes[column])
+        return pd.DataFrame(data, columns=columns, index=pd.RangeIndex(len(self.table)))
+
+
+def frame_nbytes(enrich):
+    """
+    Memory used by an enrichment table, with the strings of its gene lists
+    (which DataFrame.memory_usage does not count)
+    """
+    import sys
+
+    total = int(enrich.memory_usage(deep=True).sum())
+    for column in LIST_COLUMNS:
+        if column in enrich:
+            total += sum(sys.getsizeof(gene) for genes in enrich[column] for gene in genes)
+    return total
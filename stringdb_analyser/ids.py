@@ -0,0 +1,179 @@
+"""Resolution of gene/protein names to stable STRING identifiers."""
+
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse
+
+from stringdb_analyser.api import STRING_API_URL
+from stringdb_analyser.client import fetch_concurrently
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class IdentifierMap:
+    """
+    Mapping of names to STRING identifiers for a single species and STRING version.
+    Names are resolved in a few large batched get_string_ids calls and the
+    mapping is kept in a json file (string_ids_{api host}_{species}.json)
+    within `directory`, so every name is only resolved once. Names that
+    STRING does not know are stored too, as None. Like the cached
+    responses, names resolved more than `ttl` seconds ago are resolved
+    again.
+    """
+
+    def __init__(self, species, directory=None, string_api_url=STRING_API_URL, ttl=None):
+        self.species = species
+        self.string_api_url = string_api_url
+        self.ttl = ttl
+        self.path = None
+        self.entries = {}
+        # time every name was resolved
+        self.resolved = {}
+        self.lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            host = urlparse(string_api_url).netloc.replace(':', '_')
+            self.path = os.path.join(directory, f'string_ids_{host}_{species}.json')
+            if os.path.exists(self.path):
+                with open(self.path) as fh_ids:
+                    saved = json.load(fh_ids)
+                if set(saved) == {'entries', 'resolved'}:
+                    self.entries, self.resolved = saved['entries'], saved['resolved']
+                else:
+                    # mapping saved without times: as old as the file
+                    self.entries = saved
+                    modified = os.path.getmtime(self.path)
+                    self.resolved = {name: modified for name in self.entries}
+                if self.ttl:
+                    now = time.time()
+                    expired = [name for name in self.entries if now - self.resolved.get(name, 0) > self.ttl]
+                    for name in expired:
+                        del self.entries[name]
+                        self.resolved.pop(name, None)
+
+    def save(self):
+        """
+        Writes the mapping to its json file (if any)
+        """
+        if self.path is None:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with self.lock:
+            with open(tmp_path, 'w') as fh_ids:
+                json.dump({'entries': self.entries, 'resolved': self.resolved}, fh_ids)
+            os.replace(tmp_path, self.path)
+
+    def _fetch(self, names, client):
+        # one get_string_ids call, keeping the two best candidates of every name
+        params = {
+            "identifiers": "\r".join(names),
+            "species": self.species,
+            "limit": 2,
+            "echo_query": 1,
+            "caller_identity": "www.awesome_app.org"
+        }
+        content = client.post(self.string_api_url, "json", "get_string_ids", params, names)
+        candidates = {}
+        for hit in json.loads(content):
+            name = names[int(hit['queryIndex'])]
+            candidates.setdefault(name, []).append(
+                {'string_id': hit['stringId'], 'preferred_name': hit.get('preferredName')})
+        return {name: candidates.get(name) for name in names}
+
+    def resolve(self, names, client, chunk_size=1000, workers=1, refresh=False):
+        """
+        Resolves every name that is not already in the mapping (or all of
+        them with refresh=True) in batches of `chunk_size` names
+        """
+        names = sorted({str(name).strip() for name in names if str(name).strip()})
+        missing = names if refresh else [name for name in names if name not in self.entries]
+        if not missing:
+            return
+        print(f'Resolving {len(missing)} identifiers with STRING\n')
+        tasks = {index: (self._fetch, (chunk, client), {})
+                 for index, chunk in enumerate(_chunks(missing, chunk_size))}
+        now = time.time()
+        for found in fetch_concurrently(tasks, max_workers=workers).values():
+            self.entries.update(found)
+            self.resolved.update(dict.fromkeys(found, now))
+        self.save()
+
+    def resolve_locally(self, names, alias_index):
+        """
+        Resolves every name that is not already in the mapping with a local
+        AliasIndex (see aliases) instead of STRING
+        """
+        names = sorted({str(name).strip() for name in names if str(name).strip()})
+        missing = [name for name in names if name not in self.entries]
+        if missing:
+            found = alias_index.lookup(missing, self.species)
+            self.entries.update(found)
+            self.resolved.update(dict.fromkeys(found, time.time()))
+
+    def string_id(self, name):
+        """
+        Returns the best STRING identifier for a name, or None if unmapped
+        """
+        candidates = self.entries.get(str(name).strip())
+        return candidates[0]['string_id'] if candidates else None
+
+    def preferred_names(self):
+        """
+        Returns {STRING identifier: preferred name} for every resolved name
+        """
+        return {candidates[0]['string_id']: candidates[0]['preferred_name']
+                for candidates in self.entries.values() if candidates}
+
+    def unmapped(self, names):
+        """
+        Returns the names (from a list) that STRING could not map
+        """
+        return sorted({str(name).strip() for name in names
+                       if self.string_id(name) is None})
+
+    def ambiguous(self, names):
+        """
+        Returns {name: [candidate names]} for the names with more than one
+        candidate where the best one is not an exact (case-insensitive) match
+        """
+        found = {}
+        for name in {str(name).strip() for name in names}:
+            candidates = self.entries.get(name) or []
+            best = candidates[0]['preferred_name'] if candidates else None
+            if len(candidates) > 1 and (best or '').lower() != name.lower():
+                found[name] = [hit['preferred_name'] for hit in candidates]
+        return dict(sorted(found.items()))
+
+    def report(self, names):
+        """
+        Prints the unmapped and ambiguous names of a list, once
+        """
+        unmapped = self.unmapped(names)
+        if unmapped:
+            print(f'{len(unmapped)} identifiers could not be mapped to STRING and will be ignored:')
+            print(', '.join(unmapped) + '\n')
+        ambiguous = self.ambiguous(names)
+        if ambiguous:
+            print(f'{len(ambiguous)} identifiers are ambiguous, the first STRING match will be used:')
+            for name, candidates in ambiguous.items():
+                print(f'  {name}: {", ".join(candidates)}')
+            print('')
+
+    def translate(self, genes):
+        """
+        Converts a gene list to STRING identifiers, dropping the unmapped names
+        and keeping the order of the list
+        """
+        string_ids = []
+        seen = set()
+        for gene in genes:
+            string_id = self.string_id(gene)
+            if string_id is not None and string_id not in seen:
+                seen.add(string_id)
+                string_ids.append(string_id)
+        return string_ids
@@ -0,0 +1,153 @@
+"""Streaming readers for gene lists and multi-sample inputs.
+
+A multi-sample input is either an Excel workbook with one sheet per sample
+and direction (sample1_UP, sample1_DOWN, ...) or a folder with one file
+per sample and direction using the same names (sample1_UP.csv,
+sample1_DOWN.tsv.gz, sample1_UP.parquet, sample1_UP.txt, ...).
+Tables (Excel, CSV, TSV, Parquet) have a header and the genes in their
+first column, text lists have one gene per line and no header.
+"""
+
+import csv
+import gzip
+import os
+import re
+
+DIRECTIONS = ('UP', 'DOWN')
+
+# sample_UP.csv, sample_DOWN.tsv.gz, sample_UP.parquet, sample_DOWN.txt...
+SAMPLE_FILE = re.compile(r'^(?P<sample>.+)_(?P<direction>UP|DOWN)'
+                         r'\.(?P<kind>csv|tsv|txt|parquet)(?P<gz>\.gz)?$')
+
+
+def _open_text(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', newline='')
+    return open(path, newline='')
+
+
+def _clean(values):
+    # drop empty cells and surrounding spaces
+    genes = []
+    for value in values:
+        if value is None:
+            continue
+        value = str(value).strip()
+        if value and value.lower() != 'nan':
+            genes.append(value)
+    return genes
+
+
+def iter_gene_list(path):
+    """
+    Yields the genes of a text list (one per line, first word of the
+    line), gzipped or not, without loading the whole file
+    """
+    with _open_text(path) as fh_genes:
+        for line in fh_genes:
+            fields = line.split()
+            if fields:
+                yield fields[0]
+
+
+def read_gene_list(path):
+    """
+    Reads a text gene list (gzipped or not) into a list
+    """
+    return list(iter_gene_list(path))
+
+
+def read_gene_table(path):
+    """
+    Reads the genes (first column, after the header) of a CSV, TSV or
+    Parquet file, or of a text list
+    """
+    match = SAMPLE_FILE.match(os.path.basename(path))
+    kind = match.group('kind') if match else os.path.basename(path).split('.')[-1]
+    if kind == 'parquet':
+        import pyarrow.parquet as pq
+        parquet = pq.ParquetFile(path)
+        column = parquet.schema_arrow.names[0]
+        return _clean(gene for batch in parquet.iter_batches(columns=[column])
+                      for gene in batch.column(0).to_pylist())
+    if kind == 'txt':
+        return read_gene_list(path)
+    delimiter = '\t' if kind == 'tsv' else ','
+    with _open_text(path) as fh_table:
+        rows = csv.reader(fh_table, delimiter=delimiter)
+        next(rows, None)
+        return _clean(row[0] for row in rows if row)
+
+
+def _pair_samples(names):
+    # {sample: {direction: name}} in order of appearance, only complete samples
+    samples = {}
+    for name, sample, direction in names:
+        samples.setdefault(sample, {})[direction] = name
+    complete = {}
+    for sample, found in samples.items():
+        missing = [direction for direction in DIRECTIONS if direction not in found]
+        if missing:
+            print(f'Sample {sample} has no {" or ".join(missing)} list, it will be skipped')
+        else:
+            complete[sample] = found
+    return complete
+
+
+def _workbook_samples(workbook):
+    names = []
+    for name in workbook.sheetnames:
+        sample, _, direction = name.rpartition('_')
+        if sample and direction in DIRECTIONS:
+            names.append((name, sample, direction))
+    return _pair_samples(names)
+
+
+def _directory_samples(directory):
+    names = []
+    for name in sorted(os.listdir(directory)):
+        match = SAMPLE_FILE.match(name)
+        if match:
+            names.append((os.path.join(directory, name), match.group('sample'),
+                          match.group('direction')))
+    return _pair_samples(names)
+
+
+def sample_names(path):
+    """
+    Returns the names of the samples of a workbook or folder, reading only
+    the sheet (or file) names
+    """
+    if os.path.isdir(path):
+        return list(_directory_samples(path))
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return list(_workbook_samples(workbook))
+    finally:
+        workbook.close()
+
+
+def iter_samples(path):
+    """
+    Yields (sample, up_genes, down_genes) for every sample of a workbook or
+    folder. The workbook is opened once, in read-only (streaming) mode,
+    and every sheet is only read when its sample is requested.
+    """
+    if os.path.isdir(path):
+        for sample, files in _directory_samples(path).items():
+            yield sample, read_gene_table(files['UP']), read_gene_table(files['DOWN'])
+        return
+
+    from openpyxl import load_workbook
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for sample, sheets in _workbook_samples(workbook).items():
+            lists = []
+            for direction in DIRECTIONS:
+                rows = workbook[sheets[direction]].iter_rows(values_only=True)
+                next(rows, None)  # header
+                lists.append(_clean(row[0] for row in rows if row))
+            yield sample, lists[0], lists[1]
+    finally:
+        workbook.close()
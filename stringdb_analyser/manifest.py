@@ -0,0 +1,69 @@
+"""Run manifest of string_api_MULTI.py, to resume interrupted runs.
+
+The manifest (manifest.json in the output folder) records, for every
+sample and stage, a hash of the inputs of the stage and when it was
+finished. A new run in the same output folder skips the stages whose
+inputs have not changed since they were finished.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+STAGES = ('network', 'enrichment', 'charts', 'tables')
+
+
+def input_digest(*parts):
+    """
+    Hash of the inputs of a stage (gene lists, species, options...)
+    """
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class RunManifest:
+    """
+    Completion markers of the stages of every sample of a run, saved in
+    `output`/manifest.json after every change. Stages in `force` are never
+    considered finished.
+    """
+
+    def __init__(self, output, force=()):
+        self.path = os.path.join(output, 'manifest.json')
+        self.force = set(force)
+        self.lock = threading.Lock()
+        self.samples = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as fh_manifest:
+                    self.samples = json.load(fh_manifest).get('samples', {})
+            except (OSError, ValueError):
+                print(f'The run manifest {self.path} could not be read, starting from scratch')
+
+    def is_done(self, sample, stage, digest):
+        """
+        True if the stage of the sample was finished with the same inputs
+        """
+        if stage in self.force:
+            return False
+        entry = self.samples.get(sample, {}).get(stage)
+        return entry is not None and entry['hash'] == digest
+
+    def mark_done(self, sample, stage, digest):
+        """
+        Records that the stage of the sample has been finished
+        """
+        with self.lock:
+            self.samples.setdefault(sample, {})[stage] = {'hash': digest, 'finished': time.time()}
+            self.save()
+
+    def save(self):
+        """
+        Writes the manifest (a crash while writing keeps the previous one)
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as fh_manifest:
+            json.dump({'samples': self.samples}, fh_manifest, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
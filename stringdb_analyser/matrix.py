@@ -0,0 +1,177 @@
+"""Cross-sample matrix of the enrichments of a run, and its heatmaps.
+
+The enrichments of all the samples (UP and DOWN) of a run are gathered in
+a single sparse matrix, with a row per sample and direction and a column
+per enriched term, holding the -log10(FDR) of the term (nothing where the
+term is not enriched). It is saved in a folder as:
+
+    matrix.npz   scipy.sparse CSR matrix (float32)
+    rows.tsv     sample and direction of every row
+    terms.tsv    category, term and description of every column
+
+and drawn as a heatmap per category, with the rows and the columns ordered
+by hierarchical clustering of their cosine distances (computed from the
+sparse matrix, so only the terms shown are ever made dense).
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+# FDR values of 0 are kept finite
+MIN_FDR = 1e-300
+
+
+class EnrichmentMatrix:
+    """
+    Sparse matrix of -log10(FDR) with the sample and direction of every
+    row (`rows`) and the category, term and description of every column
+    (`terms`)
+    """
+
+    def __init__(self, values, rows, terms):
+        self.values = sparse.csr_matrix(values, dtype=np.float32)
+        self.rows = rows.reset_index(drop=True)
+        self.terms = terms.reset_index(drop=True)
+
+    @property
+    def row_labels(self):
+        """
+        'sample direction' label of every row
+        """
+        return (self.rows['sample'].astype(str) + ' ' + self.rows['direction'].astype(str)).tolist()
+
+    def category(self, category):
+        """
+        Returns the matrix of the terms of a category only
+        """
+        columns = np.flatnonzero((self.terms['category'] == category).to_numpy())
+        return EnrichmentMatrix(self.values[:, columns], self.rows, self.terms.iloc[columns])
+
+    def to_frame(self):
+        """
+        Returns the matrix as a dense DataFrame (rows by terms)
+        """
+        return pd.DataFrame(self.values.toarray(), index=pd.MultiIndex.from_frame(self.rows),
+                            columns=pd.MultiIndex.from_frame(self.terms[['category', 'term']]))
+
+    def save(self, folder):
+        """
+        Saves the matrix in a folder (see the module description)
+        """
+        os.makedirs(folder, exist_ok=True)
+        sparse.save_npz(os.path.join(folder, 'matrix.npz'), self.values, compressed=True)
+        self.rows.to_csv(os.path.join(folder, 'rows.tsv'), sep='\t', index=False)
+        self.terms.to_csv(os.path.join(folder, 'terms.tsv'), sep='\t', index=False)
+        print(f'Saving the enrichment matrix ({self.values.shape[0]} gene lists, '
+              f'{self.values.shape[1]} terms) in {folder}')
+
+
+def load_enrichment_matrix(folder):
+    """
+    Reads a matrix saved by EnrichmentMatrix.save
+    """
+    return EnrichmentMatrix(sparse.load_npz(os.path.join(folder, 'matrix.npz')),
+                            pd.read_csv(os.path.join(folder, 'rows.tsv'), sep='\t', dtype=str),
+                            pd.read_csv(os.path.join(folder, 'terms.tsv'), sep='\t', dtype=str,
+                                        keep_default_na=False))
+
+
+def build_enrichment_matrix(enrichments):
+    """
+    Builds the EnrichmentMatrix of {(sample, direction): enrichment table}
+    (tables from get_enrichment_data, empty or failed ones are left out)
+    """
+    keys = [key for key, enrich in enrichments.items()
+            if isinstance(enrich, pd.DataFrame) and not enrich.empty]
+    rows = pd.DataFrame(keys, columns=['sample', 'direction'])
+    if not keys:
+        return EnrichmentMatrix(sparse.csr_matrix((0, 0)), rows,
+                                pd.DataFrame(columns=['category', 'term', 'description']))
+
+    lengths = [len(enrichments[key]) for key in keys]
+    enrich = pd.concat([enrichments[key][['category', 'term', 'description', 'fdr']] for key in keys],
+                       ignore_index=True)
+    row_index = np.repeat(np.arange(len(keys)), lengths)
+    # one column per category and term, in order of appearance
+    col_index, term_keys = pd.MultiIndex.from_frame(enrich[['category', 'term']]).factorize()
+    terms = term_keys.to_frame(index=False, name=['category', 'term'])
+    terms['description'] = enrich['description'].groupby(col_index).first().to_numpy()
+    scores = -np.log10(np.clip(enrich['fdr'].to_numpy(dtype=float), MIN_FDR, 1.0))
+
+    # a term listed twice for the same gene list keeps its best score
+    values = sparse.coo_matrix((scores, (row_index, col_index)), shape=(len(keys), len(terms)))
+    values = values.tocsr()
+    if values.nnz < len(scores):
+        best = pd.DataFrame({'row': row_index, 'col': col_index, 'score': scores})
+        best = best.groupby(['row', 'col'], sort=False)['score'].max().reset_index()
+        values = sparse.csr_matrix((best['score'], (best['row'], best['col'])), shape=values.shape)
+    return EnrichmentMatrix(values, rows, terms)
+
+
+def cluster_order(values):
+    """
+    Order of the rows of a sparse matrix by average linkage clustering of
+    their cosine distances (empty rows are as far as possible from the rest)
+    """
+    n_rows = values.shape[0]
+    if n_rows < 3:
+        return np.arange(n_rows)
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    values = sparse.csr_matrix(values, dtype=np.float64)
+    norms = np.sqrt(np.asarray(values.multiply(values).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    unit = sparse.diags(1.0 / norms) @ values
+    distances = 1.0 - (unit @ unit.T).toarray()
+    np.fill_diagonal(distances, 0.0)
+    distances = np.clip((distances + distances.T) / 2, 0.0, 1.0)
+    return leaves_list(linkage(squareform(distances, checks=False), method='average'))
+
+
+def top_terms(values, max_terms=50):
+    """
+    Columns of the `max_terms` terms enriched in most gene lists (and then
+    with the highest score)
+    """
+    counts = values.getnnz(axis=0)
+    best = values.max(axis=0).toarray().ravel()
+    ranking = np.lexsort((-best, -counts))
+    return np.sort(ranking[:max_terms])
+
+
+def draw_heatmaps(matrix, folder, max_terms=50, workers=None, svg=False):
+    """
+    Draws a heatmap per category of an EnrichmentMatrix, with the
+    `max_terms` terms enriched in most gene lists and the gene lists with
+    any of them, ordered by clustering. The heatmaps are drawn in parallel
+    (`workers` processes, one per core by default), and with svg also
+    saved as svg files (e.g. for the report). Returns the paths of the pdf
+    files
+    """
+    from stringdb_analyser.plots import render_heatmaps
+
+    os.makedirs(folder, exist_ok=True)
+    jobs = []
+    for category in matrix.terms['category'].unique():
+        sub_matrix = matrix.category(category)
+        columns = top_terms(sub_matrix.values.tocsc(), max_terms=max_terms)
+        shown = sub_matrix.values[:, columns]
+        rows = np.flatnonzero(shown.getnnz(axis=1))
+        if len(rows) == 0:
+            continue
+        # the gene lists are clustered on all the terms of the category
+        rows = rows[cluster_order(sub_matrix.values[rows])]
+        columns = columns[cluster_order(shown[rows].T.tocsr())]
+        terms = sub_matrix.terms.iloc[columns]
+        col_labels = [description if len(description) <= 50 else description[:47] + '...'
+                      for description in terms['description'].fillna(terms['term'])]
+        row_labels = [sub_matrix.row_labels[row] for row in rows]
+        jobs.append(dict(path=os.path.join(folder, f'{category}_heatmap.pdf'),
+                         values=sub_matrix.values[rows][:, columns].toarray(),
+                         row_labels=row_labels, col_labels=col_labels, category=category, svg=svg))
+    print(f'Drawing {len(jobs)} heatmaps in {folder}')
+    return render_heatmaps(jobs, workers=workers)
@@ -0,0 +1,338 @@
+"""Local index of the STRING interaction network of a species.
+
+A species' protein.links file (e.g. 511145.protein.links.v11.5.txt.gz) is
+converted once into a compressed sparse row (CSR) adjacency:
+
+    nodes.txt     STRING identifier of every node, in index order
+    names.txt     preferred name of every node (if a protein.info file is given)
+    indptr.npy    int64, neighbours of node i are in [indptr[i], indptr[i + 1])
+    indices.npy   int32, index of every neighbour
+    scores.npy    uint16, combined score (0-1000) of every link
+    meta.json     species, source file and sizes
+
+The arrays are opened with numpy memory maps, so extracting the network
+of a gene list only reads the adjacency of the query genes from disk.
+
+Build an index from the command line with:
+
+    python -m stringdb_analyser.network 511145.protein.links.v11.5.txt.gz ecoli_index
+"""
+
+import argparse
+import io
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+# columns of the tsv/network endpoint that can be computed from the index
+EDGE_COLUMNS = ['stringId_A', 'stringId_B', 'preferredName_A', 'preferredName_B',
+                'ncbiTaxonId', 'score']
+
+
+def _read_links(path, chunk_size):
+    # the links files are space separated with a header, gzipped or not
+    return pd.read_csv(path, sep=' ', header=0, usecols=[0, 1, 2],
+                       names=['protein1', 'protein2', 'combined_score'],
+                       dtype={'protein1': str, 'protein2': str, 'combined_score': np.uint16},
+                       chunksize=chunk_size)
+
+
+def build_network_index(links_path, out_dir, info_path=None, chunk_size=2_000_000):
+    """
+    Converts a STRING protein.links file into a CSR index in out_dir.
+    The file is read twice in chunks (degrees first, then the links), so the
+    memory used does not depend on the size of the network.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    # first pass: nodes and number of links of every node
+    degrees = pd.Series(dtype=np.int64)
+    for chunk in _read_links(links_path, chunk_size):
+        counts = chunk['protein1'].value_counts()
+        degrees = degrees.add(counts, fill_value=0)
+        missing = pd.Index(chunk['protein2'].unique()).difference(degrees.index)
+        degrees = pd.concat([degrees, pd.Series(0, index=missing)])
+    degrees = degrees.sort_index().astype(np.int64)
+    nodes = degrees.index
+
+    indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+    np.cumsum(degrees.to_numpy(), out=indptr[1:])
+    n_links = int(indptr[-1])
+
+    indices = np.lib.format.open_memmap(os.path.join(out_dir, 'indices.npy'), mode='w+',
+                                        dtype=np.int32, shape=(n_links,))
+    scores = np.lib.format.open_memmap(os.path.join(out_dir, 'scores.npy'), mode='w+',
+                                       dtype=np.uint16, shape=(n_links,))
+
+    # second pass: write every link at the next free position of its row
+    cursor = indptr[:-1].copy()
+    for chunk in _read_links(links_path, chunk_size):
+        source = nodes.get_indexer(chunk['protein1'])
+        target = nodes.get_indexer(chunk['protein2'])
+        order = np.argsort(source, kind='stable')
+        source = source[order]
+        group_start = np.r_[0, np.flatnonzero(source[1:] != source[:-1]) + 1]
+        rank = np.arange(source.size) - np.repeat(group_start, np.diff(np.r_[group_start, source.size]))
+        positions = cursor[source] + rank
+        indices[positions] = target[order]
+        scores[positions] = chunk['combined_score'].to_numpy()[order]
+        cursor += np.bincount(source, minlength=len(nodes))
+    indices.flush()
+    scores.flush()
+    del indices, scores
+
+    np.save(os.path.join(out_dir, 'indptr.npy'), indptr)
+    with open(os.path.join(out_dir, 'nodes.txt'), 'w') as fh_nodes:
+        fh_nodes.write('\n'.join(nodes) + '\n')
+
+    if info_path is not None:
+        info = pd.read_csv(info_path, sep='\t', header=0, usecols=[0, 1],
+                           names=['protein', 'preferred_name'], dtype=str)
+        names = info.set_index('protein')['preferred_name'].reindex(nodes)
+        names = names.fillna(pd.Series(nodes, index=nodes))
+        with open(os.path.join(out_dir, 'names.txt'), 'w') as fh_names:
+            fh_names.write('\n'.join(names) + '\n')
+
+    species = nodes[0].split('.', 1)[0] if len(nodes) else None
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as fh_meta:
+        json.dump({'species': species, 'source': os.path.basename(links_path),
+                   'nodes': len(nodes), 'links': n_links}, fh_meta, indent=2)
+    print(f'Network index with {len(nodes)} nodes and {n_links} links saved in {out_dir}')
+
+
+class NetworkIndex:
+    """
+    Read-only access to a network index built with build_network_index
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'meta.json')) as fh_meta:
+            self.meta = json.load(fh_meta)
+        self.species = self.meta['species']
+        self.indptr = np.load(os.path.join(directory, 'indptr.npy'), mmap_mode='r')
+        self.indices = np.load(os.path.join(directory, 'indices.npy'), mmap_mode='r')
+        self.scores = np.load(os.path.join(directory, 'scores.npy'), mmap_mode='r')
+
+        with open(os.path.join(directory, 'nodes.txt')) as fh_nodes:
+            self.nodes = np.array(fh_nodes.read().split('\n')[:-1], dtype=object)
+        names_path = os.path.join(directory, 'names.txt')
+        if os.path.exists(names_path):
+            with open(names_path) as fh_names:
+                self.names = np.array(fh_names.read().split('\n')[:-1], dtype=object)
+        else:
+            self.names = np.array([node.split('.', 1)[-1] for node in self.nodes], dtype=object)
+
+        # input identifiers can be STRING ids or (case-insensitive) preferred names
+        self.lookup = {name.lower(): index for index, name in enumerate(self.names)}
+        self.lookup.update({node: index for index, node in enumerate(self.nodes)})
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def node_indices(self, genes):
+        """
+        Returns the sorted unique node indices of a gene list, ignoring unknown genes
+        """
+        indices = set()
+        for gene in genes:
+            gene = str(gene).strip()
+            index = self.lookup.get(gene)
+            if index is None:
+                index = self.lookup.get(gene.lower())
+            if index is not None:
+                indices.add(index)
+        return np.array(sorted(indices), dtype=np.int64)
+
+    def neighbours(self, nodes):
+        """
+        Returns (source, target, score) arrays with every link of the given
+        node indices, reading only their rows of the adjacency
+        """
+        nodes = np.asarray(nodes, dtype=np.int64)
+        starts = np.asarray(self.indptr[nodes])
+        lengths = np.asarray(self.indptr[nodes + 1]) - starts
+        offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+        positions = np.repeat(starts - offsets, lengths) + np.arange(lengths.sum())
+        return (np.repeat(nodes, lengths),
+                np.asarray(self.indices[positions], dtype=np.int64),
+                np.asarray(self.scores[positions]))
+
+    def subnetwork_indices(self, nodes, min_score=400):
+        """
+        Links between the given node indices with a combined score of at least
+        min_score (0-1000), as (node_a, node_b, score) arrays with node_a < node_b
+        """
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        source, target, score = self.neighbours(nodes)
+        keep = (score >= min_score) & np.isin(target, nodes) & (source != target)
+        node_a = np.minimum(source[keep], target[keep])
+        node_b = np.maximum(source[keep], target[keep])
+        score = score[keep]
+        # every link is stored in both directions, keep it once
+        pair = node_a * len(self.nodes) + node_b
+        pair, first = np.unique(pair, return_index=True)
+        return node_a[first], node_b[first], score[first]
+
+    def subnetwork(self, genes, min_score=400):
+        """
+        Induced network of a gene list, as a DataFrame with the same first
+        columns as the tsv/network endpoint of STRING (score from 0 to 1)
+        """
+        node_a, node_b, score = self.subnetwork_indices(self.node_indices(genes), min_score)
+        return pd.DataFrame({
+            'stringId_A': self.nodes[node_a],
+            'stringId_B': self.nodes[node_b],
+            'preferredName_A': self.names[node_a],
+            'preferredName_B': self.names[node_b],
+            'ncbiTaxonId': self.species,
+            'score': score / 1000,
+        }, columns=EDGE_COLUMNS)
+
+
+_LOADED = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def load_network_index(directory):
+    """
+    Returns the NetworkIndex of a folder, opening it only once
+    """
+    key = os.path.abspath(directory)
+    with _LOADED_LOCK:
+        if key not in _LOADED:
+            _LOADED[key] = NetworkIndex(directory)
+        return _LOADED[key]
+
+
+def _fetch_edges(genes, species, client, min_score, string_api_url):
+    params = {
+        "identifiers": "\r".join(genes),
+        "species": species,
+        "required_score": min_score,
+        "caller_identity": "www.awesome_app.org"
+    }
+    content = client.post(string_api_url, "tsv", "network", params, genes)
+    if not content.strip():
+        return pd.DataFrame(columns=EDGE_COLUMNS)
+    return pd.read_csv(io.BytesIO(content), sep='\t')
+
+
+def _unique_edges(edges):
+    """
+    The interactions of a table without duplicates (the same pair of
+    proteins in any order, A-B or B-A)
+    """
+    if edges.empty:
+        return edges.reset_index(drop=True)
+    # every pair as (lowest, highest) identifier
+    pairs = np.sort(edges[['stringId_A', 'stringId_B']].to_numpy(dtype=str), axis=1)
+    duplicated = pd.DataFrame(pairs).duplicated().to_numpy()
+    return edges[~duplicated].reset_index(drop=True)
+
+
+def _edge_chunks(edges, side, chunk_of):
+    """
+    Chunk of the query of the protein A or B (`side`) of every interaction,
+    found by its STRING identifier, preferred name or locus (the queries
+    can have any of them), or NaN if none of them was in the query
+    """
+    chunks = np.full(len(edges), np.nan)
+    ids = edges[f'stringId_{side}'].astype(str)
+    names = [ids, ids.str.split('.', n=1).str[-1]]
+    if f'preferredName_{side}' in edges:
+        names.insert(1, edges[f'preferredName_{side}'].astype(str))
+    for name in names:
+        missing = np.isnan(chunks)
+        if not missing.any():
+            break
+        chunks[missing] = chunk_of.reindex(name[missing].str.strip().str.casefold()).to_numpy(dtype=float)
+    return chunks
+
+
+def chunk_queries(genes, chunk_size):
+    """
+    Splits a gene list into chunks of half `chunk_size` genes, and returns
+    the queries covering all the possible interactions as (query, chunks)
+    pairs: every pair of chunks (so no query has more than chunk_size
+    genes), or the whole list if it fits in a single request. `chunks`
+    are the chunks whose inner interactions are kept from that query, as
+    the same ones are returned by every query of the chunk
+    """
+    if len(genes) <= chunk_size:
+        return [(list(genes), None)]
+    half = max(1, chunk_size // 2)
+    chunks = [genes[start:start + half] for start in range(0, len(genes), half)]
+    last = len(chunks) - 1
+    queries = []
+    for first in range(len(chunks)):
+        for second in range(first + 1, len(chunks)):
+            # the inner interactions of every chunk come from one query only:
+            # the one with the next chunk (the previous one for the last chunk)
+            inner = []
+            if second == first + 1:
+                inner = [first, second] if second == last else [first]
+            queries.append((chunks[first] + chunks[second], inner))
+    return queries
+
+
+def fetch_network_edges(genes, species, client, min_score=400,
+                        string_api_url="https://version-11-5.string-db.org/api",
+                        chunk_size=None, workers=4):
+    """
+    Gets the interactions between the genes of a list from the tsv/network
+    endpoint of STRING (through a StringClient, so the response is cached).
+    Lists longer than `chunk_size` genes are split into chunks of half of
+    it, and the interactions within and between every pair of chunks are
+    fetched concurrently (`workers` requests at a time), so no request has
+    more than chunk_size genes and every interaction is kept from a single
+    response.
+    """
+    genes = list(dict.fromkeys(genes))
+    queries = chunk_queries(genes, chunk_size) if chunk_size else [(genes, None)]
+    if len(queries) <= 1:
+        # the same interaction can be returned twice (A-B and B-A)
+        return _unique_edges(_fetch_edges(genes, species, client, min_score, string_api_url))
+
+    print(f'Getting the network of {len(genes)} genes in {len(queries)} requests')
+    half = max(1, chunk_size // 2)
+    # chunk of every name of the list, whatever its case
+    chunk_of = pd.Series(np.arange(len(genes)) // half, index=[str(gene).strip().casefold() for gene in genes])
+    chunk_of = chunk_of[~chunk_of.index.duplicated()]
+    merged = pd.DataFrame(columns=EDGE_COLUMNS)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_fetch_edges, query, species, client, min_score, string_api_url): inner
+                   for query, inner in queries}
+        for future in as_completed(futures):
+            edges = future.result()
+            chunk_a = _edge_chunks(edges, 'A', chunk_of)
+            chunk_b = _edge_chunks(edges, 'B', chunk_of)
+            # the interactions between the two chunks, and within the chunks of this query
+            # (the ones of proteins that cannot be placed are kept, then de-duplicated)
+            keep = (chunk_a != chunk_b) | np.isin(chunk_a, futures[future])
+            # merged as they arrive, so only the unique interactions are held
+            merged = _unique_edges(pd.concat([merged, edges[keep]], ignore_index=True)) if keep.any() else merged
+    return merged
+
+
+def main():
+    """
+    Command line entry point to build a network index
+    """
+    parser = argparse.ArgumentParser(
+        prog='stringdb_analyser.network',
+        description='Build a local index of a STRING protein.links file')
+    parser.add_argument('links', type=str, help='protein.links file of a species (gzipped or not)')
+    parser.add_argument('out_dir', type=str, help='output folder of the index')
+    parser.add_argument('--info', type=str, default=None,
+                        help='protein.info file of the species, to use gene names')
+    args = parser.parse_args()
+    build_network_index(args.links, args.out_dir, info_path=args.info)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,203 @@
+"""Offline functional enrichment over the STRING annotation flat files.
+
+The files are the ones from the STRING download page for a species, e.g.
+511145.protein.enrichment.terms.v11.5.txt.gz (required) and
+511145.protein.info.v11.5.txt.gz (optional, gives the preferred names).
+"""
+
+import glob
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+# category names of the flat files -> category names returned by the API
+CATEGORY_NAMES = {
+    'Biological Process (Gene Ontology)': 'Process',
+    'Molecular Function (Gene Ontology)': 'Function',
+    'Cellular Component (Gene Ontology)': 'Component',
+    'Reference publications (PubMed)': 'PMID',
+    'Local network cluster (STRING)': 'NetworkNeighborAL',
+    'KEGG Pathways': 'KEGG',
+    'Reactome Pathways': 'RCTM',
+    'WikiPathways': 'WikiPathways',
+    'Annotated Keywords (UniProt)': 'Keyword',
+    'Protein Domains (Pfam)': 'Pfam',
+    'Protein Domains and Features (InterPro)': 'InterPro',
+    'Protein Domains (SMART)': 'SMART',
+    'Subcellular localization (COMPARTMENTS)': 'COMPARTMENTS',
+    'Tissue expression (TISSUES)': 'TISSUES',
+    'Disease-gene associations (DISEASES)': 'DISEASES',
+    'Human Phenotype (Monarch)': 'HPO',
+}
+
+# same columns (and order) as the json/enrichment endpoint
+ENRICHMENT_COLUMNS = ['category', 'term', 'number_of_genes', 'number_of_genes_in_background',
+                      'ncbiTaxonId', 'inputGenes', 'preferredNames', 'p_value', 'fdr',
+                      'description']
+
+
+def find_species_file(directory, species, kind):
+    """
+    Returns the path of a STRING flat file of a species (e.g. kind
+    'protein.enrichment.terms'), gzipped or not, or None if missing
+    """
+    paths = sorted(glob.glob(os.path.join(directory, f'{species}.{kind}*.txt*')))
+    return paths[-1] if paths else None
+
+
+def benjamini_hochberg(p_values, groups):
+    """
+    Benjamini-Hochberg FDR of an array of p-values, computed
+    independently within each group (e.g. each category)
+    """
+    p_values = np.asarray(p_values, dtype=float)
+    groups = np.asarray(groups)
+    if p_values.size == 0:
+        return p_values
+    # sort by group, then by p-value
+    order = np.lexsort((p_values, groups))
+    sorted_groups = groups[order]
+    sorted_p = p_values[order]
+    starts = np.r_[0, np.flatnonzero(sorted_groups[1:] != sorted_groups[:-1]) + 1]
+    sizes = np.diff(np.r_[starts, sorted_groups.size])
+    group_start = np.repeat(starts, sizes)
+    group_size = np.repeat(sizes, sizes)
+    rank = np.arange(sorted_p.size) - group_start + 1
+    adjusted = sorted_p * group_size / rank
+    # cumulative minimum from the largest p-value of each group
+    adjusted = pd.Series(adjusted[::-1]).groupby(sorted_groups[::-1]).cummin().to_numpy()[::-1]
+    fdr = np.empty_like(adjusted)
+    fdr[order] = np.minimum(adjusted, 1.0)
+    return fdr
+
+
+class OfflineEnrichment:
+    """
+    Over-representation analysis for a species, computed locally.
+    The annotation files are loaded once into integer arrays (one row per
+    protein-term pair, sorted by term) so every gene set only needs a
+    couple of vectorised passes: hypergeometric p-values for every term
+    with at least one input gene, and Benjamini-Hochberg FDR per category.
+    """
+
+    def __init__(self, directory, species):
+        terms_path = find_species_file(directory, species, 'protein.enrichment.terms')
+        if terms_path is None:
+            raise FileNotFoundError(f'No {species}.protein.enrichment.terms file found in {directory}')
+        self.species = species
+
+        annotations = pd.read_csv(terms_path, sep='\t', header=0,
+                                  names=['protein', 'category', 'term', 'description'],
+                                  dtype=str)
+
+        # background: every protein of the species
+        info_path = find_species_file(directory, species, 'protein.info')
+        if info_path is not None:
+            info = pd.read_csv(info_path, sep='\t', header=0, usecols=[0, 1],
+                               names=['protein', 'preferred_name'], dtype=str)
+            proteins = pd.Index(pd.unique(pd.concat([info['protein'], annotations['protein']])))
+            names = info.set_index('protein')['preferred_name'].reindex(proteins)
+        else:
+            proteins = pd.Index(pd.unique(annotations['protein']))
+            names = pd.Series(proteins.str.split('.', n=1).str[-1], index=proteins)
+        self.proteins = proteins
+        self.preferred_names = names.fillna(pd.Series(proteins, index=proteins)).to_numpy()
+
+        # lookup of input identifiers: STRING ids and (case-insensitive) preferred names
+        self.lookup = {name.lower(): index for index, name in enumerate(self.preferred_names)}
+        self.lookup.update({protein: index for index, protein in enumerate(proteins)})
+
+        # terms, and protein-term pairs sorted by term
+        term_keys = annotations['category'] + '\t' + annotations['term']
+        term_codes, term_index = pd.factorize(term_keys)
+        first = pd.Series(np.arange(len(term_codes))).groupby(term_codes).first().to_numpy()
+        categories = annotations['category'].to_numpy()[first]
+        self.term_category = np.array([CATEGORY_NAMES.get(cat, cat) for cat in categories])
+        self.term_id = annotations['term'].to_numpy()[first]
+        self.term_description = annotations['description'].to_numpy()[first]
+
+        order = np.argsort(term_codes, kind='stable')
+        self.member_term = term_codes[order].astype(np.int32)
+        self.member_protein = proteins.get_indexer(annotations['protein'].to_numpy()[order]).astype(np.int32)
+        self.term_size = np.bincount(self.member_term, minlength=len(term_index))
+        self.n_terms = len(term_index)
+
+    def gene_indices(self, genes):
+        """
+        Returns the (unique) background indices of a gene list, ignoring unknown genes
+        """
+        indices = set()
+        for gene in genes:
+            gene = str(gene).strip()
+            index = self.lookup.get(gene)
+            if index is None:
+                index = self.lookup.get(gene.lower())
+            if index is not None:
+                indices.add(index)
+        return np.array(sorted(indices), dtype=np.int64)
+
+    def enrich(self, genes, fdr_threshold=0.05):
+        """
+        Functional enrichment of a gene list. Returns a DataFrame with the
+        same columns as the STRING API, keeping the terms below fdr_threshold
+        """
+        from scipy.stats import hypergeom
+
+        selected = self.gene_indices(genes)
+        if selected.size == 0:
+            return pd.DataFrame(columns=ENRICHMENT_COLUMNS)
+
+        in_set = np.zeros(len(self.proteins), dtype=bool)
+        in_set[selected] = True
+        hits = in_set[self.member_protein]
+        counts = np.bincount(self.member_term[hits], minlength=self.n_terms)
+
+        tested = np.flatnonzero(counts > 0)
+        p_values = hypergeom.sf(counts[tested] - 1, len(self.proteins),
+                                self.term_size[tested], selected.size)
+        fdr = benjamini_hochberg(p_values, self.term_category[tested])
+
+        keep = fdr < fdr_threshold
+        terms = tested[keep]
+        if terms.size == 0:
+            return pd.DataFrame(columns=ENRICHMENT_COLUMNS)
+
+        # input genes of the significant terms (pairs are already sorted by term)
+        hit_terms = self.member_term[hits]
+        hit_proteins = self.member_protein[hits]
+        bounds = np.searchsorted(hit_terms, np.stack([terms, terms + 1]))
+        input_genes = [self.proteins[hit_proteins[start:end]].tolist() for start, end in bounds.T]
+        preferred = [self.preferred_names[hit_proteins[start:end]].tolist() for start, end in bounds.T]
+
+        result = pd.DataFrame({
+            'category': self.term_category[terms],
+            'term': self.term_id[terms],
+            'number_of_genes': counts[terms],
+            'number_of_genes_in_background': self.term_size[terms],
+            'ncbiTaxonId': self.species,
+            'inputGenes': input_genes,
+            'preferredNames': preferred,
+            'p_value': p_values[keep],
+            'fdr': fdr[keep],
+            'description': self.term_description[terms],
+        }, columns=ENRICHMENT_COLUMNS)
+        result = result.sort_values(['category', 'p_value'], kind='stable')
+        return result.reset_index(drop=True)
+
+
+_LOADED = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def load_offline_enrichment(directory, species):
+    """
+    Returns the OfflineEnrichment of a species, loading its files only once
+    """
+    key = (os.path.abspath(directory), species)
+    with _LOADED_LOCK:
+        if key not in _LOADED:
+            print(f'Loading the STRING annotation files of species {species} from {directory}\n')
+            _LOADED[key] = OfflineEnrichment(directory, species)
+        return _LOADED[key]
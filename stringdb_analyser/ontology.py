@@ -0,0 +1,363 @@
+"""Gene Ontology index and concept-level summaries of enriched GO terms.
+
+The GO graph (go-basic.obo, from the Gene Ontology downloads page) is
+converted once into a folder of arrays:
+
+    terms.txt         GO identifier of every term, in index order
+    names.txt         name of every term
+    namespace.npy     int8, namespace of every term (see NAMESPACES)
+    anc_indptr.npy    int64, ancestors of term i are in [anc_indptr[i], anc_indptr[i + 1])
+    anc_indices.npy   int32, index of every ancestor (the term itself included)
+    ic.npy            float32, information content of every term
+    alt_ids.json      alternative identifiers of the terms
+    meta.json         source files and sizes
+
+The information content comes from the number of proteins annotated to
+every term (and its descendants) if a STRING protein.enrichment.terms
+file is given, or from the number of descendants of every term otherwise.
+
+Enriched GO terms are then grouped into concepts: terms are clustered by
+their Lin semantic similarity (computed for all the pairs at once from
+the ancestor arrays) and every cluster is named after the most specific
+ancestor shared by all its terms, so e.g. "amino acid biosynthetic
+process" and "arginine biosynthesis" count as the same concept.
+
+Build an index from the command line with:
+
+    python -m stringdb_analyser.ontology go-basic.obo go_index --terms 511145.protein.enrichment.terms.v11.5.txt.gz
+"""
+
+import argparse
+import gzip
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from stringdb_analyser.words import word_table
+
+NAMESPACES = ('biological_process', 'molecular_function', 'cellular_component')
+# enrichment categories of the GO namespaces
+GO_CATEGORIES = {'Process': 0, 'Function': 1, 'Component': 2}
+# relations followed to get the ancestors of a term
+RELATIONS = ('is_a', 'part_of')
+
+# number of leading zero bits of every byte, to find the first common ancestor
+_LEADING_ZEROS = np.array([8 - int(value).bit_length() for value in range(256)], dtype=np.int64)
+
+
+def parse_obo(path):
+    """
+    Reads the terms of an OBO file (gzipped or not), skipping the obsolete
+    ones. Returns a list of dictionaries with id, name, namespace, parents
+    and alternative ids
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    terms = []
+    term = None
+    with opener(path, 'rt', encoding='utf-8') as fh_obo:
+        for line in fh_obo:
+            line = line.strip()
+            if line.startswith('['):
+                if term is not None and not term.get('obsolete'):
+                    terms.append(term)
+                term = {'parents': [], 'alt_ids': []} if line == '[Term]' else None
+                continue
+            if term is None or ': ' not in line:
+                continue
+            tag, value = line.split(': ', 1)
+            value = value.split(' ! ', 1)[0].strip()
+            if tag in ('id', 'name', 'namespace'):
+                term[tag] = value
+            elif tag == 'alt_id':
+                term['alt_ids'].append(value)
+            elif tag == 'is_a':
+                term['parents'].append(value.split()[0])
+            elif tag == 'relationship' and value.split()[0] in RELATIONS:
+                term['parents'].append(value.split()[1])
+            elif tag == 'is_obsolete' and value == 'true':
+                term['obsolete'] = True
+    if term is not None and not term.get('obsolete'):
+        terms.append(term)
+    return terms
+
+
+def _expand(indptr, indices, rows):
+    """
+    Gathers the CSR entries of some rows: returns the position of the row
+    of every entry (in `rows`) and the entries
+    """
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    owners = np.repeat(np.arange(len(rows)), counts)
+    # exclusive cumulative sum of the counts gives the first output position of every row
+    offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+    return owners, indices[offsets + np.arange(counts.sum())]
+
+
+def _ancestors(parents):
+    """
+    Ancestors (the term included) of every term, from the parent lists
+    """
+    ancestors = {}
+    for start in range(len(parents)):
+        if start in ancestors:
+            continue
+        # iterative depth-first walk, so deep ontologies do not hit the recursion limit
+        stack = [(start, False)]
+        while stack:
+            node, ready = stack.pop()
+            if node in ancestors:
+                continue
+            if ready:
+                found = {node}
+                for parent in parents[node]:
+                    found |= ancestors[parent]
+                ancestors[node] = found
+                continue
+            stack.append((node, True))
+            stack.extend((parent, False) for parent in parents[node] if parent not in ancestors)
+    return [np.array(sorted(ancestors[node]), dtype=np.int32) for node in range(len(parents))]
+
+
+def build_ontology_index(obo_path, out_dir, terms_path=None):
+    """
+    Converts an OBO file into the array index described in the module
+    docstring, with the information content from a STRING
+    protein.enrichment.terms file if given
+    """
+    terms = parse_obo(obo_path)
+    ids = [term['id'] for term in terms]
+    position = {term_id: index for index, term_id in enumerate(ids)}
+    parents = [[position[parent] for parent in term['parents'] if parent in position] for term in terms]
+    namespace = np.array([NAMESPACES.index(term.get('namespace', NAMESPACES[0])) for term in terms],
+                         dtype=np.int8)
+    print(f'Computing the ancestors of {len(ids)} terms')
+    ancestors = _ancestors(parents)
+    anc_indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+    anc_indptr[1:] = np.cumsum([len(found) for found in ancestors])
+    anc_indices = np.concatenate(ancestors) if ancestors else np.zeros(0, dtype=np.int32)
+
+    if terms_path is not None:
+        # proteins annotated to every term or any of its descendants
+        annotations = pd.read_csv(terms_path, sep='\t', header=0, usecols=[0, 2],
+                                  names=['protein', 'term'], dtype=str)
+        annotations = annotations[annotations['term'].isin(position)]
+        protein_codes = pd.factorize(annotations['protein'])[0]
+        term_codes = annotations['term'].map(position).to_numpy(dtype=np.int64)
+        owners, annotated = _expand(anc_indptr, anc_indices, term_codes)
+        pairs = pd.DataFrame({'protein': protein_codes[owners], 'term': annotated}).drop_duplicates()
+        frequency = np.bincount(pairs['term'].to_numpy(), minlength=len(ids)).astype(float)
+        source = os.path.basename(terms_path)
+    else:
+        # number of descendants of every term (the term included)
+        frequency = np.bincount(anc_indices, minlength=len(ids)).astype(float)
+        source = 'descendants'
+
+    # relative to the most frequent term (the root) of every namespace
+    ic = np.zeros(len(ids), dtype=np.float32)
+    for code in range(len(NAMESPACES)):
+        members = namespace == code
+        if not members.any():
+            continue
+        total = frequency[members].max()
+        # terms without annotations get the highest information content
+        freq = np.where(frequency[members] > 0, frequency[members], 1.0)
+        ic[members] = -np.log(freq / max(total, 1.0))
+
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, 'terms.txt'), 'w') as fh_terms:
+        fh_terms.write('\n'.join(ids) + '\n')
+    with open(os.path.join(out_dir, 'names.txt'), 'w') as fh_names:
+        fh_names.write('\n'.join(term.get('name', term['id']) for term in terms) + '\n')
+    with open(os.path.join(out_dir, 'alt_ids.json'), 'w') as fh_alt:
+        json.dump({alt_id: term['id'] for term in terms for alt_id in term['alt_ids']}, fh_alt)
+    np.save(os.path.join(out_dir, 'namespace.npy'), namespace)
+    np.save(os.path.join(out_dir, 'anc_indptr.npy'), anc_indptr)
+    np.save(os.path.join(out_dir, 'anc_indices.npy'), anc_indices.astype(np.int32))
+    np.save(os.path.join(out_dir, 'ic.npy'), ic)
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as fh_meta:
+        json.dump({'source': os.path.basename(obo_path), 'information_content': source,
+                   'terms': len(ids), 'ancestors': int(len(anc_indices))}, fh_meta)
+    print(f'Ontology index with {len(ids)} terms saved in {out_dir}')
+    return out_dir
+
+
+class OntologyIndex:
+    """
+    Read access to an ontology index built with build_ontology_index
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(os.path.join(directory, 'terms.txt')) as fh_terms:
+            self.terms = [line.rstrip('\n') for line in fh_terms if line.strip()]
+        with open(os.path.join(directory, 'names.txt')) as fh_names:
+            self.names = [line.rstrip('\n') for line in fh_names][:len(self.terms)]
+        self.position = {term_id: index for index, term_id in enumerate(self.terms)}
+        alt_path = os.path.join(directory, 'alt_ids.json')
+        if os.path.exists(alt_path):
+            with open(alt_path) as fh_alt:
+                for alt_id, term_id in json.load(fh_alt).items():
+                    if term_id in self.position:
+                        self.position.setdefault(alt_id, self.position[term_id])
+        self.namespace = np.load(os.path.join(directory, 'namespace.npy'))
+        self.anc_indptr = np.load(os.path.join(directory, 'anc_indptr.npy'))
+        self.anc_indices = np.load(os.path.join(directory, 'anc_indices.npy'))
+        self.ic = np.load(os.path.join(directory, 'ic.npy')).astype(float)
+
+    def term_indices(self, term_ids):
+        """
+        Index of every GO identifier, -1 for unknown ones
+        """
+        return np.array([self.position.get(term_id, -1) for term_id in term_ids], dtype=np.int64)
+
+    def ancestor_matrix(self, indices):
+        """
+        Boolean matrix of the ancestors of some terms (one row per term),
+        with the columns (ancestor indices) sorted by decreasing information content
+        """
+        rows, ancestors = _expand(self.anc_indptr, self.anc_indices, np.asarray(indices, dtype=np.int64))
+        columns, column_codes = np.unique(ancestors, return_inverse=True)
+        order = np.argsort(-self.ic[columns], kind='stable')
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+        matrix = np.zeros((len(indices), len(columns)), dtype=bool)
+        matrix[rows, rank[column_codes]] = True
+        return matrix, columns[order]
+
+    def similarity(self, indices, block=64):
+        """
+        Lin similarity between all the pairs of terms: twice the
+        information content of their most informative common ancestor,
+        divided by the sum of their information contents
+        """
+        indices = np.asarray(indices, dtype=np.int64)
+        matrix, columns = self.ancestor_matrix(indices)
+        column_ic = self.ic[columns]
+        # with the columns sorted by information content, the most
+        # informative common ancestor is the first common bit
+        packed = np.packbits(matrix, axis=1)
+        mica = np.zeros((len(indices), len(indices)))
+        for start in range(0, len(indices), block):
+            common = packed[start:start + block, None, :] & packed[None, :, :]
+            nonzero = common != 0
+            first = nonzero.argmax(axis=2)
+            byte = np.take_along_axis(common, first[..., None], axis=2)[..., 0]
+            column = np.minimum(first * 8 + _LEADING_ZEROS[byte], len(columns) - 1)
+            mica[start:start + block] = np.where(nonzero.any(axis=2), column_ic[column], 0.0)
+        term_ic = self.ic[indices]
+        total = term_ic[:, None] + term_ic[None, :]
+        similarity = np.divide(2 * mica, total, out=np.zeros_like(mica), where=total > 0)
+        np.fill_diagonal(similarity, 1.0)
+        return similarity
+
+    def group_terms(self, term_ids, fdr=None, min_similarity=0.5):
+        """
+        Groups GO terms into concepts. Returns the concept name of every
+        term: the most specific ancestor shared by all the terms of its
+        cluster (or the most significant term of the cluster, if they only
+        share the root of the ontology). Unknown terms are their own concept.
+        """
+        from scipy.cluster.hierarchy import fcluster, linkage
+        from scipy.spatial.distance import squareform
+
+        indices = self.term_indices(term_ids)
+        concepts = np.array([None] * len(term_ids), dtype=object)
+        known = np.flatnonzero(indices >= 0)
+        if len(known) == 0:
+            return concepts
+        fdr = np.zeros(len(term_ids)) if fdr is None else np.asarray(fdr, dtype=float)
+        unique, inverse = np.unique(indices[known], return_inverse=True)
+        if len(unique) == 1:
+            clusters = np.zeros(1, dtype=np.int64)
+        else:
+            distance = 1.0 - self.similarity(unique)
+            np.fill_diagonal(distance, 0.0)
+            tree = linkage(squareform(np.clip(distance, 0.0, 1.0), checks=False), method='average')
+            clusters = fcluster(tree, t=1.0 - min_similarity, criterion='distance')
+
+        matrix, columns = self.ancestor_matrix(unique)
+        names = {}
+        for cluster in np.unique(clusters):
+            members = np.flatnonzero(clusters == cluster)
+            shared = np.flatnonzero(matrix[members].all(axis=0))
+            if len(shared) and self.ic[columns[shared[0]]] > 0:
+                names[cluster] = self.names[columns[shared[0]]]
+            else:
+                # the most significant term of the cluster
+                member_fdr = pd.Series(fdr[known]).groupby(inverse).min().to_numpy()[members]
+                names[cluster] = self.names[unique[members[member_fdr.argmin()]]]
+        concepts[known] = [names[cluster] for cluster in clusters[inverse]]
+        return concepts
+
+
+def concept_table(df, ontology, nconcepts=10, keys=None, min_similarity=0.5):
+    """
+    Like word_table, but the GO categories (Process, Function, Component)
+    are summarised as concepts (see OntologyIndex.group_terms) instead of
+    words: for every category (and direction), the `nconcepts` concepts
+    with the most enriched terms. The other categories are counted as words.
+    Returns the same columns as word_table (the concepts in `word`).
+    """
+    if keys is None:
+        keys = [column for column in ('direction', 'category') if column in df]
+    keys = list(keys)
+    columns = keys + ['word', 'count', 'relative']
+    if df.empty or 'term' not in df:
+        return word_table(df, nwords=nconcepts, keys=keys)
+
+    is_go = df['category'].isin(list(GO_CATEGORIES))
+    tops = [word_table(df[~is_go], nwords=nconcepts, keys=keys)]
+    for _, group in df[is_go].groupby(keys, sort=False):
+        concepts = ontology.group_terms(group['term'].tolist(),
+                                        fdr=group['fdr'] if 'fdr' in group else None,
+                                        min_similarity=min_similarity)
+        # unknown terms keep their description
+        concepts = pd.Series(concepts, index=group.index).fillna(group['description'])
+        counts = group[keys].assign(word=concepts.str.lower())
+        counts = counts.groupby(keys + ['word'], sort=False).size().rename('count').reset_index()
+        counts = counts.sort_values('count', ascending=False, kind='stable').head(nconcepts)
+        tops.append(counts.assign(relative=counts['count'] / counts['count'].sum()))
+    tops = [top for top in tops if not top.empty]
+    if not tops:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tops, ignore_index=True)[columns]
+
+
+_LOADED = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def load_ontology_index(directory):
+    """
+    Returns the OntologyIndex of a folder, loading it only once
+    """
+    key = os.path.abspath(directory)
+    with _LOADED_LOCK:
+        if key not in _LOADED:
+            print(f'Loading the ontology index from {directory}\n')
+            _LOADED[key] = OntologyIndex(directory)
+        return _LOADED[key]
+
+
+def main():
+    """
+    Command line entry point to build an ontology index
+    """
+    parser = argparse.ArgumentParser(
+        prog='stringdb_analyser.ontology',
+        description='Build a local index of the Gene Ontology')
+    parser.add_argument('obo', type=str, help='ontology file, e.g. go-basic.obo (gzipped or not)')
+    parser.add_argument('out_dir', type=str, help='output folder of the index')
+    parser.add_argument('--terms', type=str, default=None,
+                        help='protein.enrichment.terms file of a species, to compute the information '
+                             'content of the terms from their annotations')
+    args = parser.parse_args()
+    build_ontology_index(args.obo, args.out_dir, terms_path=args.terms)
+
+
+if __name__ == '__main__':
+    main()
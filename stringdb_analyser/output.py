@@ -0,0 +1,140 @@
+"""Writers of the enrichment tables.
+
+Besides the Excel file with a sheet per category, the enrichments can be
+saved as Parquet, Feather or CSV files partitioned by sample, direction
+and category (hive style, e.g. enrichment/parquet/sample=s1/direction=UP/
+category=KEGG/part-0.parquet), so many samples can be loaded back at once:
+
+    pd.read_parquet('out_folder/enrichment/parquet')
+"""
+
+import os
+import shutil
+
+OUTPUT_FORMATS = ('excel', 'parquet', 'feather', 'csv')
+EXCEL_ENGINES = ('openpyxl', 'xlsxwriter')
+# pdf: matplotlib charts, svg: fast SVG charts, html: charts only in the report
+CHART_FORMATS = ('pdf', 'svg', 'html')
+EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather', 'csv': '.csv'}
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'bz2': '.bz2', 'xz': '.xz', 'zstd': '.zst'}
+PARTITION_COLUMNS = ('sample', 'direction', 'category')
+# columns holding lists of genes, joined with commas in CSV files
+LIST_COLUMNS = ('inputGenes', 'preferredNames')
+
+
+def write_excel(enrich, path, engine=None):
+    """
+    Saves an enrichment table as an Excel file with a sheet per category.
+    xlsxwriter is much faster than openpyxl (the pandas default) for
+    large tables
+    """
+    import pandas as pd
+
+    with pd.ExcelWriter(path, engine=engine) as writer:
+        for element in enrich.category.unique():
+            enrich_df = enrich[enrich['category'] == element]
+            enrich_df.to_excel(writer, sheet_name=element)
+    return [path]
+
+
+def _join_lists(enrich):
+    """
+    Joins the gene lists of an enrichment table with commas
+    """
+    for column in LIST_COLUMNS:
+        if column in enrich.columns:
+            enrich = enrich.assign(**{column: [','.join(map(str, genes)) if isinstance(genes, (list, tuple))
+                                               else genes for genes in enrich[column]]})
+    return enrich
+
+
+def write_partitioned(enrich, root, fmt='parquet', compression=None):
+    """
+    Saves an enrichment table in a folder partitioned by the sample,
+    direction and category columns (the ones present in the table), one
+    file per partition. Returns the paths of the files
+    """
+    if fmt not in EXTENSIONS:
+        raise ValueError(f'Unknown output format {fmt}, choose between {", ".join(EXTENSIONS)}')
+    partition_cols = [col for col in PARTITION_COLUMNS if col in enrich.columns]
+    if fmt == 'csv':
+        enrich = _join_lists(enrich)
+    extension = EXTENSIONS[fmt]
+    if fmt == 'csv' and compression is not None:
+        extension += COMPRESSION_EXTENSIONS.get(compression, '')
+
+    paths = []
+    for keys, part in enrich.groupby(partition_cols, sort=False):
+        folder = os.path.join(root, *[f'{col}={value}' for col, value in zip(partition_cols, keys)])
+        os.makedirs(folder, exist_ok=True)
+        part = part.drop(columns=partition_cols).reset_index(drop=True)
+        path = os.path.join(folder, 'part-0' + extension)
+        if fmt == 'parquet':
+            part.to_parquet(path, index=False, compression=compression or 'snappy')
+        elif fmt == 'feather':
+            part.to_feather(path, compression=compression)
+        else:
+            part.to_csv(path, index=False, compression=compression)
+        paths.append(path)
+    return paths
+
+
+def write_enrichment(enrich, folder, prefix, formats=('excel',), root=None, sample=None,
+                     compression=None, excel_engine=None):
+    """
+    Saves an enrichment table in all the chosen formats: the Excel file
+    {prefix}_output.xlsx within `folder`, and the partitioned files within
+    a folder per format in `root` (by default the enrichment folder within
+    `folder`), with the sample name, if given, as a partition column: the
+    previous files of the sample are replaced. Returns the paths of the files
+    """
+    root = root or os.path.join(folder, 'enrichment')
+    paths = []
+    for fmt in formats:
+        if fmt == 'excel':
+            print(f'Saving enrichment in file {prefix}_output.xlsx')
+            paths += write_excel(enrich, os.path.join(folder, f'{prefix}_output.xlsx'),
+                                 engine=excel_engine)
+        else:
+            fmt_root = os.path.join(root, fmt)
+            if sample is None:
+                table = enrich
+            else:
+                table = enrich.assign(sample=sample)
+                shutil.rmtree(os.path.join(fmt_root, f'sample={sample}'), ignore_errors=True)
+            print(f'Saving enrichment of {prefix} as {fmt} files in {fmt_root}')
+            paths += write_partitioned(table, fmt_root, fmt=fmt, compression=compression)
+    return paths
+
+
+def add_output_arguments(parser):
+    """
+    Adds the output options shared by the scripts to an argparse parser
+    """
+    parser.add_argument('--format',
+                        choices=OUTPUT_FORMATS,
+                        nargs='+',
+                        default=['excel'],
+                        dest='formats',
+                        help='formats of the enrichment tables, Parquet, Feather and CSV files are saved '
+                             'in the enrichment folder (one folder per format), partitioned by sample, direction and category '
+                             '(default: excel)')
+    parser.add_argument('--compression',
+                        type=str,
+                        default=None,
+                        help='compression of the Parquet (snappy, gzip, zstd), Feather (lz4, zstd) '
+                             'or CSV (gzip, bz2, xz, zstd) files')
+    parser.add_argument('--excel-engine',
+                        choices=EXCEL_ENGINES,
+                        default=None,
+                        help='library writing the Excel files, xlsxwriter is faster (default: openpyxl)')
+    parser.add_argument('--charts',
+                        choices=CHART_FORMATS,
+                        default='pdf',
+                        dest='chart_format',
+                        help='save the radar charts as pdf files drawn with matplotlib, as svg files drawn '
+                             'without it (much faster), or only in the html report (default: pdf)')
+    parser.add_argument('--report',
+                        action='store_true',
+                        help='also save all the charts, network images and most enriched terms of the run '
+                             'in a single self-contained report.html (always done with --charts html)')
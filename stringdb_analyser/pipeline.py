@@ -0,0 +1,125 @@
+"""Pipelined processing of the samples of a run.
+
+The samples go through a chain of stages (e.g. fetch, word tables, charts,
+tables), each run by its own threads and connected to the next one by a
+bounded queue: while a sample is being drawn the next ones are already
+being downloaded, and a stage that falls behind makes the previous ones
+wait (backpressure), so only a few samples are held in memory at a time,
+however large the input is.
+"""
+
+import queue
+import threading
+
+# end of the items of a queue
+_DONE = object()
+
+
+class PipelineAborted(Exception):
+    """
+    Raised in the threads of a pipeline when another stage failed
+    """
+
+
+class Pipeline:
+    """
+    Chain of stages, given as (name, function, workers): every item goes
+    through function(item) of every stage in order, and what a function
+    returns is the item of the next stage (None drops the item). Up to
+    `queue_size` items wait between two stages. An exception in a stage
+    stops the whole pipeline and is raised again by run().
+    """
+
+    def __init__(self, stages, queue_size=4):
+        self.stages = [(name, func, max(1, workers)) for name, func, workers in stages]
+        self.queues = [queue.Queue(maxsize=max(1, queue_size)) for _ in self.stages]
+        self.aborted = threading.Event()
+        self.errors = []
+        self.results = []
+        self.lock = threading.Lock()
+
+    def _put(self, index, item):
+        # waits for room in the queue, unless the pipeline was stopped
+        while not self.aborted.is_set():
+            try:
+                self.queues[index].put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+        raise PipelineAborted()
+
+    def _get(self, index):
+        while not self.aborted.is_set():
+            try:
+                return self.queues[index].get(timeout=0.1)
+            except queue.Empty:
+                continue
+        raise PipelineAborted()
+
+    def _feed(self, items):
+        try:
+            for item in items:
+                self._put(0, item)
+            for _ in range(self.stages[0][2]):
+                self._put(0, _DONE)
+        except PipelineAborted:
+            pass
+        except Exception as err:
+            self._fail(err)
+
+    def _work(self, index, finished):
+        _, func, _ = self.stages[index]
+        last = index == len(self.stages) - 1
+        try:
+            while True:
+                item = self._get(index)
+                if item is _DONE:
+                    break
+                result = func(item)
+                if result is None:
+                    continue
+                if last:
+                    with self.lock:
+                        self.results.append(result)
+                else:
+                    self._put(index + 1, result)
+            # the last worker of a stage closes the next one
+            with self.lock:
+                finished[index] += 1
+                closing = finished[index] == self.stages[index][2] and not last
+            if closing:
+                for _ in range(self.stages[index + 1][2]):
+                    self._put(index + 1, _DONE)
+        except PipelineAborted:
+            pass
+        except Exception as err:
+            self._fail(err)
+
+    def _fail(self, err):
+        with self.lock:
+            self.errors.append(err)
+        self.aborted.set()
+
+    def run(self, items):
+        """
+        Runs all the items through the stages and returns what the last
+        stage returned, in the order the items finished
+        """
+        finished = [0] * len(self.stages)
+        threads = [threading.Thread(target=self._feed, args=(items,), daemon=True)]
+        for index, (name, _, workers) in enumerate(self.stages):
+            threads += [threading.Thread(target=self._work, args=(index, finished),
+                                         name=f'{name}-{number}', daemon=True)
+                        for number in range(workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            for thread in threads:
+                thread.join()
+        except BaseException:
+            # e.g. Ctrl+C, the stages stop after their current item
+            self.aborted.set()
+            raise
+        if self.errors:
+            raise self.errors[0]
+        return self.results
@@ -0,0 +1,249 @@
+"""Radar charts of the enrichment word tables and cross-sample heatmaps.
+
+Charts are drawn on standalone matplotlib figures, not registered with
+pyplot, so they do not need a display, do not change the pyplot backend
+and are freed as soon as they are saved: long runs do not pile up open
+figures. A batch of charts (e.g. all the charts of a sample) is saved
+as separate PDF files or as a single multi-page PDF, and the pipeline of
+the workbook analysis draws the batches of its samples in a process pool.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.backends.backend_pdf import PdfPages
+from matplotlib.figure import Figure
+
+
+def radar_chart_single(dft, category):
+    """
+    This function inputs the word count resulting from count_words
+    and plots the radar chart from that list
+    Returns the figure
+    """
+    # transpose the dataframe
+    dft = dft.transpose()
+
+    # Each attribute we'll plot in the radar chart.
+    labels = list(dft)[0:]
+    # Let's take the values
+    values = dft.loc['relative'].tolist()
+
+    # Number of variables we're plotting.
+    num_vars = len(labels)
+
+    # Split the circle into even parts and save the angles,
+    # so we know where to put each axis.
+    angles = np.linspace(0, 2 * np.pi, num_vars, endpoint=False).tolist()
+
+    # The plot is a circle, so we need to "complete the loop"
+    # and append the start value to the end.
+    values += values[:1]
+    angles += angles[:1]
+
+    # ax = plt.subplot(polar=True)
+    fig = Figure(figsize=(6, 6))
+    ax = fig.subplots(subplot_kw=dict(polar=True))
+
+    # Draw the outline of our data.
+    ax.plot(angles, values, color='red', linewidth=1)
+    # Fill it in.
+    ax.fill(angles, values, color='red', alpha=0.25)
+
+    # Fix axis to go in the right order and start at 12 o'clock.
+    ax.set_theta_offset(np.pi / 2)
+    ax.set_theta_direction(-1)
+
+    # Draw axis lines for each angle and label.
+    ax.set_thetagrids(np.degrees(angles[:-1]), labels)
+
+    # Go through labels and adjust alignment based on where
+    # it is in the circle.
+    for label, angle in zip(ax.get_xticklabels(), angles):
+        if angle in (0, np.pi):
+            label.set_horizontalalignment('center')
+        elif 0 < angle < np.pi:
+            label.set_horizontalalignment('left')
+        else:
+            label.set_horizontalalignment('right')
+
+    ax.set_rlabel_position(180 / num_vars)  # sets y-label to middle
+
+    # Add some custom styling.
+    ax.tick_params(colors='#222222')  # Change the color of the tick labels.
+    ax.tick_params(axis='y', labelsize=8)  # Make the y-axis (0-100) labels smaller.
+    ax.grid(color='#AAAAAA')  # Change the color of the circular gridlines.
+    ax.spines['polar'].set_color('#222222')  # Change color of the outermost gridline
+    ax.set_facecolor('#FAFAFA')  # circle background color
+    fig.tight_layout()
+    # Lastly, give the chart a title and give it some
+    # padding above the "Acceleration" label.
+    ax.set_title(category, y=1.08)
+    return fig
+
+
+def add_to_radar(dft, direction, color, ax, angles):
+    """
+    Inner function used within radar_chart_multi
+    Gets the data in shape to include it in the radar plot
+    """
+    values = dft.loc[direction].tolist()
+    values += values[:1]
+    ax.plot(angles, values, color=color, linewidth=1, label=direction)
+    ax.fill(angles, values, color=color, alpha=0.25)
+
+
+def radar_chart_multi(gene_table, category):
+    """
+    Takes a table with two columns (named up and down) from the function get_multi_table,
+    and returns a spider plot from it (as a figure)
+    """
+    # transpose the dataframe
+    dft = gene_table.transpose()
+
+    # Each attribute we'll plot in the radar chart.
+    labels = list(dft)[0:]
+
+    # Number of variables we're plotting.
+    num_vars = len(labels)
+
+    # Split the circle into even parts and save the angles,
+    # so we know where to put each axis.
+    angles = np.linspace(0, 2 * np.pi, num_vars, endpoint=False).tolist()
+
+    # The plot is a circle, so we need to "complete the loop"
+    # and append the start value to the end.
+    angles += angles[:1]
+
+    # ax = plt.subplot(polar=True)
+    fig = Figure(figsize=(6, 6))
+    ax = fig.subplots(subplot_kw=dict(polar=True))
+
+    # add samples to the radar plot
+    add_to_radar(dft, 'up', '#1aaf6c', ax, angles)
+    add_to_radar(dft, 'down', '#429bf4', ax, angles)
+
+    # Fix axis to go in the right order and start at 12 o'clock.
+    ax.set_theta_offset(np.pi / 2)
+    ax.set_theta_direction(-1)
+
+    # Draw axis lines for each angle and label.
+    ax.set_thetagrids(np.degrees(angles[:-1]), labels)
+
+    for label, angle in zip(ax.get_xticklabels(), angles):
+        if angle in (0, np.pi):
+            label.set_horizontalalignment('center')
+        elif 0 < angle < np.pi:
+            label.set_horizontalalignment('left')
+        else:
+            label.set_horizontalalignment('right')
+
+    # set limits
+    y_lim = gene_table.max().max() * 1.05
+    ax.set_ylim(0, y_lim)
+    ax.set_rlabel_position(180 / num_vars)  # set position of y labels
+
+    # Add some custom styling.
+    # Change the color of the tick labels.
+    ax.tick_params(colors='#222222')
+    # Make the y-axis (0-100) labels smaller.
+    ax.tick_params(axis='y', labelsize=8)
+    # Change the color of the circular gridlines.
+    ax.grid(color='#AAAAAA')
+    ax.spines['polar'].set_color('#222222')  # Change color of outermost gridline
+    ax.set_facecolor('#FAFAFA')
+    ax.set_title(category, y=1.08)  # Add title.
+    ax.legend(loc='upper right', bbox_to_anchor=(1.3, 1.1))  # legend
+    fig.tight_layout()
+    return fig
+
+
+def category_summary(enrich, path):
+    """
+    Saves a bar plot with the number of enriched terms of every category
+    """
+    import seaborn as sns
+
+    fig = Figure()
+    ax = fig.subplots()
+    g_plot = sns.countplot(x="category", data=enrich, ax=ax)
+    g_plot.set_xticklabels(g_plot.get_xticklabels(), rotation=45,
+                           horizontalalignment='right')
+    fig.tight_layout()
+    fig.savefig(path)
+
+
+def heatmap(values, row_labels, col_labels, category):
+    """
+    Heatmap of the -log10(FDR) of the enriched terms (columns) of every
+    sample and direction (rows), already ordered. Returns the figure
+    """
+    n_rows, n_cols = values.shape
+    # margins from the length of the labels (6 pt text), as tight_layout
+    # measures every label and is slow for hundreds of them
+    left = 0.6 + 0.045 * max(map(len, row_labels), default=0)
+    bottom = 0.4 + 0.045 * max(map(len, col_labels), default=0)
+    width, height = left + 1.5 + 0.12 * n_cols, bottom + 0.8 + 0.1 * n_rows
+    fig = Figure(figsize=(width, height))
+    fig.subplots_adjust(left=left / width, right=1 - 1.5 / width, bottom=bottom / height,
+                        top=1 - 0.5 / height)
+    ax = fig.subplots()
+    image = ax.imshow(values, aspect='auto', cmap='viridis', interpolation='nearest')
+    ax.set_xticks(np.arange(n_cols))
+    ax.set_xticklabels(col_labels, rotation=90, fontsize=6)
+    ax.set_yticks(np.arange(n_rows))
+    ax.set_yticklabels(row_labels, fontsize=6)
+    colorbar_ax = fig.add_axes([1 - 1.3 / width, bottom / height, 0.15 / width, 0.3])
+    fig.colorbar(image, cax=colorbar_ax, label='-log10(FDR)')
+    ax.set_title(category)
+    return fig
+
+
+CHARTS = {
+    'single': radar_chart_single,
+    'multi': radar_chart_multi,
+}
+
+
+def render_chart_batch(charts, pdf_path=None):
+    """
+    Draws and saves a list of charts, given as dictionaries with the chart
+    kind ('single' or 'multi'), the word table, the category and the path
+    of its own PDF file. With pdf_path, all the charts are saved as pages
+    of that PDF file instead.
+    """
+    if pdf_path is not None:
+        with PdfPages(pdf_path) as pdf:
+            for chart in charts:
+                pdf.savefig(CHARTS[chart['kind']](chart['table'], chart['category']))
+        return [pdf_path]
+
+    for chart in charts:
+        CHARTS[chart['kind']](chart['table'], chart['category']).savefig(chart['path'])
+    return [chart['path'] for chart in charts]
+
+
+def save_heatmap(path, values, row_labels, col_labels, category, svg=False):
+    """
+    Draws a heatmap (see heatmap) and saves it in path, and with svg also
+    as an svg file next to it
+    """
+    fig = heatmap(values, row_labels, col_labels, category)
+    fig.savefig(path)
+    if svg:
+        fig.savefig(os.path.splitext(path)[0] + '.svg')
+    return path
+
+
+def render_heatmaps(heatmaps, workers=None):
+    """
+    Saves many heatmaps (dictionaries with the arguments of save_heatmap)
+    in parallel, one process per core by default
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(heatmaps) <= 1:
+        return [save_heatmap(**job) for job in heatmaps]
+    with ProcessPoolExecutor(max_workers=min(workers, len(heatmaps))) as pool:
+        futures = [pool.submit(save_heatmap, **job) for job in heatmaps]
+        return [future.result() for future in futures]
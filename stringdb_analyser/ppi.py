@@ -0,0 +1,161 @@
+"""Protein-protein interaction (PPI) enrichment of gene sets, by permutation.
+
+Tells whether the genes of a set have more interactions among themselves
+than random sets of genes with the same degrees. The interactions are the
+whole network of the species in a local NetworkIndex, above a minimum
+score, as a sparse adjacency matrix. The genes of the species are grouped
+in bins of similar degree, and every random set draws, for the genes of
+the set in every bin, as many distinct genes of that bin (without
+replacement, so a random set never repeats a gene). Thousands of random sets are
+drawn at once as a matrix of node indices, and their interactions counted
+together with sparse products: for the indicator matrix S of the sets
+(sets by genes), the interactions within set i are ((S @ A) * S)[i].sum() / 2.
+
+The result of every set is its number of genes found in the network,
+observed and expected (mean of the random sets) interactions, their ratio
+and the empirical p-value (1 + random sets with at least as many
+interactions) / (1 + random sets).
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from stringdb_analyser.topology import _key_columns
+
+# number of degree bins of the genes of the species
+DEGREE_BINS = 50
+# entries of the random draws and sparse products of a batch of random sets (bounds the memory)
+BATCH_ENTRIES = 20_000_000
+
+
+class PPIBackground:
+    """
+    Binary, symmetric adjacency matrix of the network of a species with its
+    genes grouped by degree, to count the interactions within gene sets and
+    draw degree-matched random sets
+    """
+
+    def __init__(self, adjacency, n_bins=DEGREE_BINS):
+        self.adjacency = sparse.csr_matrix(adjacency, dtype=np.float32)
+        self.degree = np.diff(self.adjacency.indptr)
+        n_nodes = len(self.degree)
+        # bins of (about) the same number of genes, genes of the same degree in the same bin
+        edges = np.unique(np.quantile(self.degree, np.linspace(0, 1, n_bins + 1)))
+        self.node_bin = np.searchsorted(edges[1:-1], self.degree, side='right')
+        self.members = np.argsort(self.node_bin, kind='stable')
+        self.bin_size = np.bincount(self.node_bin, minlength=len(edges))
+        self.bin_start = np.concatenate([[0], np.cumsum(self.bin_size)[:-1]])
+        self.n_nodes = n_nodes
+
+    @classmethod
+    def from_index(cls, net_index, min_score=400, n_bins=DEGREE_BINS):
+        """
+        Background of the links of a NetworkIndex with a combined score of
+        at least min_score (0-1000)
+        """
+        n_nodes = len(net_index)
+        adjacency = sparse.csr_matrix((np.asarray(net_index.scores) >= min_score,
+                                       np.asarray(net_index.indices), np.asarray(net_index.indptr)),
+                                      shape=(n_nodes, n_nodes), dtype=np.float32)
+        adjacency = adjacency - sparse.diags(adjacency.diagonal())
+        adjacency.eliminate_zeros()
+        return cls(adjacency, n_bins=n_bins)
+
+    def edge_counts(self, sets):
+        """
+        Number of interactions within every row of a matrix of node indices
+        (one set per row, without repeated nodes)
+        """
+        n_sets, size = sets.shape
+        indicator = sparse.csr_matrix((np.ones(sets.size, dtype=np.float32), sets.ravel(),
+                                       np.arange(0, sets.size + 1, size)), shape=(n_sets, self.n_nodes))
+        within = (indicator @ self.adjacency).multiply(indicator)
+        return np.rint(np.asarray(within.sum(axis=1)).ravel() / 2).astype(np.int64)
+
+    def random_sets(self, nodes, n_sets, rng):
+        """
+        Matrix of n_sets random sets (rows) of distinct nodes with, for the
+        nodes of `nodes` (distinct) in every degree bin, as many nodes of
+        that bin, drawn without replacement
+        """
+        bins = self.node_bin[nodes]
+        draws = np.empty((n_sets, len(nodes)), dtype=np.int64)
+        for node_bin in np.unique(bins):
+            columns = np.flatnonzero(bins == node_bin)
+            size = self.bin_size[node_bin]
+            # the first len(columns) of a random order of the bin, for every set
+            keys = rng.random((n_sets, size), dtype=np.float32)
+            if len(columns) < size:
+                picked = np.argpartition(keys, len(columns) - 1, axis=1)[:, :len(columns)]
+            else:
+                picked = np.argsort(keys, axis=1)
+            draws[:, columns] = self.members[self.bin_start[node_bin] + picked]
+        return draws
+
+    def test(self, nodes, permutations=1000, rng=None):
+        """
+        Observed and expected interactions within a set of node indices and
+        the empirical p-value of the observed ones, from `permutations`
+        degree-matched random sets
+        """
+        rng = rng if rng is not None else np.random.default_rng(0)
+        nodes = np.unique(np.asarray(nodes, dtype=np.int64))
+        if len(nodes) < 2:
+            return dict(observed=0, expected=0.0, p_value=1.0)
+        observed = int(self.edge_counts(nodes[None, :])[0])
+        # batches of random sets small enough for the draws and the sparse products
+        per_set = max(len(nodes) * max(1.0, self.degree[nodes].mean()),
+                      self.bin_size[np.unique(self.node_bin[nodes])].sum())
+        batch = int(max(1, min(permutations, BATCH_ENTRIES // per_set)))
+        counts = np.concatenate([
+            self.edge_counts(self.random_sets(nodes, min(batch, permutations - start), rng))
+            for start in range(0, permutations, batch)])
+        return dict(observed=observed, expected=float(counts.mean()),
+                    p_value=float((1 + np.count_nonzero(counts >= observed)) / (1 + permutations)))
+
+
+def ppi_enrichment(gene_sets, background, net_index, permutations=1000, seed=0):
+    """
+    PPI enrichment of many gene sets ({key: genes}, keys such as (sample,
+    direction)) against a PPIBackground of the NetworkIndex net_index.
+    Returns a DataFrame with the key columns (as network_topology), the
+    genes, the genes found in the network, the observed and expected
+    interactions, their ratio and the p-value of every set
+    """
+    rng = np.random.default_rng(seed)
+    keys = list(gene_sets)
+    rows = []
+    for key in keys:
+        genes = list(dict.fromkeys(gene_sets[key]))
+        nodes = net_index.node_indices(genes)
+        result = background.test(nodes, permutations=permutations, rng=rng)
+        rows.append(dict(genes=len(genes), mapped_genes=len(nodes), observed_edges=result['observed'],
+                         expected_edges=round(result['expected'], 3),
+                         enrichment=round(result['observed'] / result['expected'], 3)
+                         if result['expected'] > 0 else np.nan,
+                         p_value=result['p_value'], permutations=permutations))
+    key_table = pd.DataFrame([key if isinstance(key, tuple) else (key,) for key in keys],
+                             columns=_key_columns(keys))
+    return pd.concat([key_table, pd.DataFrame(rows, columns=['genes', 'mapped_genes', 'observed_edges',
+                                                             'expected_edges', 'enrichment', 'p_value',
+                                                             'permutations'])], axis=1)
+
+
+_LOADED = {}
+_LOADED_LOCK = threading.Lock()
+
+
+def load_ppi_background(net_index, min_score=400):
+    """
+    Returns the PPIBackground of a NetworkIndex and minimum score, building
+    it only once
+    """
+    key = (os.path.abspath(net_index.directory), min_score)
+    with _LOADED_LOCK:
+        if key not in _LOADED:
+            _LOADED[key] = PPIBackground.from_index(net_index, min_score=min_score)
+        return _LOADED[key]
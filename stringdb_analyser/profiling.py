@@ -0,0 +1,217 @@
+"""Timing and memory instrumentation of the analyses.
+
+A Profiler records how long every stage (and every sample within a stage)
+takes, samples the memory of the process while it runs and saves all of
+it as a Chrome trace (open it in chrome://tracing or https://ui.perfetto.dev),
+together with the request counters of the StringClient. Stages can also
+be run under cProfile, saving a .prof file per stage (see pstats or snakeviz).
+"""
+
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# stages of the analyses, as named in the trace
+STAGES = ('read', 'resolve', 'edges', 'fetch', 'topology', 'ppi', 'networks', 'words', 'tables', 'charts',
+          'heatmaps')
+
+
+def current_rss():
+    """
+    Resident memory of the process in bytes (the peak one where the
+    current one cannot be read)
+    """
+    try:
+        with open('/proc/self/statm') as fh_statm:
+            return int(fh_statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+def peak_rss():
+    """
+    Peak resident memory of the process in bytes
+    """
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kB on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Profiler:
+    """
+    Collects the duration of the stages of a run as trace events, and
+    samples the memory every `interval` seconds while running. Stages in
+    `cprofile_stages` are also profiled with cProfile, saving
+    {stage}.prof files in `cprofile_dir`. A disabled profiler does nothing.
+    """
+
+    def __init__(self, enabled=True, cprofile_stages=(), cprofile_dir='.', interval=0.2):
+        self.enabled = enabled
+        self.cprofile_stages = set(cprofile_stages)
+        self.cprofile_dir = cprofile_dir
+        self.cprofiles = {}
+        self.interval = interval
+        self.events = []
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.pid = os.getpid()
+        self.stopped = threading.Event()
+        self.sampler = None
+
+    def _now(self):
+        return (time.perf_counter() - self.origin) * 1e6
+
+    def start(self):
+        """
+        Starts sampling the memory
+        """
+        if self.enabled and self.sampler is None:
+            self.sampler = threading.Thread(target=self._sample_memory, daemon=True)
+            self.sampler.start()
+        return self
+
+    def stop(self):
+        """
+        Stops sampling the memory and saves the cProfile statistics
+        """
+        self.stopped.set()
+        if self.sampler is not None:
+            self.sampler.join()
+        import pstats
+
+        # the profiles of every thread running a stage are merged
+        stages = {}
+        for (stage, _), profile in self.cprofiles.items():
+            profile.create_stats()
+            if profile.stats:
+                stages.setdefault(stage, []).append(profile)
+        for stage, profiles in stages.items():
+            path = os.path.join(self.cprofile_dir, f'{stage}.prof')
+            pstats.Stats(*profiles).dump_stats(path)
+            print(f'cProfile statistics of the {stage} stage saved in {path}')
+        self.cprofiles = {}
+
+    def _sample_memory(self):
+        while not self.stopped.is_set():
+            self._add({'name': 'memory', 'ph': 'C', 'ts': self._now(), 'pid': self.pid,
+                       'args': {'rss_mb': round(current_rss() / 2**20, 1)}})
+            self.stopped.wait(self.interval)
+
+    def _add(self, event):
+        with self.lock:
+            self.events.append(event)
+
+    @contextmanager
+    def stage(self, name, **args):
+        """
+        Context manager timing a stage (or a sample within a stage, given
+        as an argument, e.g. stage('charts', sample='s1'))
+        """
+        if not self.enabled:
+            yield
+            return
+        profile = None
+        if name in self.cprofile_stages:
+            # one profile per thread running the stage
+            with self.lock:
+                profile = self.cprofiles.setdefault((name, threading.get_ident()), cProfile.Profile())
+            try:
+                profile.enable()
+            except ValueError:
+                # another stage is being profiled (Python 3.12+ profiles one at a time)
+                profile = None
+        start = self._now()
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            self._add({'name': name, 'cat': 'stage', 'ph': 'X', 'ts': start, 'dur': self._now() - start,
+                       'pid': self.pid, 'tid': threading.get_ident(), 'args': args})
+
+    def wrap(self, name, func, **args):
+        """
+        Returns func timed as a stage, e.g. for tasks run in other threads
+        """
+        def timed(*func_args, **func_kwargs):
+            with self.stage(name, **args):
+                return func(*func_args, **func_kwargs)
+        return timed
+
+    def totals(self):
+        """
+        Returns {stage: (times run, total seconds, longest seconds)}
+        """
+        totals = {}
+        for event in self.events:
+            if event['ph'] != 'X':
+                continue
+            count, total, longest = totals.get(event['name'], (0, 0.0, 0.0))
+            seconds = event['dur'] / 1e6
+            totals[event['name']] = (count + 1, total + seconds, max(longest, seconds))
+        return totals
+
+    def summary(self):
+        """
+        Returns a small text table with the time of every stage and the
+        peak memory of the run
+        """
+        lines = [f'{"stage":<12}{"times":>7}{"total s":>10}{"max s":>9}']
+        for name, (count, total, longest) in self.totals().items():
+            lines.append(f'{name:<12}{count:>7}{total:>10.2f}{longest:>9.2f}')
+        lines.append(f'peak memory: {peak_rss() / 2**20:.0f} MB')
+        return '\n'.join(lines)
+
+    def save(self, path, http_stats=None):
+        """
+        Saves the trace as a Chrome trace json file, with the request
+        counters of the StringClient and the totals per stage
+        """
+        trace = {
+            'traceEvents': list(self.events),
+            'displayTimeUnit': 'ms',
+            'otherData': {
+                'peak_rss_mb': round(peak_rss() / 2**20, 1),
+                'stages': {name: {'count': count, 'seconds': round(total, 4), 'max_seconds': round(longest, 4)}
+                           for name, (count, total, longest) in self.totals().items()},
+                'http': {endpoint: dict(stats) for endpoint, stats in (http_stats or {}).items()},
+            },
+        }
+        with open(path, 'w') as fh_trace:
+            json.dump(trace, fh_trace)
+        print(f'Timing trace saved in {path}')
+
+
+def add_profile_arguments(parser):
+    """
+    Adds the profiling options shared by the scripts to an argparse parser
+    """
+    parser.add_argument('--profile',
+                        type=str,
+                        default=None,
+                        metavar='FILE',
+                        help='save the time of every stage and sample, the memory use and the STRING '
+                             'requests as a Chrome trace json file, and print a summary at the end')
+    parser.add_argument('--cprofile',
+                        choices=STAGES,
+                        nargs='+',
+                        default=(),
+                        help='also profile these stages with cProfile, saving a {stage}.prof file next '
+                             'to the --profile file')
+
+
+def profiler_from_args(args):
+    """
+    Creates the Profiler defined by the parsed arguments (disabled if
+    --profile is not given)
+    """
+    if args.profile is None:
+        return Profiler(enabled=False)
+    return Profiler(cprofile_stages=args.cprofile,
+                    cprofile_dir=os.path.dirname(os.path.abspath(args.profile))).start()
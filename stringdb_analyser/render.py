@@ -0,0 +1,222 @@
+"""Local rendering of interaction networks as SVG (and PNG) images.
+
+The layout is a vectorised Fruchterman-Reingold force-directed layout with
+a fixed random seed, so the same network always gives the same image.
+Small networks use the repulsion between every pair of nodes. In larger
+ones (more than GRID_NODES nodes) the layout is divided into a grid of
+cells: the nodes of the same and the next cells repel each other one by
+one, and the farther cells repel as a whole, from the centre of their
+nodes (as in Barnes-Hut, with a single level). This keeps every iteration
+close to linear in the number of nodes, in time and memory.
+"""
+
+from xml.sax.saxutils import escape
+
+import numpy as np
+
+# networks with more nodes than this use the grid repulsion
+GRID_NODES = 1000
+# nodes per cell of the grid, about, and largest number of cells per side
+GRID_CELL_NODES = 8
+GRID_SIDE = 40
+
+# node colours, assigned by connected component
+PALETTE = ['#4e79a7', '#f28e2b', '#e15759', '#76b7b2', '#59a14f',
+           '#edc948', '#b07aa1', '#ff9da7', '#9c755f', '#bab0ac']
+
+
+def _components(n_nodes, node_a, node_b):
+    # connected components with a simple union-find
+    parent = np.arange(n_nodes)
+
+    def find(node):
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
+
+    for first, second in zip(node_a, node_b):
+        root_a, root_b = find(first), find(second)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    roots = np.array([find(node) for node in range(n_nodes)])
+    return np.unique(roots, return_inverse=True)[1]
+
+
+def _all_pairs_repulsion(pos, k):
+    # repulsion between every pair of nodes, O(n^2) time and memory
+    delta = pos[:, None, :] - pos[None, :, :]
+    distance = np.maximum(np.sqrt((delta ** 2).sum(axis=-1)), 0.01)
+    return (delta * (k * k / distance ** 2)[:, :, None]).sum(axis=1)
+
+
+def _grid_repulsion(pos, k):
+    # repulsion of the nodes of the same and the next cells of a grid, and of
+    # the farther cells as a whole (all their nodes at their centre)
+    n_nodes = len(pos)
+    side = int(min(np.ceil(np.sqrt(n_nodes / GRID_CELL_NODES)), GRID_SIDE))
+    low = pos.min(axis=0)
+    size = max((pos.max(axis=0) - low).max() / side, 1e-9)
+    cell = np.minimum(((pos - low) / size).astype(np.int64), side - 1)
+    # cell keys with an empty border, so the next cells of a border cell exist
+    n_rows = side + 2
+    key = (cell[:, 0] + 1) * n_rows + cell[:, 1] + 1
+    counts = np.bincount(key, minlength=n_rows * n_rows)
+    occupied = np.flatnonzero(counts)
+    centre = np.stack([np.bincount(key, weights=pos[:, axis], minlength=n_rows * n_rows)[occupied]
+                       for axis in (0, 1)], axis=1) / counts[occupied, None]
+
+    # far cells: more than one cell away
+    column, row = occupied // n_rows, occupied % n_rows
+    far = (np.abs(column[:, None] - column[None, :]) > 1) | (np.abs(row[:, None] - row[None, :]) > 1)
+    delta_x = centre[:, 0, None] - centre[None, :, 0]
+    delta_y = centre[:, 1, None] - centre[None, :, 1]
+    weight = np.where(far, counts[occupied][None, :] * k * k, 0.0) / np.maximum(delta_x ** 2 + delta_y ** 2, 1e-4)
+    cell_force = np.zeros((n_rows * n_rows, 2))
+    cell_force[occupied, 0] = (delta_x * weight).sum(axis=1)
+    cell_force[occupied, 1] = (delta_y * weight).sum(axis=1)
+    displacement = cell_force[key]
+
+    # next cells: node by node, with the nodes sorted by cell
+    order = np.argsort(key, kind='stable')
+    cell_start = np.cumsum(counts) - counts
+    pos_x, pos_y = pos[:, 0], pos[:, 1]
+    nodes = np.arange(n_nodes)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbour = key + dx * n_rows + dy
+            count = counts[neighbour]
+            first = np.repeat(nodes, count)
+            offsets = np.arange(len(first)) - np.repeat(np.cumsum(count) - count, count)
+            second = order[np.repeat(cell_start[neighbour], count) + offsets]
+            keep = first != second
+            first, second = first[keep], second[keep]
+            delta_x, delta_y = pos_x[first] - pos_x[second], pos_y[first] - pos_y[second]
+            weight = k * k / np.maximum(delta_x ** 2 + delta_y ** 2, 1e-4)
+            displacement[:, 0] += np.bincount(first, weights=delta_x * weight, minlength=n_nodes)
+            displacement[:, 1] += np.bincount(first, weights=delta_y * weight, minlength=n_nodes)
+    return displacement
+
+
+def force_layout(n_nodes, node_a, node_b, weights=None, iterations=100, seed=0):
+    """
+    Fruchterman-Reingold layout of a network with n_nodes nodes and edges
+    (node_a[i], node_b[i]). Returns an (n_nodes, 2) array of positions in [0, 1].
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n_nodes, 2))
+    if n_nodes < 2:
+        return np.full((n_nodes, 2), 0.5)
+    node_a = np.asarray(node_a, dtype=np.int64)
+    node_b = np.asarray(node_b, dtype=np.int64)
+    weights = np.ones(len(node_a)) if weights is None else np.asarray(weights, dtype=float)
+
+    k = np.sqrt(1.0 / n_nodes)
+    temperature = 0.1
+    cooling = temperature / (iterations + 1)
+    repulsion = _grid_repulsion if n_nodes > GRID_NODES else _all_pairs_repulsion
+    for _ in range(iterations):
+        displacement = repulsion(pos, k)
+        # attraction along the edges
+        edge_delta = pos[node_a] - pos[node_b]
+        edge_distance = np.maximum(np.sqrt((edge_delta ** 2).sum(axis=-1)), 0.01)
+        pull = edge_delta * (edge_distance * weights / k)[:, None]
+        np.subtract.at(displacement, node_a, pull)
+        np.add.at(displacement, node_b, pull)
+        # gravity towards the centre, so disconnected nodes stay close to the rest
+        displacement -= (pos - 0.5) * n_nodes * k
+        length = np.maximum(np.sqrt((displacement ** 2).sum(axis=-1)), 0.01)
+        pos += displacement / length[:, None] * np.minimum(length, temperature)[:, None]
+        temperature -= cooling
+
+    pos -= pos.min(axis=0)
+    span = pos.max(axis=0)
+    span[span == 0] = 1
+    return pos / span
+
+
+def network_svg(labels, node_a, node_b, scores, pos, size=800, margin=60):
+    """
+    Returns the SVG text of a network, given the node labels, the edges,
+    their scores (0-1) and the node positions from force_layout
+    """
+    xy = margin + pos * (size - 2 * margin)
+    colours = _components(len(labels), node_a, node_b)
+    lines = [f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+             f'viewBox="0 0 {size} {size}" font-family="Arial, sans-serif">',
+             f'<rect width="{size}" height="{size}" fill="white"/>',
+             '<g stroke="#555555" stroke-linecap="round">']
+    for first, second, score in zip(node_a, node_b, scores):
+        lines.append(f'<line x1="{xy[first, 0]:.1f}" y1="{xy[first, 1]:.1f}" '
+                     f'x2="{xy[second, 0]:.1f}" y2="{xy[second, 1]:.1f}" '
+                     f'stroke-width="{0.5 + 2.5 * score:.2f}" stroke-opacity="{0.3 + 0.6 * score:.2f}"/>')
+    lines.append('</g>')
+    lines.append('<g stroke="#222222" stroke-width="1">')
+    for node, label in enumerate(labels):
+        colour = PALETTE[colours[node] % len(PALETTE)]
+        lines.append(f'<circle cx="{xy[node, 0]:.1f}" cy="{xy[node, 1]:.1f}" r="9" fill="{colour}">'
+                     f'<title>{escape(str(label))}</title></circle>')
+    lines.append('</g>')
+    lines.append('<g font-size="11" fill="#222222" text-anchor="middle">')
+    for node, label in enumerate(labels):
+        lines.append(f'<text x="{xy[node, 0]:.1f}" y="{xy[node, 1] - 12:.1f}">{escape(str(label))}</text>')
+    lines.append('</g>')
+    lines.append('</svg>')
+    return '\n'.join(lines) + '\n'
+
+
+def _save_png(labels, node_a, node_b, scores, pos, path, size=800):
+    # a standalone figure (not pyplot), so networks can be drawn by many threads
+    from matplotlib.figure import Figure
+
+    colours = _components(len(labels), node_a, node_b)
+    fig = Figure(figsize=(size / 100, size / 100), dpi=100)
+    ax = fig.subplots()
+    for first, second, score in zip(node_a, node_b, scores):
+        ax.plot(pos[[first, second], 0], pos[[first, second], 1], color='#555555',
+                linewidth=0.5 + 2.5 * score, alpha=0.3 + 0.6 * score, zorder=1)
+    ax.scatter(pos[:, 0], pos[:, 1], s=120, edgecolors='#222222', zorder=2,
+               c=[PALETTE[colour % len(PALETTE)] for colour in colours])
+    for node, label in enumerate(labels):
+        ax.annotate(str(label), pos[node], textcoords='offset points', xytext=(0, 9),
+                    ha='center', fontsize=7)
+    ax.set_xlim(-0.08, 1.08)
+    ax.set_ylim(1.08, -0.08)
+    ax.axis('off')
+    fig.savefig(path)
+
+
+def render_network(genes, edges, out_path, labels=None, formats=('svg',), seed=0):
+    """
+    Draws the network of a gene list from its edge table (columns stringId_A,
+    stringId_B and score, as given by the STRING tsv endpoint or a NetworkIndex)
+    and saves it as {out_path}.svg and/or {out_path}.png.
+    Genes without interactions are drawn as isolated nodes. Labels can map
+    identifiers to names, otherwise the preferred names of the table are used.
+    """
+    names = dict(labels or {})
+    for column in ('A', 'B'):
+        if f'preferredName_{column}' in edges:
+            for node, name in zip(edges[f'stringId_{column}'], edges[f'preferredName_{column}']):
+                names.setdefault(node, name)
+    # genes given by name (not resolved) are matched to the identifiers of the table
+    by_name = {str(name).lower(): node for node, name in names.items()}
+    nodes = [str(gene) if str(gene) in names else by_name.get(str(gene).lower(), str(gene))
+             for gene in genes]
+    nodes = list(dict.fromkeys(nodes + edges['stringId_A'].tolist() + edges['stringId_B'].tolist()))
+    position = {node: index for index, node in enumerate(nodes)}
+
+    node_a = np.array([position[node] for node in edges['stringId_A']], dtype=np.int64)
+    node_b = np.array([position[node] for node in edges['stringId_B']], dtype=np.int64)
+    scores = edges['score'].to_numpy(dtype=float)
+
+    node_labels = [names.get(node, node.split('.', 1)[-1]) for node in nodes]
+    pos = force_layout(len(nodes), node_a, node_b, weights=scores, seed=seed)
+
+    if 'svg' in formats:
+        with open(f'{out_path}.svg', 'w') as fh_svg:
+            fh_svg.write(network_svg(node_labels, node_a, node_b, scores, pos))
+    if 'png' in formats:
+        _save_png(node_labels, node_a, node_b, scores, pos, f'{out_path}.png')
+    return out_path
+
@@ -0,0 +1,146 @@
+"""Single-file HTML report of a run.
+
+Gathers the radar charts (as inline SVG, see svgcharts), the network
+images (embedded as data URIs), the most enriched terms and the network
+topology of every sample, plus the tables and heatmaps of the whole run,
+in one self-contained report.html that can be opened or sent without the
+rest of the output folder.
+"""
+
+import base64
+import html
+import os
+import threading
+
+# enrichment columns shown in the report, when present
+TERM_COLUMNS = ['direction', 'category', 'term', 'description', 'number_of_genes', 'fdr']
+
+PAGE_TEMPLATE = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{title}</title>
+<style>
+body {{ font-family: "DejaVu Sans", Arial, sans-serif; margin: 2em; color: #222222; }}
+nav a {{ margin-right: 1em; }}
+section {{ border-top: 1px solid #CCCCCC; margin-top: 2em; }}
+.charts svg, .networks img {{ max-width: 480px; height: auto; margin: 0.5em; vertical-align: top; }}
+.networks img {{ border: 1px solid #EEEEEE; }}
+.figures img {{ max-width: 100%; height: auto; margin: 0.5em 0; display: block; }}
+table {{ border-collapse: collapse; font-size: 0.85em; margin: 0.5em 0 1em 0; }}
+th, td {{ border: 1px solid #DDDDDD; padding: 0.2em 0.6em; text-align: left; }}
+th {{ background: #F2F2F2; }}
+</style>
+</head>
+<body>
+<h1>{title}</h1>
+<nav>{nav}</nav>
+{sections}
+</body>
+</html>
+'''
+
+IMAGE_TYPES = {'.svg': 'image/svg+xml', '.png': 'image/png'}
+
+
+def top_enriched_terms(enrich, n_terms=20):
+    """
+    The `n_terms` terms with the lowest FDR of an enrichment table (of
+    every direction, if the table has them), with the columns of the report
+    """
+    if enrich is None or enrich.empty:
+        return None
+    columns = [column for column in TERM_COLUMNS if column in enrich]
+    keys = ['direction'] if 'direction' in enrich else []
+    top = enrich.sort_values(keys + ['fdr'], kind='stable')
+    if keys:
+        top = top.groupby(keys, sort=False).head(n_terms)
+    else:
+        top = top.head(n_terms)
+    return top[columns]
+
+
+def _table(caption, table):
+    formatters = {'fdr': '{:.2e}'.format} if 'fdr' in table else None
+    return (f'<h3>{html.escape(caption)}</h3>\n'
+            + table.to_html(index=False, border=0, formatters=formatters, na_rep=''))
+
+
+def _image(path):
+    with open(path, 'rb') as fh_image:
+        content = base64.b64encode(fh_image.read()).decode('ascii')
+    mime = IMAGE_TYPES[os.path.splitext(path)[1].lower()]
+    return (f'<img src="data:{mime};base64,{content}" '
+            f'alt="{html.escape(os.path.basename(path))}" title="{html.escape(os.path.basename(path))}">')
+
+
+class RunReport:
+    """
+    HTML report of a run, filled sample by sample (thread safe) and saved
+    with save()
+    """
+
+    def __init__(self, title):
+        self.title = title
+        self.samples = {}
+        self.sections = []
+        self.lock = threading.Lock()
+
+    def add_sample(self, name, charts=(), images=(), tables=()):
+        """
+        Adds the section of a sample: charts as SVG strings, the paths of
+        its images (svg or png) and tables as (caption, DataFrame); missing
+        images and empty tables are left out
+        """
+        parts = []
+        images = [path for path in images if path and os.path.exists(path)]
+        if images:
+            parts.append('<div class="networks">\n' + '\n'.join(map(_image, images)) + '\n</div>')
+        if charts:
+            parts.append('<div class="charts">\n' + '\n'.join(charts) + '\n</div>')
+        parts += [_table(caption, table) for caption, table in tables
+                  if table is not None and not table.empty]
+        if not parts:
+            parts.append('<p>Nothing to show for this sample.</p>')
+        with self.lock:
+            self.samples[name] = '\n'.join(parts)
+
+    def add_section(self, title, tables=(), images=(), links=()):
+        """
+        Adds a section about the whole run, with tables as (caption,
+        DataFrame), the paths of images (svg or png, embedded as those of
+        the samples) and links to other files of the output folder
+        """
+        parts = []
+        images = [path for path in images if path and os.path.exists(path)]
+        if images:
+            parts.append('<div class="figures">\n' + '\n'.join(map(_image, images)) + '\n</div>')
+        parts += [_table(caption, table) for caption, table in tables
+                  if table is not None and not table.empty]
+        if links:
+            parts.append('<ul>\n' + '\n'.join(f'<li><a href="{html.escape(link)}">{html.escape(link)}</a></li>'
+                                                for link in links) + '\n</ul>')
+        with self.lock:
+            self.sections.append((title, '\n'.join(parts)))
+
+    def to_html(self, order=None):
+        """
+        The report as an HTML string, with the samples in the given order
+        """
+        with self.lock:
+            names = [name for name in (order or sorted(self.samples)) if name in self.samples]
+            sections = [(name, f'sample-{number}', self.samples[name]) for number, name in enumerate(names)]
+            sections += [(title, f'run-{number}', body) for number, (title, body) in enumerate(self.sections)]
+        nav = ' '.join(f'<a href="#{anchor}">{html.escape(str(title))}</a>' for title, anchor, _ in sections)
+        body = '\n'.join(f'<section id="{anchor}">\n<h2>{html.escape(str(title))}</h2>\n{content}\n</section>'
+                         for title, anchor, content in sections)
+        return PAGE_TEMPLATE.format(title=html.escape(self.title), nav=nav, sections=body)
+
+    def save(self, path, order=None):
+        """
+        Writes the report to path
+        """
+        with open(path, 'w', encoding='utf-8') as fh_report:
+            fh_report.write(self.to_html(order))
+        print(f'Saving the report of the run to {path}')
+        return path
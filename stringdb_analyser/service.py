@@ -0,0 +1,417 @@
+"""Local HTTP/JSON service running the analyses as jobs.
+
+A single long-running process keeps the libraries imported, the STRING
+client (connection pool, rate limit, adaptive concurrency), an in-memory
+cache of the STRING responses in front of the disk cache, and the local
+indexes (offline enrichment, network and ontology) loaded from one job to
+the next, so a job only costs the analysis itself. The jobs are queued
+and run by a pool of `--jobs` threads.
+
+Start it with:
+
+    python -m stringdb_analyser.service --port 8766 --output-dir results
+
+and submit jobs as JSON:
+
+    POST /jobs          {"genes": ["thrA", "thrB"], "species": "ecoli"}
+                        {"input": "multi_test.xlsx", "species": "ecoli",
+                         "output": "run_1", "options": {"heatmap": true}}
+    GET  /jobs          status of all the jobs
+    GET  /jobs/<id>     status of a job
+    GET  /status        jobs waiting and running, cache and request counters
+
+A job analyses either a gene list (`genes`, or a txt `input`) like
+string_api_net_enrich.py, or the samples of a workbook or folder
+(`input`) like string_api_MULTI.py; `kind` ("gene_list" or "workbook")
+overrides the choice. `species` is a name of SPECIES or a taxonomy id,
+`output` a folder (relative to --output-dir, default: the job id) and
+`options` any keyword argument of analyse_gene_list / analyse_workbook
+(e.g. topology, formats, min_score). Inputs, including the local
+indexes given as options (offline_dir, network_index, concepts,
+aliases), must be within --input-dir and outputs within --output-dir,
+other paths are rejected.
+The status of a job is queued, running, finished (with its output folder
+and files) or failed (with the error); only the last --max-jobs finished
+jobs are kept.
+"""
+
+import argparse
+import inspect
+import json
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stringdb_analyser.cache import MemoryCache, add_cache_arguments, cache_from_args
+from stringdb_analyser.species import SPECIES
+
+# arguments of the analyses set by the service, not by the jobs
+RESERVED_OPTIONS = ('input_file', 'filename', 'output', 'species', 'client',
+                    'string_api_url', 'refresh', 'profiler')
+# options of the analyses that are paths read by the service
+PATH_OPTIONS = ('offline_dir', 'network_index', 'concepts', 'aliases')
+
+
+class JobError(Exception):
+    """
+    Raised when a submitted job is not valid
+    """
+
+
+def _within(path, root, root_allowed=False):
+    # real path of `path` (relative to root), or None if it is not inside root
+    path = os.path.realpath(os.path.join(root, str(path)))
+    if path == root:
+        return path if root_allowed else None
+    return path if os.path.commonpath([path, root]) == root else None
+
+
+class Job:
+    """
+    An analysis submitted to the service and its status
+    """
+
+    def __init__(self, kind, input_file, output, species, options):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.input_file = input_file
+        self.output = output
+        self.species = species
+        self.options = options
+        self.status = 'queued'
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def files(self):
+        """
+        Files saved in the output folder, relative to it
+        """
+        files = []
+        for root, _, names in os.walk(self.output):
+            files += [os.path.relpath(os.path.join(root, name), self.output) for name in names]
+        return sorted(files)
+
+    def to_dict(self):
+        """
+        Status of the job, as returned by the API
+        """
+        status = {'id': self.id, 'kind': self.kind, 'status': self.status,
+                  'input': self.input_file, 'output': self.output, 'species': self.species,
+                  'options': self.options, 'submitted': _timestamp(self.submitted),
+                  'started': _timestamp(self.started), 'finished': _timestamp(self.finished)}
+        if self.started is not None:
+            status['seconds'] = round((self.finished or time.time()) - self.started, 3)
+        if self.status == 'finished':
+            status['files'] = self.files()
+        if self.error is not None:
+            status['error'] = self.error
+        return status
+
+
+def _timestamp(seconds):
+    if seconds is None:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(seconds))
+
+
+def _species(value):
+    # name of a species of the scripts or a taxonomy id
+    if isinstance(value, str) and value in SPECIES:
+        return SPECIES[value]
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise JobError(f'unknown species {value!r}, use one of {", ".join(sorted(SPECIES))} '
+                       'or a taxonomy id') from None
+
+
+class AnalysisService:
+    """
+    Runs the submitted jobs on a pool of `jobs` threads, all of them
+    sharing `client` (a StringClient). `defaults` are keyword arguments
+    given to every analysis unless the job sets them. The inputs are read
+    from within `input_dir`, the outputs saved within `output_dir`, and
+    only the last `max_jobs` finished jobs are kept
+    """
+
+    def __init__(self, client, jobs=2, output_dir='.', string_api_url=None, defaults=None,
+                 input_dir='.', max_jobs=1000):
+        from stringdb_analyser.analysis import analyse_gene_list, analyse_workbook
+
+        self.client = client
+        self.output_dir = os.path.realpath(output_dir)
+        self.input_dir = os.path.realpath(input_dir)
+        self.max_jobs = max_jobs
+        self.string_api_url = string_api_url
+        self.defaults = dict(defaults or {})
+        self.analyses = {'gene_list': analyse_gene_list, 'workbook': analyse_workbook}
+        self.executor = ThreadPoolExecutor(max_workers=max(1, jobs), thread_name_prefix='job')
+        self.jobs = {}
+        self.lock = threading.Lock()
+
+    def _options(self, kind, options):
+        # keyword arguments of the analysis: the defaults, then the ones of the job
+        parameters = inspect.signature(self.analyses[kind]).parameters
+        if not isinstance(options, dict):
+            raise JobError('options must be an object')
+        unknown = sorted(name for name in options
+                         if name not in parameters or name in RESERVED_OPTIONS)
+        if unknown:
+            raise JobError(f'unknown options for a {kind} job: {", ".join(unknown)}')
+        options = dict(options)
+        for name in PATH_OPTIONS:
+            if options.get(name) is not None:
+                path = _within(options[name], self.input_dir, root_allowed=True)
+                if path is None:
+                    raise JobError(f'{options[name]} ({name}) is not within the input folder of the service')
+                options[name] = path
+        merged = {name: value for name, value in self.defaults.items() if name in parameters}
+        if kind == 'workbook':
+            # no process pools forked from the threads of the service by default
+            merged.setdefault('plot_workers', 1)
+        merged.update(options)
+        return merged
+
+    def submit(self, request):
+        """
+        Queues a job from its JSON description (see the module description)
+        and returns it. Raises JobError if the description is not valid
+        """
+        if not isinstance(request, dict):
+            raise JobError('the job must be a JSON object')
+        genes = request.get('genes')
+        input_file = request.get('input')
+        if (genes is None) == (input_file is None):
+            raise JobError('give either "genes" or "input"')
+        if genes is not None and (not isinstance(genes, list) or not genes):
+            raise JobError('"genes" must be a non-empty list')
+        if input_file is not None:
+            path = _within(input_file, self.input_dir)
+            if path is None:
+                raise JobError(f'{input_file} is not within the input folder of the service')
+            if not os.path.exists(path):
+                raise JobError(f'{input_file} does not exist')
+            input_file = path
+        kind = request.get('kind')
+        if kind is None:
+            kind = 'gene_list' if genes is not None or input_file.endswith('.txt') else 'workbook'
+        if kind not in self.analyses:
+            raise JobError(f'unknown kind {kind!r}, use one of {", ".join(self.analyses)}')
+        if kind == 'workbook' and genes is not None:
+            raise JobError('a workbook job needs an "input" file or folder')
+        species = _species(request.get('species', 'ecoli'))
+        options = self._options(kind, request.get('options', {}))
+
+        job = Job(kind, input_file, None, species, options)
+        job.output = _within(request.get('output') or job.id, self.output_dir)
+        if job.output is None:
+            raise JobError(f'{request.get("output")} is not within the output folder of the service')
+        if genes is not None:
+            # the gene list is saved with the results, to be read as usual
+            os.makedirs(job.output, exist_ok=True)
+            job.input_file = os.path.join(job.output, 'genes.txt')
+            with open(job.input_file, 'w') as fh_genes:
+                fh_genes.write('\n'.join(str(gene) for gene in genes) + '\n')
+        with self.lock:
+            self.jobs[job.id] = job
+            self._prune()
+        print(f'Job {job.id} queued: {kind} {job.input_file} -> {job.output}')
+        self.executor.submit(self._run, job)
+        return job
+
+    def _prune(self):
+        # the oldest finished jobs are forgotten beyond max_jobs (their files stay)
+        done = [job for job in self.jobs.values() if job.status in ('finished', 'failed')]
+        for job in sorted(done, key=lambda job: job.finished or time.time())[:max(0, len(done) - self.max_jobs)]:
+            del self.jobs[job.id]
+
+    def _run(self, job):
+        job.status = 'running'
+        job.started = time.time()
+        print(f'Job {job.id} started')
+        kwargs = dict(job.options, client=self.client)
+        if self.string_api_url is not None:
+            kwargs['string_api_url'] = self.string_api_url
+        try:
+            self.analyses[job.kind](job.input_file, job.output, job.species, **kwargs)
+        except Exception as err:
+            job.error = f'{type(err).__name__}: {err}'
+            job.status = 'failed'
+            traceback.print_exc()
+        else:
+            job.status = 'finished'
+        job.finished = time.time()
+        print(f'Job {job.id} {job.status} in {job.finished - job.started:.1f} s')
+
+    def job(self, job_id):
+        """
+        Returns a job by its id, or None
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def status(self):
+        """
+        Number of jobs by status, cached responses and request counters
+        """
+        with self.lock:
+            jobs = list(self.jobs.values())
+        counts = {status: sum(job.status == status for job in jobs)
+                  for status in ('queued', 'running', 'finished', 'failed')}
+        cache = self.client.cache
+        with self.client.stats_lock:
+            requests = {endpoint: dict(stats) for endpoint, stats in self.client.stats.items()}
+        return {'jobs': counts,
+                'memory_cache': {'responses': len(cache.entries), 'bytes': cache.size}
+                if isinstance(cache, MemoryCache) else None,
+                'requests': requests}
+
+    def shutdown(self):
+        """
+        Waits for the running jobs and drops the queued ones
+        """
+        self.executor.shutdown(wait=True, cancel_futures=True)
+
+    def handler(self):
+        """
+        Request handler class of the HTTP server
+        """
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, content):
+                body = json.dumps(content, indent=2).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                path = self.path.split('?', 1)[0].rstrip('/')
+                if path == '/jobs':
+                    with service.lock:
+                        jobs = list(service.jobs.values())
+                    self._reply(200, [job.to_dict() for job in jobs])
+                elif path.startswith('/jobs/'):
+                    job = service.job(path[len('/jobs/'):])
+                    if job is None:
+                        self._reply(404, {'error': 'unknown job'})
+                    else:
+                        self._reply(200, job.to_dict())
+                elif path == '/status':
+                    self._reply(200, service.status())
+                else:
+                    self._reply(404, {'error': 'unknown path'})
+
+            def do_POST(self):
+                if self.path.rstrip('/') != '/jobs':
+                    self._reply(404, {'error': 'unknown path'})
+                    return
+                try:
+                    request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+                    job = service.submit(request)
+                except (ValueError, JobError) as err:
+                    self._reply(400, {'error': str(err)})
+                    return
+                self._reply(202, job.to_dict())
+
+        return Handler
+
+
+def warm_up(offline_dir=None, network_index=None, concepts=None, species=None, aliases=None):
+    """
+    Imports the plotting libraries and loads the local indexes before the
+    first job
+    """
+    import stringdb_analyser.plots  # noqa: F401
+
+    if offline_dir is not None and species is not None:
+        from stringdb_analyser.offline import load_offline_enrichment
+        load_offline_enrichment(offline_dir, species)
+    if network_index is not None:
+        from stringdb_analyser.network import load_network_index
+        load_network_index(network_index)
+    if concepts is not None:
+        from stringdb_analyser.ontology import load_ontology_index
+        load_ontology_index(concepts)
+    if aliases is not None:
+        from stringdb_analyser.aliases import load_alias_index
+        load_alias_index(aliases)
+
+
+def main():
+    """
+    Command line entry point to run the service
+    """
+    parser = argparse.ArgumentParser(
+        prog='stringdb_analyser.service',
+        description='Run the STRING analyses as jobs submitted to a local HTTP/JSON service')
+    parser.add_argument('--host', type=str, default='127.0.0.1',
+                        help='address the service listens on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8766, help='port of the service (default: 8766)')
+    parser.add_argument('--jobs', type=int, default=2,
+                        help='number of jobs run at the same time (default: 2)')
+    parser.add_argument('--output-dir', type=str, default='.',
+                        help='folder of the job outputs (default: current folder)')
+    parser.add_argument('--input-dir', type=str, default='.',
+                        help='folder the input files of the jobs must be in (default: current folder)')
+    parser.add_argument('--max-jobs', type=int, default=1000,
+                        help='number of finished jobs whose status is kept (default: 1000)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='number of STRING requests sent in parallel, shared by all the jobs (default: 4)')
+    parser.add_argument('--rate', type=float, default=1.0,
+                        help='maximum number of STRING requests per second, 0 for no limit (default: 1)')
+    parser.add_argument('--memory-cache', type=float, default=200,
+                        help='size of the in-memory cache of STRING responses in MB (default: 200)')
+    parser.add_argument('--species', type=str, default=None, choices=sorted(SPECIES),
+                        help='species whose --offline files are loaded at start')
+    parser.add_argument('--offline', type=str, default=None, metavar='FOLDER',
+                        help='default folder of STRING annotation files for offline enrichment')
+    parser.add_argument('--network-index', type=str, default=None, metavar='FOLDER',
+                        help='default local STRING network index')
+    parser.add_argument('--concepts', type=str, default=None, metavar='FOLDER',
+                        help='default ontology index for the radar charts')
+    parser.add_argument('--aliases', type=str, default=None, metavar='FILE',
+                        help='default alias index to resolve the gene names locally')
+    parser.add_argument('--api-url', type=str, default=None,
+                        help='base url of the STRING API (default: the one of every script)')
+    add_cache_arguments(parser)
+    args = parser.parse_args()
+
+    from stringdb_analyser.client import StringClient, TokenBucket
+
+    client = StringClient(limiter=TokenBucket(rate=args.rate),
+                          cache=MemoryCache(cache_from_args(args), max_size=int(args.memory_cache * 2**20)),
+                          max_concurrency=args.workers)
+    defaults = {'offline_dir': args.offline, 'network_index': args.network_index,
+                'concepts': args.concepts, 'aliases': args.aliases, 'workers': args.workers}
+    warm_up(args.offline, args.network_index, args.concepts,
+            SPECIES[args.species] if args.species else None, aliases=args.aliases)
+    service = AnalysisService(client, jobs=args.jobs, output_dir=args.output_dir,
+                              input_dir=args.input_dir, max_jobs=args.max_jobs,
+                              string_api_url=args.api_url,
+                              defaults={name: value for name, value in defaults.items() if value is not None})
+    server = ThreadingHTTPServer((args.host, args.port), service.handler())
+    server.daemon_threads = True
+    print(f'Analysis service listening on http://{args.host}:{server.server_port}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('\nStopping the service, waiting for the running jobs')
+    finally:
+        server.server_close()
+        service.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,13 @@
+"""Species accepted by the scripts, with their NCBI taxonomy identifiers."""
+
+# define the list of species included in the scripts
+SPECIES = {
+    'ecoli': 511145,
+    'human': 9606,
+    'celegans': 6239,
+    'mouse': 10090,
+    'fly': 7227,
+    'zebrafish': 7955,
+    'yeast': 4932,
+    'PA': 208964
+}
@@ -0,0 +1,150 @@
+"""Topology of the interaction networks of gene sets.
+
+The networks of many gene sets (e.g. the UP and DOWN lists of every
+sample) are put together as the blocks of a single sparse adjacency
+matrix, so the metrics of all of them are computed at once with sparse
+matrix products and bincounts instead of a graph per set:
+
+    per gene     degree, weighted degree (sum of the scores), local
+                 clustering coefficient, connected component and hub rank
+    per set      genes, connected genes, interactions, density, mean degree,
+                 components, largest component (and its fraction of the
+                 genes), mean clustering, transitivity and the top hubs
+
+The interactions are the tables of the tsv/network endpoint of STRING or
+of a local NetworkIndex (stringId_A, stringId_B, preferredName_A,
+preferredName_B, score).
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+# number of hubs listed in the summary of a gene set
+N_HUBS = 5
+
+
+def network_topology(gene_sets, edge_tables, labels=None):
+    """
+    Topology metrics of the networks of many gene sets at once.
+    gene_sets is {key: genes} and edge_tables {key: interactions}, with
+    keys such as (sample, direction); sets without interactions are
+    taken as networks without edges. labels ({gene: name}) are the names
+    shown for the genes. Returns two DataFrames: the metrics of every gene
+    and the summary of every set, both with the columns of the keys
+    (`sample` and `direction` for 2-tuples, `gene_set` otherwise) first
+    """
+    keys = list(gene_sets)
+    set_genes = [list(dict.fromkeys(gene_sets[key])) for key in keys]
+    sizes = np.array([len(genes) for genes in set_genes], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    n_nodes = int(offsets[-1])
+    node_set = np.repeat(np.arange(len(keys)), sizes)
+    all_genes = np.array([gene for genes in set_genes for gene in genes], dtype=object)
+    node_index = pd.MultiIndex.from_arrays([node_set, all_genes])
+
+    # all the interactions, numbered as the nodes of a block diagonal matrix
+    # (the ends are matched by STRING identifier, or else by preferred name)
+    numbers = [number for number, key in enumerate(keys)
+               if edge_tables.get(key) is not None and len(edge_tables[key])]
+    tables = [edge_tables[keys[number]] for number in numbers]
+    edges = pd.concat(tables, ignore_index=True) if tables else pd.DataFrame(columns=['stringId_A', 'stringId_B'])
+    edge_set = np.repeat(np.array(numbers, dtype=np.int64), [len(table) for table in tables])
+    names = np.full(n_nodes, None, dtype=object)
+    ends = []
+    for side in ('A', 'B'):
+        found = node_index.get_indexer(pd.MultiIndex.from_arrays([edge_set, edges[f'stringId_{side}'].astype(str)]))
+        if f'preferredName_{side}' in edges:
+            preferred = edges[f'preferredName_{side}'].astype(str)
+            missing = np.flatnonzero(found < 0)
+            if len(missing):
+                found[missing] = node_index.get_indexer(
+                    pd.MultiIndex.from_arrays([edge_set[missing], preferred.to_numpy()[missing]]))
+            names[found[found >= 0]] = preferred.to_numpy()[found >= 0]
+        ends.append(found)
+    node_a, node_b = ends
+    keep = (node_a >= 0) & (node_b >= 0) & (node_a != node_b)
+    rows = np.minimum(node_a, node_b)[keep]
+    cols = np.maximum(node_a, node_b)[keep]
+    weights = (edges['score'].to_numpy(dtype=float) if 'score' in edges else np.ones(len(edges)))[keep]
+    # an interaction listed twice (A-B and B-A, or by two chunks) counts once
+    _, first = np.unique(rows * max(n_nodes, 1) + cols, return_index=True)
+    rows, cols, weights = rows[first], cols[first], weights[first]
+
+    upper = sparse.csr_matrix((np.ones(len(rows)), (rows, cols)), shape=(n_nodes, n_nodes))
+    adjacency = (upper + upper.T).tocsr()
+    scores = sparse.csr_matrix((weights, (rows, cols)), shape=(n_nodes, n_nodes))
+    degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    weighted_degree = np.asarray((scores + scores.T).sum(axis=1)).ravel()
+    # triangles through every node: (A @ A)[i, j] for the neighbours j of i
+    triangles = np.asarray((adjacency @ adjacency).multiply(adjacency).sum(axis=1)).ravel() / 2
+    pairs_around = degree * (degree - 1) / 2
+    clustering = np.divide(triangles, pairs_around, out=np.zeros(n_nodes), where=pairs_around > 0)
+
+    # components of more than one gene, numbered by size within every set
+    _, component = connected_components(adjacency, directed=False)
+    component_size = np.bincount(component, minlength=component.max() + 1 if n_nodes else 0)
+    node_component_size = component_size[component] if n_nodes else np.zeros(0, dtype=np.int64)
+    real = np.flatnonzero(component_size > 1)
+    real_set = np.zeros(len(component_size), dtype=np.int64)
+    real_set[component] = node_set
+    order = real[np.lexsort((real, -component_size[real], real_set[real]))]
+    component_number = np.zeros(len(component_size), dtype=np.int64)
+    if len(order):
+        set_start = np.searchsorted(real_set[order], real_set[order], side='left')
+        component_number[order] = np.arange(len(order)) - set_start + 1
+    node_component = np.where(node_component_size > 1, component_number[component], 0)
+
+    # hubs: most interactions first, then the highest scores
+    ranking = np.lexsort((-weighted_degree, -degree, node_set))
+    hub_rank = np.empty(n_nodes, dtype=np.int64)
+    hub_rank[ranking] = np.arange(n_nodes) - offsets[node_set[ranking]] + 1
+
+    gene_names = pd.Series(all_genes).map(labels or {}).fillna(pd.Series(names)).fillna(pd.Series(all_genes))
+    gene_names = gene_names.tolist()
+    key_columns = _key_columns(keys)
+    key_table = pd.DataFrame([key if isinstance(key, tuple) else (key,) for key in keys], columns=key_columns)
+    nodes = pd.concat([key_table.iloc[node_set].reset_index(drop=True), pd.DataFrame({
+        'gene': all_genes,
+        'name': gene_names,
+        'degree': degree.astype(np.int32),
+        'weighted_degree': weighted_degree.round(3),
+        'clustering': clustering.round(4),
+        'component': node_component.astype(np.int32),
+        'hub_rank': hub_rank.astype(np.int32),
+    })], axis=1)
+
+    n_sets = len(keys)
+    n_edges = np.bincount(node_set, weights=degree, minlength=n_sets) / 2
+    connected = np.bincount(node_set, weights=degree > 0, minlength=n_sets)
+    n_components = np.bincount(real_set[real], minlength=n_sets)
+    largest = np.zeros(n_sets)
+    np.maximum.at(largest, node_set, np.where(node_component_size > 1, node_component_size, 0))
+    possible = sizes * (sizes - 1) / 2
+    triads = np.bincount(node_set, weights=pairs_around, minlength=n_sets)
+    closed = np.bincount(node_set, weights=triangles, minlength=n_sets)
+    hubs = [[] for _ in keys]
+    for node in ranking[(hub_rank[ranking] <= N_HUBS) & (degree[ranking] > 0)]:
+        hubs[node_set[node]].append(gene_names[node])
+    summary = pd.concat([key_table, pd.DataFrame({
+        'genes': sizes,
+        'connected_genes': connected.astype(np.int64),
+        'interactions': n_edges.astype(np.int64),
+        'density': np.divide(n_edges, possible, out=np.zeros(n_sets), where=possible > 0).round(5),
+        'mean_degree': np.divide(2 * n_edges, sizes, out=np.zeros(n_sets), where=sizes > 0).round(3),
+        'components': n_components,
+        'largest_component': largest.astype(np.int64),
+        'largest_fraction': np.divide(largest, sizes, out=np.zeros(n_sets), where=sizes > 0).round(4),
+        'mean_clustering': np.divide(np.bincount(node_set, weights=clustering, minlength=n_sets), sizes,
+                                     out=np.zeros(n_sets), where=sizes > 0).round(4),
+        'transitivity': np.divide(closed, triads, out=np.zeros(n_sets), where=triads > 0).round(4),
+        'hubs': [','.join(map(str, names_)) for names_ in hubs],
+    })], axis=1)
+    return nodes, summary
+
+
+def _key_columns(keys):
+    if keys and all(isinstance(key, tuple) and len(key) == 2 for key in keys):
+        return ['sample', 'direction']
+    return ['gene_set']
@@ -0,0 +1,90 @@
+"""Word frequencies of the enriched term descriptions, for the radar plots."""
+
+import pandas as pd
+
+# words that do not say anything about the terms
+STOP_WORDS = frozenset(['process', 'substance', 'to', 'a', 'metabolic', 'via',
+                        'and', 'of', 'incl.', 'by', 'in', 'with', 'the', 'from', 'i',
+                        'on', 'for'])
+
+
+def word_table(df, nwords=10, keys=None):
+    """
+    Counts the words of the term descriptions of an enrichment table for
+    every category (and direction, if the table has a direction column) in
+    a single pass, and keeps the `nwords` most common words of each.
+    Returns a long table with the key columns, word, count and relative
+    (frequency of the word among the kept words of its group).
+    """
+    if keys is None:
+        keys = [column for column in ('direction', 'category') if column in df]
+    keys = list(keys)
+    columns = keys + ['word', 'count', 'relative']
+    if df.empty or 'description' not in df:
+        return pd.DataFrame(columns=columns)
+
+    # tokenize every description once
+    tokens = df[keys].assign(word=df['description'].str.split()).explode('word')
+    tokens = tokens.dropna(subset=['word'])
+    tokens['word'] = tokens['word'].str.replace(',', '', regex=False).str.lower()
+
+    # groups are kept in order of first appearance, like a Counter
+    counts = tokens.groupby(keys + ['word'], sort=False).size().rename('count').reset_index()
+    counts = counts[~counts['word'].isin(STOP_WORDS)]
+
+    # keep the most common words of every group, sorted as a single-category table
+    tops = []
+    for _, group in counts.groupby(keys, sort=False):
+        group = group.sort_values('count', ascending=False).head(nwords)
+        tops.append(group.assign(relative=group['count'] / group['count'].sum()))
+    if not tops:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(tops, ignore_index=True)[columns]
+
+
+def select_words(table, category, direction=None):
+    """
+    Slices the words of a category (and direction) from a word_table,
+    as a table indexed by word with the count and relative columns
+    """
+    mask = table['category'] == category
+    if direction is not None:
+        mask &= table['direction'] == direction
+    words = table.loc[mask, ['word', 'count', 'relative']].set_index('word')
+    words.index.name = None
+    return words
+
+
+def count_words(df, category='Process', nwords=10):
+    """
+    This function inputs the enrichment dataframe from get_enrichment_data
+    and outputs a list of names with their relative frequencies
+    It can be parsed per category type
+    The function controls for useless words (e.g. to, and, of...) and for
+    other punctuation symbols
+    """
+    table = word_table(df[df['category'] == category], nwords=nwords, keys=['category'])
+    return select_words(table, category)
+
+
+def get_multi_table(words, cat):
+    """
+    Inputs the word table of the UP and DOWN enrichments of a sample
+    (from word_table) and outputs a table with the relative count of
+    the most common words within a specified category.
+    """
+    # get up and down words
+    up_words = select_words(words, cat, direction='UP')
+    down_words = select_words(words, cat, direction='DOWN')
+
+    up_words = up_words.drop('count', axis=1)
+    up_words.columns = ['up']
+    down_words = down_words.drop('count', axis=1)
+    down_words.columns = ['down']
+
+    # join both dataframes, fill NA with 0s
+    total_words = up_words.join(down_words, how='outer', sort=True).fillna(0)
+
+    # sorting values will make the plot look better
+    total_words = total_words.sort_values(['up', 'down'])
+    return total_words